@@ -0,0 +1,592 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: Archive.py
+# Description: long-term columnar archive of the telemetry (decoded fields of
+# the frames received, delta + zigzag varint encoded, in chunks with a time
+# index), conversion from the recordings (Recorder.py), streaming export to
+# CSV / Parquet and time-range queries returning NumPy columns
+# Usage: python Archive.py convert RECORDINGS ARCHIVE
+#        python Archive.py csv|parquet ARCHIVE OUTPUT
+#        python Archive.py info ARCHIVE
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import argparse
+import csv
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+import CommunMessages
+import Recorder
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+"""
+/* Archive file layout (little-endian):
+ *		Header (HEADER_SIZE bytes): magic, version, number of columns
+ *		Chunks, one after the other. Each one holds up to CHUNK_ROWS rows:
+ *			Chunk header: marker, rows, size of the columns (bytes),
+ *			lowest and highest timestamp (ns)
+ *			Then, for each column (in COLUMNS order): encoding, size, data
+ *		Index: one entry per chunk: offset, rows, lowest and highest
+ *		timestamp
+ *		Sessions: name of each recording session (uint16 size + UTF-8)
+ *		Trailer: offset of the index, number of chunks, offset of the
+ *		sessions, number of sessions, INDEX_MAGIC
+ *
+ * Columns: time_ns (time.monotonic_ns of reception), session, car_id, one
+ * column per incoming field (incoming_pos_dic order, as decoded) and err
+ * (bit n set if field n was wrong, see CommunMessages.decode_in_messages).
+ * time_ns restarts with every server run (monotonic clock): only the rows of
+ * the same session (index in Sessions, see Recorder.session_of, whose name
+ * holds the wall-clock start time) can be compared by time.
+ * Every column is delta encoded (first value against 0), zigzag mapped
+ * (0, -1, 1, -2... to 0, 1, 2, 3...) and written as varints (7 bits per
+ * byte, high bit set on every byte but the last). COLUMN_ZLIB columns are
+ * compressed with zlib on top, when it makes them smaller.
+ * A file whose writer did not close it has no index and no session names:
+ * chunks are then found by walking the chunk headers.
+ */
+"""
+ARCHIVE_MAGIC = b'RCARARC1'
+ARCHIVE_VERSION = 2
+INDEX_MAGIC = b'RCARIDX1'
+CHUNK_MARKER = b'CK'
+ARCHIVE_EXTENSION = ".rca"
+CHUNK_ROWS = 1 << 16
+ZLIB_LEVEL = 1
+
+COLUMN_VARINT = 0
+COLUMN_ZLIB = 1
+
+FIELD_NAMES = [CommunMessages.incoming_name_dic[key] for key in
+    sorted(CommunMessages.incoming_pos_dic,
+        key=CommunMessages.incoming_pos_dic.get)]
+COLUMNS = ["time_ns", "session", "car_id"] + FIELD_NAMES + \
+    [CommunMessages.MESSAGE_IN_ERR_COLUMN]
+_COLUMN_DTYPES = {"time_ns": np.int64, "session": np.uint16,
+    "car_id": np.uint8,
+    CommunMessages.MESSAGE_IN_ERR_COLUMN: np.uint16}    # The rest: int32
+
+_HEADER_STRUCT = struct.Struct('<8sHH')
+HEADER_SIZE = 16
+_CHUNK_STRUCT = struct.Struct('<2sIIqq')
+_COLUMN_STRUCT = struct.Struct('<BI')
+_INDEX_STRUCT = struct.Struct('<QIqq')
+_SESSION_NAME_STRUCT = struct.Struct('<H')
+_TRAILER_STRUCT = struct.Struct('<QIQI8s')
+
+# Binary incoming frames as a NumPy record (sign of each field as on the wire)
+_BIN_IN_DTYPE = np.dtype([("sync", "S2"), ("sequence", "<u2")] + [
+    (CommunMessages.incoming_name_dic[key],
+        "<u2" if key in CommunMessages.incoming_unsigned_set else "<i2")
+    for key in sorted(CommunMessages.incoming_pos_dic,
+        key=CommunMessages.incoming_pos_dic.get)])
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Archive_writer():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Archive_writer class appends rows to an archive file. Rows are gathered in
+    preallocated column arrays and written as one chunk every chunk_rows
+    rows, so memory use does not depend on the length of the archive. The
+    index and the session names are written by close()
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - path: str. File name
+    - sessions: list of str. Name of each session (see add_session)
+    - rows_written: int. Rows appended
+    - chunks_written: int. Chunks written to the file
+    """
+    def __init__(self, path:str, chunk_rows:int=CHUNK_ROWS):
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(_HEADER_STRUCT.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION,
+            len(COLUMNS)).ljust(HEADER_SIZE, b'\0'))
+        self._chunk_rows = chunk_rows
+        self._columns = {name: np.zeros(chunk_rows,
+            dtype=_COLUMN_DTYPES.get(name, np.int32)) for name in COLUMNS}
+        self._nb_rows = 0       # Rows in the current chunk
+        self._index = []
+        self.sessions = []
+        self.rows_written = 0
+        self.chunks_written = 0
+
+    def add_session(self, name:str) -> int:
+        """ Returns the value of the session column for the rows of 
+        recording session name (added if new) """
+        if name not in self.sessions:
+            self.sessions.append(name)
+        return self.sessions.index(name)
+
+    def append_columns(self, columns:dict):
+        """
+        Appends rows given as columns
+
+        :param columns: {name: array} for every name of COLUMNS, same length
+        """
+        nb_rows = len(columns["time_ns"])
+        done = 0
+        while done < nb_rows:
+            size = min(nb_rows - done, self._chunk_rows - self._nb_rows)
+            for name in COLUMNS:
+                self._columns[name][self._nb_rows:self._nb_rows+size] = \
+                    columns[name][done:done+size]
+            self._nb_rows += size
+            done += size
+            if self._nb_rows == self._chunk_rows:
+                self._write_chunk()
+        self.rows_written += nb_rows
+
+    def _write_chunk(self):
+        """ Encodes and writes the rows gathered as a chunk """
+        nb_rows = self._nb_rows
+        if nb_rows == 0:
+            return
+        parts = []
+        for name in COLUMNS:
+            data = _varint_encode(_zigzag(_delta(
+                self._columns[name][:nb_rows])))
+            encoding = COLUMN_VARINT
+            if ZLIB_LEVEL:
+                compressed = zlib.compress(data, ZLIB_LEVEL)
+                if len(compressed) < len(data):
+                    data = compressed
+                    encoding = COLUMN_ZLIB
+            parts.append(_COLUMN_STRUCT.pack(encoding, len(data)))
+            parts.append(data)
+        payload = b''.join(parts)
+        times = self._columns["time_ns"][:nb_rows]
+        time_min, time_max = int(times.min()), int(times.max())
+        offset = self._file.tell()
+        self._file.write(_CHUNK_STRUCT.pack(CHUNK_MARKER, nb_rows,
+            len(payload), time_min, time_max))
+        self._file.write(payload)
+        self._index.append((offset, nb_rows, time_min, time_max))
+        self._nb_rows = 0
+        self.chunks_written += 1
+
+    def close(self):
+        """ Writes the pending rows, the index, the session names and the 
+        trailer """
+        if self._file is None:
+            return
+        self._write_chunk()
+        index_offset = self._file.tell()
+        for entry in self._index:
+            self._file.write(_INDEX_STRUCT.pack(*entry))
+        sessions_offset = self._file.tell()
+        for name in self.sessions:
+            encoded = name.encode()
+            self._file.write(_SESSION_NAME_STRUCT.pack(len(encoded)))
+            self._file.write(encoded)
+        self._file.write(_TRAILER_STRUCT.pack(index_offset, len(self._index),
+            sessions_offset, len(self.sessions), INDEX_MAGIC))
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class Archive_reader():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Archive_reader class reads an archive through a read-only mapping. Only
+    the chunks overlapping the time range asked for, and only the columns
+    asked for, are decoded
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - path: str. File name
+    - chunks: list of tuple. (offset, rows, lowest time, highest time) of
+    each chunk, in file order
+    - sessions: list of str. Name of each session (value of the session
+    column), empty if the writer was not closed
+    """
+    def __init__(self, path:str):
+        """
+        :exception ValueError if the file is not an archive
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, nb_columns = _HEADER_STRUCT.unpack_from(self._mmap, 0)
+        if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION or \
+                nb_columns != len(COLUMNS):
+            self._mmap.close()
+            raise ValueError("Not an archive: " + path)
+        self.sessions = []
+        self.chunks = self._read_index()
+
+    def _read_index(self) -> list:
+        """ Returns the index (and reads the session names), rebuilt from 
+        the chunk headers if the file has none (writer not closed) """
+        size = len(self._mmap)
+        if size >= HEADER_SIZE + _TRAILER_STRUCT.size:
+            index_offset, nb_chunks, sessions_offset, nb_sessions, magic = \
+                _TRAILER_STRUCT.unpack_from(self._mmap,
+                    size - _TRAILER_STRUCT.size)
+            if magic == INDEX_MAGIC:
+                position = sessions_offset
+                for _ in range(nb_sessions):
+                    length, = _SESSION_NAME_STRUCT.unpack_from(self._mmap,
+                        position)
+                    position += _SESSION_NAME_STRUCT.size
+                    self.sessions.append(
+                        self._mmap[position:position+length].decode())
+                    position += length
+                return [_INDEX_STRUCT.unpack_from(self._mmap,
+                    index_offset + chunk*_INDEX_STRUCT.size)
+                    for chunk in range(nb_chunks)]
+        chunks = []
+        offset = HEADER_SIZE
+        while offset + _CHUNK_STRUCT.size <= size:
+            marker, nb_rows, payload_size, time_min, time_max = \
+                _CHUNK_STRUCT.unpack_from(self._mmap, offset)
+            end = offset + _CHUNK_STRUCT.size + payload_size
+            if marker != CHUNK_MARKER or end > size:
+                break   # Chunk not completely written
+            chunks.append((offset, nb_rows, time_min, time_max))
+            offset = end
+        return chunks
+
+    def __len__(self) -> int:
+        return sum(chunk[1] for chunk in self.chunks)
+
+    def _read_chunk(self, offset:int, columns:list) -> dict:
+        """ Decodes the given columns of the chunk at offset """
+        _, nb_rows, _, _, _ = _CHUNK_STRUCT.unpack_from(self._mmap, offset)
+        position = offset + _CHUNK_STRUCT.size
+        decoded = {}
+        for name in COLUMNS:
+            encoding, size = _COLUMN_STRUCT.unpack_from(self._mmap, position)
+            position += _COLUMN_STRUCT.size
+            if name in columns:
+                data = self._mmap[position:position+size]
+                if encoding == COLUMN_ZLIB:
+                    data = zlib.decompress(data)
+                values = np.cumsum(_unzigzag(_varint_decode(data, nb_rows)))
+                decoded[name] = values.astype(
+                    _COLUMN_DTYPES.get(name, np.int32))
+            position += size
+        return decoded
+
+    def iter_chunks(self, time_from_ns:int=None, time_to_ns:int=None,
+                        columns:list=None, car_id:int=None,
+                        session:int=None):
+        """
+        Yields the rows in [time_from_ns, time_to_ns] chunk by chunk, as
+        {name: np.ndarray}. Chunks outside the range are not decoded
+
+        :param columns: names (COLUMNS) to return, all of them if None
+        :param car_id: only the rows of this car if given
+        :param session: only the rows of this session if given (index in 
+        sessions). A time range only makes sense within one session
+        """
+        columns = list(COLUMNS) if columns is None else list(columns)
+        needed = set(columns) | {"time_ns"}
+        if car_id is not None:
+            needed.add("car_id")
+        if session is not None:
+            needed.add("session")
+        for offset, _, time_min, time_max in self.chunks:
+            if (time_from_ns is not None and time_max < time_from_ns) or \
+                    (time_to_ns is not None and time_min > time_to_ns):
+                continue
+            decoded = self._read_chunk(offset, needed)
+            keep = None
+            times = decoded["time_ns"]
+            if time_from_ns is not None:
+                keep = times >= time_from_ns
+            if time_to_ns is not None:
+                keep = times <= time_to_ns if keep is None else \
+                    keep & (times <= time_to_ns)
+            if car_id is not None:
+                keep = decoded["car_id"] == car_id if keep is None else \
+                    keep & (decoded["car_id"] == car_id)
+            if session is not None:
+                keep = decoded["session"] == session if keep is None else \
+                    keep & (decoded["session"] == session)
+            if keep is None:
+                yield {name: decoded[name] for name in columns}
+            else:
+                yield {name: decoded[name][keep] for name in columns}
+
+    def query(self, time_from_ns:int=None, time_to_ns:int=None,
+                columns:list=None, car_id:int=None,
+                session:int=None) -> dict:
+        """
+        Returns the rows in [time_from_ns, time_to_ns] (see iter_chunks) as
+        one array per column
+
+        :rtype: (dict of np.ndarray)
+        """
+        columns = list(COLUMNS) if columns is None else list(columns)
+        parts = list(self.iter_chunks(time_from_ns, time_to_ns, columns,
+            car_id, session))
+        return {name: np.concatenate([part[name] for part in parts])
+            if parts else np.zeros(0, dtype=_COLUMN_DTYPES.get(name,
+                np.int32)) for name in columns}
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class Recording_rows(Recorder.Recording):
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Recording_rows class is a Recorder.Recording iterating only over the
+    frames received, as (timestamp_ns, car_id, payload)
+    """
+    def __iter__(self):
+        for timestamp_ns, direction, car_id, payload in self.iter_from(0):
+            if direction == Recorder.RECORD_DIR_IN:
+                yield timestamp_ns, car_id, payload
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _delta(values:np.ndarray) -> np.ndarray:
+    """ Returns the differences between consecutive values (int64), the first
+    one against 0 """
+    values = values.astype(np.int64)
+    deltas = np.empty_like(values)
+    deltas[:1] = values[:1]
+    np.subtract(values[1:], values[:-1], out=deltas[1:])
+    return deltas
+
+def _zigzag(values:np.ndarray) -> np.ndarray:
+    """ Maps int64 to uint64: 0, -1, 1, -2... to 0, 1, 2, 3... """
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+def _unzigzag(values:np.ndarray) -> np.ndarray:
+    """ Inverse of _zigzag """
+    return (values >> np.uint64(1)).view(np.int64) ^ \
+        -(values & np.uint64(1)).view(np.int64)
+
+def _varint_encode(values:np.ndarray) -> bytes:
+    """ Returns the uint64 values as varints (vectorised) """
+    if values.size == 0:
+        return b''
+    sizes = np.ones(values.size, dtype=np.int64)
+    for shift in range(7, 64, 7):
+        sizes += (values >> np.uint64(shift)) != 0
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+    encoded = np.empty(int(ends[-1]), dtype=np.uint8)
+    for byte in range(int(sizes.max())):
+        has_byte = sizes > byte
+        part = ((values[has_byte] >> np.uint64(7*byte)) &
+            np.uint64(0x7F)).astype(np.uint8)
+        part[sizes[has_byte] > byte + 1] |= 0x80
+        encoded[starts[has_byte] + byte] = part
+    return encoded.tobytes()
+
+def _varint_decode(data:bytes, nb_values:int) -> np.ndarray:
+    """ Returns the nb_values uint64 values encoded by _varint_encode """
+    encoded = np.frombuffer(data, dtype=np.uint8)
+    if nb_values == 0:
+        return np.zeros(0, dtype=np.uint64)
+    last = (encoded & 0x80) == 0
+    ends = np.flatnonzero(last)
+    if ends.size != nb_values:
+        raise ValueError("Corrupt column: {} values instead of {}".format(
+            ends.size, nb_values))
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # Position of each byte in its varint
+    value_of_byte = np.cumsum(last) - last
+    shifts = 7*(np.arange(encoded.size) - starts[value_of_byte])
+    parts = (encoded & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    return np.bitwise_or.reduceat(parts, starts)
+
+def decode_frames(payloads:list) -> dict:
+    """
+    Decodes incoming frames (any wire format) at once
+
+    :param payloads: frames as recorded
+    :return: {field name: np.ndarray (int32), err: np.ndarray (uint16)}, one
+    row per frame (wrong fields are 0 with their bit set in err)
+    :rtype: (dict)
+    """
+    nb_frames = len(payloads)
+    columns = {name: np.zeros(nb_frames, dtype=np.int32)
+        for name in FIELD_NAMES}
+    errors = np.zeros(nb_frames, dtype=np.uint16)
+    is_binary = np.array([payload[:len(CommunMessages.BIN_SYNC_MARKER)] ==
+        CommunMessages.BIN_SYNC_MARKER for payload in payloads], dtype=bool)
+    for binary, selected in ((False, np.flatnonzero(~is_binary)),
+            (True, np.flatnonzero(is_binary))):
+        if selected.size == 0:
+            continue
+        if binary:
+            frames = np.frombuffer(b''.join(bytes(payloads[index])
+                for index in selected), dtype=_BIN_IN_DTYPE)
+            values = np.stack([frames[name].astype(np.int32)
+                for name in FIELD_NAMES], axis=1)
+            errors[selected] = CommunMessages.validate_in_values(values)
+            for pos, name in enumerate(FIELD_NAMES):
+                columns[name][selected] = values[:, pos]
+        else:
+            decoded = CommunMessages.decode_in_messages(b''.join(
+                bytes(payloads[index]).ljust(CommunMessages.MESSAGE_IN_SIZE,
+                b'x')[:CommunMessages.MESSAGE_IN_SIZE] for index in selected))
+            errors[selected] = decoded[CommunMessages.MESSAGE_IN_ERR_COLUMN]
+            for name in FIELD_NAMES:
+                columns[name][selected] = decoded[name]
+    columns[CommunMessages.MESSAGE_IN_ERR_COLUMN] = errors
+    return columns
+
+def archive_recordings(paths:list, archive_path:str,
+                        chunk_rows:int=CHUNK_ROWS) -> int:
+    """
+    Writes the frames received in the recordings (Recorder.py) to a new
+    archive, reading and decoding chunk_rows frames at a time
+
+    :param paths: recording files, in chronological order. Each recording 
+    session (see Recorder.session_of) gets its own value of the session 
+    column
+    :return: number of rows written
+    :rtype: (int)
+    """
+    with Archive_writer(archive_path, chunk_rows) as writer:
+        rows = []
+        for path in paths:
+            session = writer.add_session(os.path.basename(
+                Recorder.session_of(path)))
+            recording = Recording_rows(path)
+            for timestamp_ns, car_id, payload in recording:
+                rows.append((timestamp_ns, session, car_id, payload))
+                if len(rows) == chunk_rows:
+                    writer.append_columns(_rows_to_columns(rows))
+                    rows.clear()
+            recording.close()
+        if rows:
+            writer.append_columns(_rows_to_columns(rows))
+        return writer.rows_written
+
+def _rows_to_columns(rows:list) -> dict:
+    """ Returns the columns of the archive for (timestamp_ns, session,
+    car_id, payload) rows """
+    columns = decode_frames([row[3] for row in rows])
+    columns["time_ns"] = np.array([row[0] for row in rows], dtype=np.int64)
+    columns["session"] = np.array([row[1] for row in rows], dtype=np.uint16)
+    columns["car_id"] = np.array([row[2] for row in rows], dtype=np.uint8)
+    return columns
+
+def export_csv(archive_path:str, csv_path:str, **query) -> int:
+    """
+    Writes the archive (or the rows selected by query, see
+    Archive_reader.iter_chunks) to a CSV file, one chunk at a time
+
+    :return: number of rows written
+    :rtype: (int)
+    """
+    nb_rows = 0
+    with Archive_reader(archive_path) as reader, \
+            open(csv_path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        for part in reader.iter_chunks(**query):
+            writer.writerows(zip(*(part[name].tolist() for name in COLUMNS)))
+            nb_rows += len(part["time_ns"])
+    return nb_rows
+
+def export_parquet(archive_path:str, parquet_path:str, **query) -> int:
+    """
+    Same as export_csv, to a Parquet file (one row group per chunk)
+
+    :exception ImportError if pyarrow is not installed
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow (pip install pyarrow)")
+    nb_rows = 0
+    writer = None
+    with Archive_reader(archive_path) as reader:
+        for part in reader.iter_chunks(**query):
+            table = pyarrow.table({name: part[name] for name in COLUMNS})
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(parquet_path,
+                    table.schema)
+            writer.write_table(table)
+            nb_rows += table.num_rows
+    if writer is not None:
+        writer.close()
+    return nb_rows
+
+#==============================================================================
+# Main flow
+#==============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Robocar telemetry archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert",
+        help="archive the frames received in recordings")
+    convert.add_argument("recordings",
+        help="recording file, directory or name prefix (see Recorder.py)")
+    convert.add_argument("archive")
+    for name in ("csv", "parquet"):
+        export = commands.add_parser(name, help="export to " + name)
+        export.add_argument("archive")
+        export.add_argument("output")
+        export.add_argument("--from-ns", type=int, default=None)
+        export.add_argument("--to-ns", type=int, default=None)
+        export.add_argument("--car", type=int, default=None)
+        export.add_argument("--session", type=int, default=None,
+            help="index of the recording session (see info)")
+    info = commands.add_parser("info", help="describe an archive")
+    info.add_argument("archive")
+    args = parser.parse_args()
+    if args.command == "convert":
+        paths = Recorder.list_recordings(args.recordings)
+        nb_rows = archive_recordings(paths, args.archive)
+        print("{} rows from {} file(s) archived to {} ({} bytes)".format(
+            nb_rows, len(paths), args.archive, os.path.getsize(args.archive)))
+    elif args.command in ("csv", "parquet"):
+        export = export_csv if args.command == "csv" else export_parquet
+        nb_rows = export(args.archive, args.output, time_from_ns=args.from_ns,
+            time_to_ns=args.to_ns, car_id=args.car, session=args.session)
+        print("{} rows written to {}".format(nb_rows, args.output))
+    else:
+        with Archive_reader(args.archive) as reader:
+            print("{}: {} rows in {} chunks, {} bytes".format(args.archive,
+                len(reader), len(reader.chunks),
+                os.path.getsize(args.archive)))
+            for index, name in enumerate(reader.sessions):
+                print("session {}: {}".format(index, name))
@@ -0,0 +1,148 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: AsyncLog.py
+# Description: logging kept out of the socket loop: records are queued as they
+# are and formatted / written by a background thread, and the per-frame
+# records are sampled (1 out of N, at most X per second)
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+LOG_FORMAT_COMPACT = "%(relativeCreated)d %(levelname).1s %(message)s"
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Deferred_queue_handler(logging.handlers.QueueHandler):
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Deferred_queue_handler class queues the records without formatting them
+    (the standard QueueHandler merges the message and its arguments in the
+    calling thread). Arguments must not change after the call (bytes, int,
+    Frame_str...), as they are formatted later by the writer thread
+    """
+    def prepare(self, record:logging.LogRecord) -> logging.LogRecord:
+        return record
+
+class Log_sampler():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Log_sampler class decides which of the records of a frequent event are
+    logged: one out of every_n, and no more than max_per_sec per second. The
+    records skipped are counted and reported with the next one logged
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - every_n: int. 1 logs every event (if allowed by max_per_sec)
+    - max_per_sec: float. 0 for no limit
+    """
+    def __init__(self, every_n:int=1, max_per_sec:float=0):
+        self.every_n = every_n
+        self.max_per_sec = max_per_sec
+        self._count = 0
+        self._skipped = 0
+        self._tokens = max_per_sec
+        self._time_last = time.monotonic()
+
+    def sample(self) -> int:
+        """
+        Call once per event
+
+        :return: None if the event must not be logged, otherwise the number
+        of events skipped since the last one logged
+        :rtype: (int)
+        """
+        self._count += 1
+        if self._count < self.every_n:
+            self._skipped += 1
+            return None
+        self._count = 0
+        if self.max_per_sec:
+            # Token bucket, burst of max_per_sec records
+            now = time.monotonic()
+            self._tokens = min(self.max_per_sec,
+                self._tokens + (now - self._time_last)*self.max_per_sec)
+            self._time_last = now
+            if self._tokens < 1:
+                self._skipped += 1
+                return None
+            self._tokens -= 1
+        skipped = self._skipped
+        self._skipped = 0
+        return skipped
+
+class Frame_str():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Frame_str class wraps a frame passed as a log argument, so it is only
+    turned into text by the writer thread: fields separated by commas (ASCII
+    frames) or hexadecimal (binary frames, and every frame if compact)
+    """
+    __slots__ = ("frame", "field_size", "compact")
+
+    def __init__(self, frame:bytes, field_size:int, compact:bool=False):
+        self.frame = frame
+        self.field_size = field_size
+        self.compact = compact
+
+    def __str__(self) -> str:
+        frame = self.frame
+        if self.compact or not frame.isascii():
+            return frame.hex()
+        return ",".join(frame[i:i+self.field_size].decode()
+            for i in range(0, len(frame), self.field_size))
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def start_logging(logger:logging.Logger, level:int, compact:bool=False,
+                    stream=None) -> logging.handlers.QueueListener:
+    """
+    Makes logger queue its records (see Deferred_queue_handler) to a writer
+    thread, which formats them and writes them to stream
+
+    :param level: records below this level are discarded at once
+    :param compact: shorter records (time since start in ms, level letter)
+    :param stream: sys.stdout if None
+    :return: the writer, to be stopped (stop_logging) before exiting
+    :rtype: (logging.handlers.QueueListener)
+    """
+    records = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stdout if stream is None else stream)
+    output.setFormatter(logging.Formatter(LOG_FORMAT_COMPACT if compact
+        else LOG_FORMAT))
+    listener = logging.handlers.QueueListener(records, output)
+    logger.handlers = [Deferred_queue_handler(records)]
+    logger.setLevel(level)
+    logger.propagate = False
+    listener.start()
+    return listener
+
+def stop_logging(logger:logging.Logger,
+                    listener:logging.handlers.QueueListener):
+    """ Writes the records still queued and stops the writer thread """
+    listener.stop()
+    logger.handlers = []
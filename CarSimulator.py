@@ -0,0 +1,231 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: CarSimulator.py
+# Description: simulated car to test the control app without hardware. It
+# connects to the server, streams synthetic telemetry and echoes the commands
+# received into fields 0-4 as the car firmware does
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import argparse
+import math
+import random
+import select
+import socket
+import time
+
+import CommunMessages
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 60000
+DEFAULT_RATE_HZ = 100
+
+# Car model
+MAX_SPEED_MMS = 1000        # Linear speed at 100% in manual mode
+SPEED_TAU_SEC = 0.3         # Time constant of the speed response
+WHEEL_PERIMETER_MM = 204    # 65 mm wheels
+DIST_MEAN_MM = 1000
+DIST_AMPLITUDE_MM = 500
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Simulated_car():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Simulated_car class streams incoming frames (incoming_pos_dic layout) to
+    the server at a fixed rate. Fields 0-4 echo the last command received,
+    fields 5-9 come from a simple model (first order speed response, wheel
+    speeds from linear speed and OX, distances following a sine wave).
+    Stream faults can be injected: frames split in two sends, frames merged
+    with the next one and corrupt frames (one byte replaced).
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - frames_sent: int. Frames sent (corrupt ones included)
+    - frames_corrupted / frames_split / frames_merged: int. Faults injected
+    - commands_received: int. Commands received from the server
+    - command: list. Last command received (fields 0-4)
+    """
+    def __init__(   self, host:str=DEFAULT_HOST, port:int=DEFAULT_PORT,
+                    rate_hz:float=DEFAULT_RATE_HZ,
+                    wire_format:str=CommunMessages.WIRE_FORMAT_ASCII,
+                    split_prob:float=0.0, merge_prob:float=0.0,
+                    corrupt_prob:float=0.0, seed:int=None):
+        """
+        :param host, port: address of the server
+        :param rate_hz: frames per second (10 Hz to 10 kHz)
+        :param wire_format: CommunMessages.WIRE_FORMAT_ASCII or _BINARY
+        :param split_prob, merge_prob, corrupt_prob: probability of each
+        fault for every frame
+        :param seed: seed of the random generator (faults and noise)
+        """
+        self._address = (host, port)
+        self._period = 1.0 / rate_hz
+        self._wire_format = wire_format
+        self._split_prob = split_prob
+        self._merge_prob = merge_prob
+        self._corrupt_prob = corrupt_prob
+        self._random = random.Random(seed)
+        self._reassembler = CommunMessages.new_reassembler(wire_format,
+            outgoing=True)
+        self._speed_mms = 0.0
+        self.command = [0, 0, 0, 0, 0]
+        self.frames_sent = 0
+        self.frames_corrupted = 0
+        self.frames_split = 0
+        self.frames_merged = 0
+        self.commands_received = 0
+
+    def _apply_command(self, frame:bytes):
+        """ Takes a command received from the server """
+        if self._wire_format == CommunMessages.WIRE_FORMAT_BINARY:
+            message = CommunMessages.decode_out_message_bin(frame)
+        else:
+            message = CommunMessages.decode_out_message(frame.decode())
+        self.command = [message.workmode, message.manctrly_perc,
+            message.manctrlx_perc, message.autctrl_speedy_mms,
+            message.autctrl_speedx_mms]
+        self.commands_received += 1
+
+    def _update_model(self, time_sec:float, step_sec:float) -> list:
+        """ Advances the car model by step_sec and returns the field values """
+        workmode, manctrly, manctrlx, speedy, speedx = self.command
+        if workmode == 1:
+            target = manctrly * MAX_SPEED_MMS / 100
+        elif workmode == 2:
+            target = speedy
+        else:
+            target = 0.0
+        self._speed_mms += (target - self._speed_mms) * \
+            (1 - math.exp(-step_sec / SPEED_TAU_SEC))
+        speed = self._speed_mms + self._random.gauss(0, 2)
+        rpm = speed * 60 / WHEEL_PERIMETER_MM
+        side = manctrlx / 100 if workmode == 1 else 0.0
+        lspeed = rpm * (1 + side) if side < 0 else rpm
+        rspeed = rpm * (1 - side) if side > 0 else rpm
+        ldist = DIST_MEAN_MM + DIST_AMPLITUDE_MM*math.sin(time_sec)
+        rdist = DIST_MEAN_MM + DIST_AMPLITUDE_MM*math.cos(time_sec)
+        return self.command + [_clamp(speed), _clamp(lspeed), _clamp(rspeed),
+            round(ldist), round(rdist)]
+
+    def _corrupt(self, frame:bytes) -> bytes:
+        """ Replaces one byte of frame by a byte that can not be valid """
+        position = self._random.randrange(len(frame))
+        if self._wire_format == CommunMessages.WIRE_FORMAT_BINARY:
+            position = self._random.randrange(
+                len(CommunMessages.BIN_SYNC_MARKER))
+        return frame[:position] + b'x' + frame[position+1:]
+
+    def run(self, duration_sec:float=None, stop=None):
+        """
+        Connects to the server and streams frames until duration_sec expires,
+        stop() returns True or the server closes the connection
+
+        :param duration_sec: time to run (forever if None)
+        :param stop: callable returning True to stop
+        """
+        connection = socket.create_connection(self._address)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        start = time.monotonic()
+        deadline = start
+        held = b''      # Frame held back to be merged with the next one
+        sequence = 0
+        try:
+            while True:
+                now = time.monotonic()
+                if (duration_sec is not None and now - start >= duration_sec) \
+                        or (stop is not None and stop()):
+                    break
+                # Wait for the next frame, taking commands meanwhile
+                readable, _, _ = select.select([connection], [], [],
+                    max(deadline - now, 0))
+                if readable:
+                    data = connection.recv(1024)
+                    if not data:
+                        break
+                    for frame in self._reassembler.feed(data):
+                        self._apply_command(frame)
+                    continue
+                # Send the next frame
+                frame = CommunMessages.encode_in_message(
+                    self._update_model(now - start, self._period),
+                    self._wire_format, sequence)
+                sequence += 1
+                deadline += self._period
+                if deadline < now:
+                    deadline = now      # Too late, do not try to catch up
+                self.frames_sent += 1
+                if self._random.random() < self._corrupt_prob:
+                    frame = self._corrupt(frame)
+                    self.frames_corrupted += 1
+                frame = held + frame
+                held = b''
+                if self._random.random() < self._merge_prob:
+                    held = frame
+                    self.frames_merged += 1
+                elif self._random.random() < self._split_prob:
+                    cut = self._random.randrange(1, len(frame))
+                    connection.sendall(frame[:cut])
+                    time.sleep(0.0001)
+                    connection.sendall(frame[cut:])
+                    self.frames_split += 1
+                else:
+                    connection.sendall(frame)
+        except (ConnectionError, BlockingIOError):
+            pass
+        finally:
+            connection.close()
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _clamp(value:float) -> int:
+    """ Rounds value into the valid range of a signed field """
+    return max(min(round(value), -(CommunMessages.INT16_MIN+1)),
+        CommunMessages.INT16_MIN+1)
+
+#==============================================================================
+# Main flow
+#==============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Robocar simulated car")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE_HZ,
+        help="frames per second")
+    parser.add_argument("--binary", action="store_true",
+        help="use the binary wire format")
+    parser.add_argument("--split", type=float, default=0.0,
+        help="probability of splitting a frame in two sends")
+    parser.add_argument("--merge", type=float, default=0.0,
+        help="probability of merging a frame with the next one")
+    parser.add_argument("--corrupt", type=float, default=0.0,
+        help="probability of corrupting a frame")
+    parser.add_argument("--duration", type=float, default=None,
+        help="seconds to run (forever by default)")
+    args = parser.parse_args()
+    car = Simulated_car(args.host, args.port, args.rate,
+        CommunMessages.WIRE_FORMAT_BINARY if args.binary
+            else CommunMessages.WIRE_FORMAT_ASCII,
+        args.split, args.merge, args.corrupt)
+    try:
+        car.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    print("Simulated car: {} frames sent, {} commands received".format(
+        car.frames_sent, car.commands_received))
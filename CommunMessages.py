@@ -9,7 +9,11 @@
 # Import
 #==============================================================================
 
-import numpy as np
+import functools
+import re
+import struct
+
+import MessageCodec
 
 #==============================================================================
 # Protocol information
@@ -35,13 +39,6 @@ import numpy as np
  * 		Field 4: automatic control / setpoint speed (??) / X-axis. Signed: [??]
  */
 """
-outgoing_pos_dic = {
-    0:"MESSAGE_IN_POS_WORKMODE",
-    1:"MESSAGE_IN_POS_MANCTRLY_PERC",
-    2:"MESSAGE_IN_POS_MANCTRLX_PERC",
-    3:"MESSAGE_IN_POS_AUTCTRL_SPEEDY_MMS",
-    4:"MESSAGE_IN_POS_AUTCTRL_SPEEDX_MMS",
-}
 """
 /* Control app incoming message structure:
  * 		Field 0: working mode. Unsigned. 0: manual, 1: automatic
@@ -59,18 +56,68 @@ outgoing_pos_dic = {
  *		Errors, other...
  */
 """
-incoming_pos_dic = {
-    "MESSAGE_OUT_POS_WORKMODE"              :0,
-    "MESSAGE_OUT_POS_MANCTRLY_PERC"         :1,
-    "MESSAGE_OUT_POS_MANCTRLX_PERC"         :2,
-    "MESSAGE_OUT_POS_AUTCTRL_SPEEDY_MMS"    :3,
-    "MESSAGE_OUT_POS_AUTCTRL_SPEEDX_MMS"    :4,
-    "MESSAGE_OUT_POS_LINSPEED_MMS"          :5,
-    "MESSAGE_OUT_POS_LSPEED_RPM"            :6,
-    "MESSAGE_OUT_POS_RSPEED_RPM"            :7,
-    "MESSAGE_OUT_POS_LDIST_MM"              :8,
-    "MESSAGE_OUT_POS_RDIST_MM"              :9,
-}
+"""
+/* Binary wire format (alternative to the ASCII one, little-endian):
+ * 		Bytes 0-1: sync marker 0xA5 0x5A
+ * 		Bytes 2-3: sequence number. Unsigned, wraps at 65535
+ * 		Then one 16-bit value per field, ordered and signed as described above
+ * 		(outgoing: 5 fields, 14 bytes; incoming: 10 fields, 24 bytes)
+ */
+"""
+NB_CHAR_PER_MESS = 5        # Chars per field (ASCII wire format)
+
+INT16_MIN = -32768
+UINT16_MAX = 65535
+
+# Message schemas (see MessageCodec.Compiled_codec), one line per field in
+# wire order: (name, err_name, bits, signed, low, high, sentinel). The
+# positions, sizes and formats of the frames, the attributes of the message
+# classes and their encode / decode functions are derived from them, so a
+# new field only takes a new line (low / high None: range of the type)
+MESSAGE_OUT_SCHEMA = (
+    ("workmode",            None,   16, False,  0,      2,      None),
+    ("manctrly_perc",       None,   16, True,   -100,   100,    None),
+    ("manctrlx_perc",       None,   16, True,   -100,   100,    None),
+    ("autctrl_speedy_mms",  None,   16, True,   -32767, 32767,  None),
+    ("autctrl_speedx_mms",  None,   16, True,   None,   None,   None),
+)
+MESSAGE_IN_SCHEMA = (
+    ("workmode",            "workmode_err",         16, False,  0,      2,
+        UINT16_MAX),
+    ("manctrly_perc",       "manctrly_err",         16, True,   -100,   100,
+        INT16_MIN),
+    ("manctrlx_perc",       "manctrlx_err",         16, True,   -100,   100,
+        INT16_MIN),
+    ("autctrl_speedy_mms",  "autctrl_speedy_err",   16, True,   None,   None,
+        INT16_MIN),
+    ("autctrl_speedx_mms",  "autctrl_speedx_err",   16, True,   None,   None,
+        INT16_MIN),
+    ("linspeed_mms",        "linspeed_err",         16, True,   None,   None,
+        INT16_MIN),
+    ("lspeed_rpm",          "lspeed_err",           16, True,   None,   None,
+        INT16_MIN),
+    ("rspeed_rpm",          "rspeed_err",           16, True,   None,   None,
+        INT16_MIN),
+    ("ldist_mm",            "ldist_err",            16, False,  None,   None,
+        UINT16_MAX),
+    ("rdist_mm",            "rdist_err",            16, False,  None,   None,
+        UINT16_MAX),
+)
+
+outgoing_pos_dic = {pos: "MESSAGE_IN_POS_" + field[0].upper()
+    for pos, field in enumerate(MESSAGE_OUT_SCHEMA)}
+incoming_pos_dic = {"MESSAGE_OUT_POS_" + field[0].upper(): pos
+    for pos, field in enumerate(MESSAGE_IN_SCHEMA)}
+# Name of the column / attribute holding each incoming field
+incoming_name_dic = {"MESSAGE_OUT_POS_" + field[0].upper(): field[0]
+    for field in MESSAGE_IN_SCHEMA}
+# Incoming fields carried as unsigned values (the rest are signed)
+incoming_unsigned_set = {"MESSAGE_OUT_POS_" + field[0].upper()
+    for field in MESSAGE_IN_SCHEMA if not field[3]}
+# Bit of each incoming field (attribute name) in the error bitmask
+# (Message_struct_in.err, "err" column of decode_in_messages)
+incoming_err_mask_dic = {field[0]: 1 << pos
+    for pos, field in enumerate(MESSAGE_IN_SCHEMA)}
 def get_workmode_id(mode_str:str) -> int:
     ret_val = -1
     if mode_str == "Stop mode":
@@ -94,12 +141,61 @@ def get_workmode_name(mode_int:int) -> str:
 # Global data
 #==============================================================================
 
-NB_CHAR_PER_MESS = 5
 
-INT16_MIN = -32768
-UINT16_MAX = 65535
+# Wire formats. ASCII: NB_CHAR_PER_MESS zero-padded decimal chars per field.
+# Binary: little-endian header (sync marker, uint16 sequence number) followed
+# by one int16 / uint16 per field
+WIRE_FORMAT_ASCII = "ascii"
+WIRE_FORMAT_BINARY = "binary"
+BIN_SYNC_MARKER = b'\xa5\x5a'
+_BIN_HEADER_FORMAT = '<2sH'
+
+# Encode / decode functions compiled from the schemas
+_codec_in = MessageCodec.Compiled_codec(MESSAGE_IN_SCHEMA, NB_CHAR_PER_MESS,
+    _BIN_HEADER_FORMAT, BIN_SYNC_MARKER)
+_codec_out = MessageCodec.Compiled_codec(MESSAGE_OUT_SCHEMA, NB_CHAR_PER_MESS,
+    _BIN_HEADER_FORMAT, BIN_SYNC_MARKER)
+
+# ASCII frames: a field is either 5 digits or a minus sign followed by 4 
+# digits (zfill, see MessageCodec.ascii_field_pattern)
+_FRAME_IN_RE = _codec_in.ascii_frame_re
+_FRAME_OUT_RE = _codec_out.ascii_frame_re
+# Values an outgoing ASCII field can hold (see encode_out_message)
+OUT_VALUE_MIN, OUT_VALUE_MAX = MessageCodec.ascii_field_range(
+    NB_CHAR_PER_MESS)
 
+MESSAGE_IN_SIZE = _codec_in.ascii_size
+MESSAGE_OUT_SIZE = _codec_out.ascii_size
+_bin_in_struct = _codec_in.bin_struct
+_bin_out_struct = _codec_out.bin_struct
+_BIN_HEADER_SIZE = struct.calcsize(_BIN_HEADER_FORMAT)
+_bin_sequence_struct = struct.Struct('<H')
+_bin_out_fields_struct = struct.Struct('<' + 
+    _bin_out_struct.format[len(_BIN_HEADER_FORMAT):])
 
+# Outgoing frames kept encoded (LRU, see encode_out_message and
+# Out_frame_bin): commands sent again and again (Stop, same setpoint) are 
+# only encoded once
+OUT_FRAME_CACHE_SIZE = 32
+_ASCII_OUT_FORMAT = _codec_out.ascii_format.encode()
+MESSAGE_IN_BIN_SIZE = _bin_in_struct.size
+MESSAGE_OUT_BIN_SIZE = _bin_out_struct.size
+_FRAME_IN_BIN_RE = re.compile(re.escape(BIN_SYNC_MARKER) + 
+    b'.{' + str(MESSAGE_IN_BIN_SIZE-len(BIN_SYNC_MARKER)).encode() + b'}',
+    re.DOTALL)
+_FRAME_OUT_BIN_RE = re.compile(re.escape(BIN_SYNC_MARKER) + 
+    b'.{' + str(MESSAGE_OUT_BIN_SIZE-len(BIN_SYNC_MARKER)).encode() + b'}',
+    re.DOTALL)
+
+# Batch decoding: one column per incoming field (ordered as in 
+# incoming_pos_dic) plus a bitmask where bit N is set if field N is wrong
+# (NumPy is only imported when first needed, see _numpy and 
+# get_message_in_dtype: processes which never decode in batch do not load it. 
+# message_in_dtype is still available as a module attribute)
+MESSAGE_IN_ERR_COLUMN = "err"
+np = None
+_message_in_dtype = None
+_validation_tables = None
 
 #==============================================================================
 # Classes
@@ -136,79 +232,20 @@ class Message_struct_in():
     - ldist_mm_err: bool. True if error in ldist_mm value
     - rdist_mm: int [0,65535]
     - rdist_mm_err: bool. True if error in rdist_mm value
+    - err: int. Bitmask, bit N set if field N (incoming_pos_dic) is wrong:
+      not a number, out of range or error value. 0 if the whole message is
+      valid. The *_err flags above are read from it (properties)
     """
-    def __init__(   self, workmode: int, 
-                    manctrly_perc: int, manctrlx_perc: int, 
-                    autctrl_speedy_mms: int, autctrl_speedx_mms: int, 
-                    linspeed_mms: int, lspeed_rpm: int, rspeed_rpm: int, 
-                    ldist_mm: int, rdist_mm: int
-                ):
-        """
-        :params all: see class info to know about valid types and ranges
-        :exception ValueError may arise if types / ranges are not considered
-        """
-        # workmode
-        self.workmode = None
-        if _str_is_number(workmode):
-            self.workmode = int(workmode)
-        if (self.workmode==0 or self.workmode==1 or self.workmode==2):
-            self.workmode_err = False
-        else:
-            self.workmode_err = True
-        # manctrly_perc
-        self.manctrly_perc = None
-        if _str_is_number(manctrly_perc):
-            self.manctrly_perc = np.int16(manctrly_perc)
-        self.manctrly_err = False if (self.manctrly_perc >= -100 or self.manctrly_perc <= 100) \
-            else True
-        # manctrlx_perc
-        self.manctrlx_perc = None
-        if _str_is_number(manctrlx_perc):
-            self.manctrlx_perc = np.int16(manctrlx_perc)
-        self.manctrlx_err = False if (self.manctrlx_perc >= -100 or self.manctrlx_perc <= 100) \
-            else True
-        # autctrl_speedy_mms
-        self.autctrl_speedy_mms = None
-        if _str_is_number(autctrl_speedy_mms):
-            self.autctrl_speedy_mms = np.int16(autctrl_speedy_mms)
-        self.autctrl_speedy_err = True if (self.autctrl_speedy_mms==INT16_MIN or self.autctrl_speedy_mms==None) \
-            else False
-        # autctrl_speedx_mms
-        self.autctrl_speedx_mms = None
-        if _str_is_number(autctrl_speedx_mms):
-            self.autctrl_speedx_mms = np.int16(autctrl_speedx_mms)
-        self.autctrl_speedx_err = True if (self.autctrl_speedx_mms==INT16_MIN or self.autctrl_speedx_mms==None) \
-            else False
-        # linspeed_mms
-        self.linspeed_mms = None
-        if _str_is_number(linspeed_mms):
-            self.linspeed_mms = np.int16(linspeed_mms)
-        self.linspeed_err = True if (self.linspeed_mms==INT16_MIN or self.linspeed_mms==None) \
-            else False
-        # lspeed_rpm
-        self.lspeed_rpm = None
-        if _str_is_number(lspeed_rpm):
-            self.lspeed_rpm = np.int16(lspeed_rpm)
-        self.lspeed_err = True if (self.lspeed_rpm==INT16_MIN or self.lspeed_rpm==None) \
-            else False
-        # rspeed_rpm
-        self.rspeed_rpm = None
-        if _str_is_number(rspeed_rpm):
-            self.rspeed_rpm = np.int16(rspeed_rpm)
-        self.rspeed_err = True if (self.rspeed_rpm==INT16_MIN or self.rspeed_rpm==None) \
-            else False
-        # ldist_mm
-        self.ldist_mm = None
-        if _str_is_number(ldist_mm):
-            self.ldist_mm = np.int16(ldist_mm)
-        self.ldist_err = True if (self.ldist_mm==UINT16_MAX or self.ldist_mm==None) \
-            else False
-        # rdist_mm
-        self.rdist_mm = None
-        if _str_is_number(rdist_mm):
-            self.rdist_mm = np.int16(rdist_mm)
-        self.rdist_err = True if (self.rdist_mm==UINT16_MAX or self.rdist_mm==None) \
-            else False
+    __slots__ = _codec_in.slots
+
+    # Compiled from MESSAGE_IN_SCHEMA (see MessageCodec.Compiled_codec):
+    # __init__(self, workmode, manctrly_perc, ..., rdist_mm) takes one value
+    # per field in wire order (int or str, e.g. the chars of an ASCII field;
+    # a value which is not a number is stored as None and flagged as error).
+    # set_fields (same parameters) reinitialises all the fields in place, so
+    # that an existing object can be reused for every received message
+    __init__ = _codec_in.set_fields
+    set_fields = _codec_in.set_fields
 
     def get_workmode_str(self):
         """ Returns string naming the current working mode """
@@ -216,6 +253,8 @@ class Message_struct_in():
         if (self.workmode_err == False):
             ret = get_workmode_name(self.workmode)
         return ret
+
+MessageCodec.add_error_flags(Message_struct_in, _codec_in)
         
 class Message_struct_out():
     """
@@ -239,75 +278,477 @@ class Message_struct_out():
     - autctrl_speedx_mms: int [??]
     - autctrl_speedx_err: bool. True if error in autctrl_speedx_mms value
     """
-    def __init__(   self, workmode:int, manctrly_perc:int, manctrlx_perc:int,
-                    autctrl_speedy_mms:int, autctrl_speedx_mms:int
-                ):
+    # Compiled from MESSAGE_OUT_SCHEMA (see MessageCodec.Compiled_codec):
+    # - __init__(self, workmode, manctrly_perc, ..., autctrl_speedx_mms):
+    #   one value per field, converted with int() (ValueError if it is not a
+    #   number)
+    # - get_output_format(self): returns a str object containing the
+    #   parameters in the proper order to be sent
+    # - get_output_format_bin(self, sequence): same as a bytes object using
+    #   the binary wire format, sequence being the sequence number of the
+    #   message (wraps at 16 bits). struct.error may arise if a value is out
+    #   of the int16 / uint16 range
+    __init__ = _codec_out.set_fields
+    get_output_format = _codec_out.encode_ascii
+    get_output_format_bin = _codec_out.encode_bin
+
+class Out_frame_bin():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Out_frame_bin class converts the outgoing messages (ASCII format, as
+    received from the GUI) to the binary wire format in a frame allocated
+    once: the field values are packed straight into the binary fields, only
+    when the message changes (and only the first time a message is seen, 
+    see OUT_FRAME_CACHE_SIZE), the sequence number is written in place for 
+    every send
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - frame: bytearray. Last frame encoded, overwritten by the next encode
+      (to be copied if it must be kept)
+    """
+    def __init__(self):
+        self.frame = bytearray(MESSAGE_OUT_BIN_SIZE)
+        self.frame[:len(BIN_SYNC_MARKER)] = BIN_SYNC_MARKER
+        self._message = None
+
+    def encode(self, message_out:bytes, sequence:int) -> bytearray:
+        """
+        :param message_out: message sized as MESSAGE_OUT_SIZE (ASCII format)
+        :param sequence: sequence number of the message (wraps at 16 bits)
+        :return: frame
+        :exception ValueError if message_out is not an outgoing message in 
+        ASCII format, struct.error if a value does not fit its binary field 
+        (the frame is not changed in both cases)
+        """
+        if message_out != self._message:
+            self.frame[_BIN_HEADER_SIZE:] = _out_fields_bin(message_out)
+            self._message = message_out
+        _bin_sequence_struct.pack_into(self.frame, len(BIN_SYNC_MARKER),
+            sequence & 0xFFFF)
+        return self.frame
+
+class Frame_reassembler():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Frame_reassembler class rebuilds the incoming frames from the TCP byte 
+    stream. TCP does not preserve message boundaries, so a single recv() may
+    return part of a frame or several frames at once. Received bytes are kept
+    in a persistent buffer and every complete frame is extracted from it. If
+    the head of the buffer does not look like a valid frame, it is dropped if
+    the frame after it is valid (corrupt frame). Otherwise (partial data), 
+    bytes are discarded until the next valid frame (resync), which is only 
+    taken once the frame after it is valid too.
+    Limit: ASCII frames have no delimiter, so after partial data a stream of
+    digits shifted by a whole number of fields (or by any offset keeping the
+    minus signs at field starts) still looks valid, and the frames extracted
+    from it are garbled until the next wrong frame. In the binary wire 
+    format the sync marker makes a shifted alignment unlikely.
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - frame_size: int. Size in bytes of a complete frame
+    - frames_received: int. Number of complete and valid frames extracted
+    - frames_dropped: int. Number of valid frames superseded by a newer one
+      before being forwarded (see feed_latest)
+    - resync_events: int. Number of times the stream was found out of sync
+    - bytes_discarded: int. Number of bytes thrown away while resyncing
+    """
+    def __init__(self, frame_size:int=MESSAGE_IN_SIZE, 
+                    frame_re:re.Pattern=_FRAME_IN_RE):
+        """
+        :param frame_size: size in bytes of a complete frame
+        :param frame_re: compiled regular expression matching exactly one 
+        complete and valid frame
+        """
+        self.frame_size = frame_size
+        self._frame_re = frame_re
+        self._buffer = bytearray()
+        self._in_sync = True
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.resync_events = 0
+        self.bytes_discarded = 0
+
+    def reset(self):
+        """ Discards any buffered data (e.g. after a new connection). 
+        Counters are kept """
+        self._buffer.clear()
+        self._in_sync = True
+
+    def _discard(self, nb_bytes:int):
+        """ Removes nb_bytes from the head of the buffer while resyncing """
+        if nb_bytes <= 0:
+            return
+        del self._buffer[:nb_bytes]
+        self.bytes_discarded += nb_bytes
+        if self._in_sync:
+            self._in_sync = False
+            self.resync_events += 1
+
+    def feed(self, data:bytes) -> list:
+        """
+        Appends the received data to the buffer and extracts every complete 
+        frame available
+
+        :param data: bytes just received from the socket
+        :type data: (bytes)
+        :return: complete frames, oldest first
+        :rtype: (list of bytes)
+        """
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        start = 0
+        frame_size = self.frame_size
+        while len(buffer) - start >= frame_size:
+            valid = self._frame_re.match(buffer, start, start+frame_size)
+            if valid and not self._in_sync:
+                # Resync candidate: only taken if the frame after it is 
+                # valid too, at the expected offset
+                if len(buffer) - start < 2*frame_size:
+                    break   # Wait for the next frame to confirm it
+                valid = self._frame_re.match(buffer, start+frame_size, 
+                    start+2*frame_size)
+            if valid:
+                frames.append(bytes(buffer[start:start+frame_size]))
+                start += frame_size
+                self._in_sync = True
+                continue
+            # Wrong frame. If the next one is valid, only this one was 
+            # corrupt: drop it keeping the alignment (an ASCII stream has no 
+            # delimiters, a search could lock onto a shifted alignment)
+            if len(buffer) - start < 2*frame_size:
+                break   # Wait for the next frame to decide
+            if self._in_sync and self._frame_re.match(buffer, 
+                    start+frame_size, start+2*frame_size):
+                del buffer[:start]
+                start = 0
+                self._discard(frame_size)
+                self._in_sync = True    # Alignment kept
+                continue
+            # Out of sync: look for the next valid frame
+            del buffer[:start]
+            start = 0
+            next_frame = self._frame_re.search(buffer, 1)
+            if next_frame:
+                self._discard(next_frame.start())
+            else:
+                # Keep only the tail that may be the beginning of a frame
+                self._discard(len(buffer) - (frame_size-1))
+        del buffer[:start]
+        self.frames_received += len(frames)
+        return frames
+
+    def feed_latest(self, data:bytes) -> bytes:
         """
-        :param: all: see class info to know about valid types and ranges
-        :exception ValueError may arise if types / ranges are not considered
+        Same as feed but only the most recent frame is returned, the older
+        ones are accounted as dropped
+
+        :return: newest complete frame or None if no frame was completed
+        :rtype: (bytes)
+        """
+        return self.take_latest(self.feed(data))
+
+    def take_latest(self, frames:list) -> bytes:
+        """
+        Returns the newest of frames (as returned by feed) and accounts the 
+        older ones as dropped. None if frames is empty
         """
-        self.workmode = int(workmode)
-        self.manctrly_perc = int(manctrly_perc)
-        self.manctrlx_perc = int(manctrlx_perc)
-        self.autctrl_speedy_mms = int(autctrl_speedy_mms)
-        self.autctrl_speedx_mms = int(autctrl_speedx_mms)
-    
-    def get_output_format(self):
-        """ Returns a str object containing the parameters in the proper
-        order to be sent """
-        out_formatted = ""
-        out_formatted += str(self.workmode).zfill(NB_CHAR_PER_MESS)
-        out_formatted += str(self.manctrly_perc).zfill(NB_CHAR_PER_MESS)
-        out_formatted += str(self.manctrlx_perc).zfill(NB_CHAR_PER_MESS)
-        out_formatted += str(self.autctrl_speedy_mms).zfill(NB_CHAR_PER_MESS)
-        out_formatted += str(self.autctrl_speedx_mms).zfill(NB_CHAR_PER_MESS)
-        return out_formatted
+        if not frames:
+            return None
+        self.frames_dropped += len(frames) - 1
+        return frames[-1]
 
 #==============================================================================
 # Function definitions
 #==============================================================================
 
-def _str_is_number(str:str) -> bool:
-    """ Returns True if str represents number or False otherwise """
-    try:
-        number = int(str)
-        return True
-    except ValueError:
-        return False
-
-def decode_in_message(message_in:str) -> Message_struct_in:
+def decode_in_message(message_in:str, 
+        reuse:Message_struct_in=None) -> Message_struct_in:
     """
     Takes incoming message and returns a Message_struct_in object initialised 
     with the parameters stored in the message
     :param message_in: Contains the message to decode, sized as 
     NB_CHAR_PER_MESS * len(incoming_pos_dic)
-    :type message_in: (str)
-    :exception IndexError may arise if message_in is not sized as expected
-    :exception ValueError may arise if types / ranges in incoming message are
-    different to what was expected
-    """
-    # Discard the old messages that could be stored as a same message
-    message_size = NB_CHAR_PER_MESS*len(incoming_pos_dic)
-    if (len(message_in) >= message_size):
-        message_in = message_in[0:message_size]
-        # Decode parameters
-        list_params = []
-        for param_index in range(1,len(incoming_pos_dic)+1):
-            pos_message = (param_index-1)*NB_CHAR_PER_MESS
-            current_param = message_in[pos_message:pos_message+5]
-            list_params.append(current_param)
-        my_message = Message_struct_in(
-            workmode = list_params[incoming_pos_dic["MESSAGE_OUT_POS_WORKMODE"]],
-            manctrly_perc = list_params[incoming_pos_dic["MESSAGE_OUT_POS_MANCTRLY_PERC"]],
-            manctrlx_perc = list_params[incoming_pos_dic["MESSAGE_OUT_POS_MANCTRLX_PERC"]],
-            autctrl_speedx_mms = list_params[incoming_pos_dic["MESSAGE_OUT_POS_AUTCTRL_SPEEDY_MMS"]],
-            autctrl_speedy_mms = list_params[incoming_pos_dic["MESSAGE_OUT_POS_AUTCTRL_SPEEDX_MMS"]],
-            linspeed_mms = list_params[incoming_pos_dic["MESSAGE_OUT_POS_LINSPEED_MMS"]],
-            lspeed_rpm = list_params[incoming_pos_dic["MESSAGE_OUT_POS_LSPEED_RPM"]],
-            rspeed_rpm = list_params[incoming_pos_dic["MESSAGE_OUT_POS_RSPEED_RPM"]],
-            ldist_mm = list_params[incoming_pos_dic["MESSAGE_OUT_POS_LDIST_MM"]],
-            rdist_mm = list_params[incoming_pos_dic["MESSAGE_OUT_POS_RDIST_MM"]],
-        )
+    :type message_in: (str or bytes)
+    :param reuse: if given, this object is filled in and returned instead of
+    allocating a new one
+    :type reuse: (Message_struct_in)
+    :return: decoded message (fields which are not a number or out of range
+    are flagged as error) or None if message_in is too short
+    """
+    # Bytes after the first message (old messages that could be stored as a
+    # same message) are ignored
+    if len(message_in) < MESSAGE_IN_SIZE:
+        return None
+    if reuse is None:
+        my_message = Message_struct_in.__new__(Message_struct_in)
     else:
-        my_message = None
+        my_message = reuse
+    _codec_in.decode_ascii(my_message, message_in)
+    return my_message
+
+def _numpy():
+    """ Imports NumPy on first use """
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+def get_message_in_dtype() -> "np.dtype":
+    """ Returns the dtype of the arrays given by decode_in_messages """
+    global _message_in_dtype
+    if _message_in_dtype is None:
+        np = _numpy()
+        names = [incoming_name_dic[key] 
+            for key in sorted(incoming_pos_dic, key=incoming_pos_dic.get)]
+        _message_in_dtype = np.dtype([(name, np.int32) for name in names] + 
+            [(MESSAGE_IN_ERR_COLUMN, np.uint16)])
+    return _message_in_dtype
+
+def get_validation_tables() -> tuple:
+    """
+    Returns the rules of the incoming fields as lookup tables, one entry per
+    field (built once from MESSAGE_IN_SCHEMA): lowest and highest valid
+    values, error value (a value below the range if none) and bit in the
+    error bitmask
+
+    :rtype: (tuple of np.ndarray: low, high, sentinel (int32), bit (uint16))
+    """
+    global _validation_tables
+    if _validation_tables is None:
+        np = _numpy()
+        low = np.array([low for low, _ in _codec_in.ranges], dtype=np.int32)
+        high = np.array([high for _, high in _codec_in.ranges],
+            dtype=np.int32)
+        sentinel = np.array([low[pos] - 1 if value is None else value
+            for pos, value in enumerate(_codec_in.sentinels)], dtype=np.int32)
+        bits = (1 << np.arange(len(MESSAGE_IN_SCHEMA))).astype(np.uint16)
+        _validation_tables = (low, high, sentinel, bits)
+    return _validation_tables
+
+def validate_in_values(values:"np.ndarray",
+        wrong:"np.ndarray"=None) -> "np.ndarray":
+    """
+    Checks at once the range and error value rules of every field of N
+    incoming messages (see get_validation_tables) and returns their error
+    bitmasks. Wrong values are set to 0 (in place)
+    :param values: one row per message, one column per field (ordered as in
+    incoming_pos_dic), int32
+    :type values: (np.ndarray)
+    :param wrong: fields already known to be wrong (e.g. not a number), same
+    shape as values, bool. None if none
+    :type wrong: (np.ndarray)
+    :return: error bitmask of each message, bit N set if field N is wrong
+    :rtype: (np.ndarray, uint16)
+    """
+    np = _numpy()
+    low, high, sentinel, bits = get_validation_tables()
+    is_wrong = (values < low) | (values > high) | (values == sentinel)
+    if wrong is not None:
+        is_wrong |= wrong
+    values[is_wrong] = 0
+    return is_wrong.astype(np.uint16) @ bits
+
+def __getattr__(name:str):
+    if name == "message_in_dtype":
+        return get_message_in_dtype()
+    raise AttributeError("module {!r} has no attribute {!r}".format(
+        __name__, name))
+
+def decode_in_messages(buffer) -> "np.ndarray":
+    """
+    Decodes at once a buffer containing N concatenated incoming messages 
+    (each sized as NB_CHAR_PER_MESS * len(incoming_pos_dic)). Trailing bytes 
+    not completing a message are ignored.
+    A field is considered wrong (its bit is set in the "err" column and its
+    value set to 0) if it is not a zero-padded decimal number or if it breaks
+    the rules of MESSAGE_IN_SCHEMA (range, error value), as in
+    Message_struct_in.err
+    :param buffer: concatenated messages
+    :type buffer: (bytes, bytearray, memoryview or str)
+    :return: structured array with N rows and dtype message_in_dtype
+    :rtype: (np.ndarray)
+    """
+    np = _numpy()
+    if isinstance(buffer, str):
+        buffer = buffer.encode()
+    nb_fields = len(incoming_pos_dic)
+    nb_messages = len(buffer) // MESSAGE_IN_SIZE
+    decoded = np.zeros(nb_messages, dtype=get_message_in_dtype())
+    if nb_messages == 0:
+        return decoded
+    raw = np.frombuffer(buffer, dtype=np.uint8, 
+        count=nb_messages*MESSAGE_IN_SIZE)
+    raw = raw.reshape(nb_messages, nb_fields, NB_CHAR_PER_MESS)
+    # Parse every character at once: digits (wrapping in uint8 makes any 
+    # character below '0' greater than 9) and leading minus sign
+    digits = raw - np.uint8(ord('0'))
+    is_digit = digits <= 9
+    negative = raw[:, :, 0] == ord('-')
+    is_valid = (is_digit[:, :, 0] | negative) & is_digit[:, :, 1:].all(axis=2)
+    digits[~is_digit] = 0
+    weights = 10 ** np.arange(NB_CHAR_PER_MESS-1, -1, -1, dtype=np.int32)
+    values = digits.astype(np.int32) @ weights
+    np.negative(values, out=values, where=negative)
+    # Range and error value checks, error bitmask
+    errors = validate_in_values(values, ~is_valid)
+    # Fill the columns
+    for key, pos in incoming_pos_dic.items():
+        decoded[incoming_name_dic[key]] = values[:, pos]
+    decoded[MESSAGE_IN_ERR_COLUMN] = errors
+    return decoded
+
+def decode_in_message_bin(message_in:bytes, 
+        reuse:Message_struct_in=None) -> Message_struct_in:
+    """
+    Same as decode_in_message for a message using the binary wire format
+    :param message_in: Contains the message to decode (header included), 
+    sized as MESSAGE_IN_BIN_SIZE
+    :type message_in: (bytes)
+    :param reuse: if given, this object is filled in and returned instead of
+    allocating a new one
+    :type reuse: (Message_struct_in)
+    :return: decoded message or None if the size or the sync marker are wrong
+    """
+    if (len(message_in) != MESSAGE_IN_BIN_SIZE or 
+            message_in[:len(BIN_SYNC_MARKER)] != BIN_SYNC_MARKER):
+        return None
+    if reuse is None:
+        my_message = Message_struct_in.__new__(Message_struct_in)
+    else:
+        my_message = reuse
+    _codec_in.decode_bin(my_message, message_in)
+    return my_message
+
+def get_sequence_bin(message:bytes) -> int:
+    """ Returns the sequence number of a message in binary wire format """
+    return _bin_in_struct.unpack_from(message)[1]
+
+def decode_frame(frame, reuse:Message_struct_in=None) -> Message_struct_in:
+    """
+    Decodes an incoming frame in any wire format (binary frames start with
+    BIN_SYNC_MARKER, which can never start an ASCII frame)
+    :param frame: frame as extracted by Frame_reassembler
+    :type frame: (bytes or str)
+    :param reuse: see decode_in_message
+    """
+    if isinstance(frame, (bytes, bytearray)):
+        if frame[:len(BIN_SYNC_MARKER)] == BIN_SYNC_MARKER:
+            return decode_in_message_bin(frame, reuse)
+    return decode_in_message(frame, reuse)     # ASCII, str or bytes
+
+def decode_out_message(message_out:str) -> Message_struct_out:
+    """
+    Inverse of Message_struct_out.get_output_format
+    :param message_out: message sized as NB_CHAR_PER_MESS*len(outgoing_pos_dic)
+    :type message_out: (str)
+    :exception ValueError may arise if the message is not sized as expected or
+    any field is not a number
+    """
+    if len(message_out) != MESSAGE_OUT_SIZE:
+        raise ValueError("Wrong outgoing message size: " + str(len(message_out)))
+    my_message = Message_struct_out.__new__(Message_struct_out)
+    _codec_out.decode_ascii(my_message, message_out)
     return my_message
+
+def decode_out_message_bin(message_out:bytes) -> Message_struct_out:
+    """
+    Inverse of Message_struct_out.get_output_format_bin
+    :param message_out: message sized as MESSAGE_OUT_BIN_SIZE
+    :type message_out: (bytes)
+    :exception struct.error may arise if the message is not sized as expected
+    """
+    my_message = Message_struct_out.__new__(Message_struct_out)
+    _codec_out.decode_bin(my_message, message_out)
+    return my_message
+
+@functools.lru_cache(maxsize=OUT_FRAME_CACHE_SIZE)
+def encode_out_message(*values) -> bytes:
+    """
+    Builds an outgoing message in ASCII format, straight to bytes (same
+    output as Message_struct_out.get_output_format, encoded). Messages are
+    kept in an LRU cache, a repeated command is not formatted again
+    :param values: one int per field, ordered as in outgoing_pos_dic
+    :exception ValueError if a value is out of [OUT_VALUE_MIN, 
+    OUT_VALUE_MAX] (it would not fit its field). TypeError may arise if a 
+    value is not a number
+    """
+    for value in values:
+        if not OUT_VALUE_MIN <= value <= OUT_VALUE_MAX:
+            raise ValueError("Value out of the outgoing field range: " + 
+                str(value))
+    return _ASCII_OUT_FORMAT % values
+
+@functools.lru_cache(maxsize=OUT_FRAME_CACHE_SIZE)
+def _out_fields_bin(message_out:bytes) -> bytes:
+    """ Returns the fields of an outgoing message (ASCII format) in binary
+    wire format, header excluded (see Out_frame_bin). The struct checks that
+    every value fits its field (struct.error otherwise) """
+    if not _FRAME_OUT_RE.fullmatch(message_out):
+        raise ValueError("Wrong outgoing message: " + repr(message_out))
+    return _bin_out_fields_struct.pack(*(int(message_out[pos:pos+
+        NB_CHAR_PER_MESS]) for pos in range(0, MESSAGE_OUT_SIZE, 
+        NB_CHAR_PER_MESS)))
+
+def check_out_message(message_out:bytes, wire_format:str):
+    """
+    Checks that an outgoing message (ASCII format, as written by the GUI) 
+    can be sent in wire_format
+    :exception ValueError if message_out is not an outgoing message in 
+    ASCII format, struct.error if a value does not fit its binary field 
+    (WIRE_FORMAT_BINARY)
+    """
+    if wire_format == WIRE_FORMAT_BINARY:
+        _out_fields_bin(message_out)    # Cached for Out_frame_bin
+    elif not _FRAME_OUT_RE.fullmatch(message_out):
+        raise ValueError("Wrong outgoing message: " + repr(message_out))
+
+def new_reassembler(wire_format:str, outgoing:bool=False) -> Frame_reassembler:
+    """ Returns a Frame_reassembler for incoming frames in wire_format (or
+    outgoing frames if outgoing is True, as the car receives them) """
+    if wire_format == WIRE_FORMAT_BINARY:
+        if outgoing:
+            return Frame_reassembler(MESSAGE_OUT_BIN_SIZE, _FRAME_OUT_BIN_RE)
+        return Frame_reassembler(MESSAGE_IN_BIN_SIZE, _FRAME_IN_BIN_RE)
+    if outgoing:
+        return Frame_reassembler(MESSAGE_OUT_SIZE, _FRAME_OUT_RE)
+    return Frame_reassembler(MESSAGE_IN_SIZE, _FRAME_IN_RE)
+
+def detect_wire_format(data:bytes) -> str:
+    """
+    Detects the wire format used by the car from the first bytes received
+    :param data: bytes received so far on a new connection
+    :type data: (bytes)
+    :return: WIRE_FORMAT_BINARY if a binary frame is found, WIRE_FORMAT_ASCII 
+    if an ASCII frame is found, None if still undecided
+    """
+    binary_frame = _FRAME_IN_BIN_RE.search(data)
+    ascii_frame = _FRAME_IN_RE.search(data)
+    if binary_frame and (not ascii_frame or 
+            binary_frame.start() <= ascii_frame.start()):
+        return WIRE_FORMAT_BINARY
+    if ascii_frame:
+        return WIRE_FORMAT_ASCII
+    return None
+
+def encode_in_message(values:list, wire_format:str=WIRE_FORMAT_ASCII,
+        sequence:int=0) -> bytes:
+    """
+    Builds an incoming message as the car sends it (used to simulate a car)
+    :param values: one int per field, ordered as in incoming_pos_dic
+    :param wire_format: WIRE_FORMAT_ASCII or WIRE_FORMAT_BINARY
+    :param sequence: sequence number (binary format only)
+    :exception struct.error may arise if a value is out of range (binary)
+    """
+    if wire_format == WIRE_FORMAT_BINARY:
+        return _bin_in_struct.pack(BIN_SYNC_MARKER, sequence & 0xFFFF, *values)
+    return (_codec_in.ascii_format % tuple(values)).encode()
@@ -0,0 +1,296 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: Filters.py
+# Description: filters of the noisy telemetry channels (ultrasonic distances,
+# wheel speeds), run sample by sample between decode and display, or at once
+# over recorded arrays (batch mode, same results)
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+from bisect import bisect_left, insort
+from collections import deque
+import math
+
+import CommunMessages
+
+# NumPy is only imported by the batch functions (apply), when first called
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+EMA_ALPHA_DIST = 0.3        # Weight of the new sample (distances)
+EMA_ALPHA_SPEED = 0.2       # Weight of the new sample (wheel speeds)
+MEDIAN_WINDOW_DIST = 5      # Samples of the sliding median (distances)
+# Batch EMA: samples per block, so that (1-alpha)**-block stays far from
+# the float64 limits
+_EMA_BLOCK_MAX_EXP = 100
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Ema_filter():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Ema_filter class: exponential moving average,
+    output = output + alpha*(sample - output), starting at the first sample.
+    O(1) per sample
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - alpha: float. Weight of the new sample in ]0, 1]
+    """
+    def __init__(self, alpha:float):
+        self.alpha = alpha
+        self._output = None
+
+    def reset(self):
+        self._output = None
+
+    def update(self, value:float) -> float:
+        if self._output is None:
+            self._output = float(value)
+        else:
+            self._output += self.alpha*(value - self._output)
+        return self._output
+
+    def apply(self, values) -> "np.ndarray":
+        """ Batch mode: returns the outputs for values (from the initial
+        state, the state of the object is not changed). Vectorised by blocks:
+        y[i] = d**(i+1)*y[-1] + alpha*d**i*cumsum(x[k]*d**-k), d = 1-alpha """
+        import numpy as np
+        values = np.asarray(values, dtype=np.float64)
+        outputs = np.empty_like(values)
+        if values.size == 0:
+            return outputs
+        decay = 1.0 - self.alpha
+        if decay <= 0.0:
+            outputs[:] = values
+            return outputs
+        block = max(1, int(_EMA_BLOCK_MAX_EXP / -math.log10(decay))) \
+            if decay < 1.0 else values.size
+        powers = decay ** np.arange(min(block, values.size) + 1)
+        state = values[0]
+        for start in range(0, values.size, block):
+            chunk = values[start:start+block]
+            size = chunk.size
+            sums = np.cumsum(chunk / powers[:size])
+            outputs[start:start+size] = powers[1:size+1]*state + \
+                self.alpha*powers[:size]*sums
+            state = outputs[start+size-1]
+        return outputs
+
+class Median_filter():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Median_filter class: median of the last window samples (of the samples
+    received so far while fewer). Keeps the window sorted (bisect), so the
+    cost per sample only depends on the window, not on the history
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - window: int. Number of samples
+    """
+    def __init__(self, window:int):
+        self.window = window
+        self._samples = deque()
+        self._sorted = []
+
+    def reset(self):
+        self._samples.clear()
+        self._sorted.clear()
+
+    def update(self, value:float) -> float:
+        samples = self._samples
+        ordered = self._sorted
+        if len(samples) == self.window:
+            del ordered[bisect_left(ordered, samples.popleft())]
+        samples.append(value)
+        insort(ordered, value)
+        middle = len(ordered) // 2
+        if len(ordered) & 1:
+            return float(ordered[middle])
+        return (ordered[middle-1] + ordered[middle]) / 2
+
+    def apply(self, values) -> "np.ndarray":
+        """ Batch mode: returns the outputs for values (from the initial
+        state, the state of the object is not changed) """
+        import numpy as np
+        values = np.asarray(values, dtype=np.float64)
+        outputs = np.empty_like(values)
+        head = min(self.window - 1, values.size)
+        for index in range(head):
+            outputs[index] = np.median(values[:index+1])
+        if values.size >= self.window:
+            outputs[head:] = np.median(np.lib.stride_tricks.
+                sliding_window_view(values, self.window), axis=1)
+        return outputs
+
+class Sentinel_filter():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Sentinel_filter class rejects the error values sent by the car (see
+    CommunMessages: INT16_MIN / UINT16_MAX), the fields which could not be
+    decoded (None) and NaN. A rejected sample is not passed to the next
+    filters of the chain
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - sentinels: tuple of int. Values rejected
+    """
+    def __init__(self, sentinels:tuple=(CommunMessages.INT16_MIN,
+                    CommunMessages.UINT16_MAX)):
+        self.sentinels = tuple(sentinels)
+
+    def reset(self):
+        pass
+
+    def update(self, value:float) -> float:
+        """ Returns value, or None if it is rejected """
+        if value is None or value != value or value in self.sentinels:
+            return None
+        return value
+
+    def apply(self, values) -> "np.ndarray":
+        """ Batch mode: returns values with NaN where rejected """
+        import numpy as np
+        values = np.array(values, dtype=np.float64)
+        values[np.isin(values, self.sentinels)] = np.nan
+        return values
+
+class Filter_chain():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Filter_chain class runs the samples of a channel through a list of
+    filters (objects with update, apply and reset, like the ones above).
+    When a filter rejects a sample (None / NaN), the chain outputs its last
+    output again (hold)
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - filters: list. Filters, in order
+    - output: float. Last output (None until a sample gets through)
+    - rejected: int. Samples rejected
+    """
+    def __init__(self, filters:list):
+        self.filters = list(filters)
+        self.output = None
+        self.rejected = 0
+
+    def reset(self):
+        for my_filter in self.filters:
+            my_filter.reset()
+        self.output = None
+        self.rejected = 0
+
+    def update(self, value:float) -> float:
+        for my_filter in self.filters:
+            value = my_filter.update(value)
+            if value is None:
+                self.rejected += 1
+                return self.output
+        self.output = value
+        return value
+
+    def apply(self, values) -> "np.ndarray":
+        """ Batch mode: returns the outputs the chain would give for values
+        sample by sample from the initial state (NaN before the first valid
+        sample). The state of the chain is not changed """
+        import numpy as np
+        values = np.asarray(values, dtype=np.float64)
+        for my_filter in self.filters:
+            valid = ~np.isnan(values)
+            filtered = np.full(values.shape, np.nan)
+            filtered[valid] = my_filter.apply(values[valid])
+            values = filtered
+        # Hold the last output on rejected samples (index of the last valid
+        # sample at or before each one)
+        positions = np.where(np.isnan(values), 0, np.arange(values.size))
+        np.maximum.accumulate(positions, out=positions)
+        return values[positions]     # Leading rejected samples stay NaN
+
+class Channel_filters():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Channel_filters class holds one Filter_chain per channel (attribute of
+    CommunMessages.Message_struct_in) and filters every message decoded
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - chains: dict. {channel: Filter_chain}
+    - outputs: dict. {channel: last output (None if no valid sample yet)}
+    """
+    def __init__(self, chains:dict):
+        self.chains = chains
+        self.outputs = {name: None for name in chains}
+
+    def reset(self):
+        for name, chain in self.chains.items():
+            chain.reset()
+            self.outputs[name] = None
+
+    def update(self, message:CommunMessages.Message_struct_in) -> dict:
+        """ Filters the channels of message and returns outputs (fields in
+        error are rejected, as in apply) """
+        outputs = self.outputs
+        err = message.err
+        for name, chain in self.chains.items():
+            if err and err & CommunMessages.incoming_err_mask_dic[name]:
+                outputs[name] = chain.update(None)
+            else:
+                outputs[name] = chain.update(getattr(message, name))
+        return outputs
+
+    def apply(self, decoded:"np.ndarray") -> dict:
+        """
+        Batch mode: filters the messages returned by
+        CommunMessages.decode_in_messages (fields in error are rejected)
+
+        :return: {channel: outputs (np.ndarray, float64)}
+        :rtype: (dict)
+        """
+        import numpy as np
+        errors = decoded[CommunMessages.MESSAGE_IN_ERR_COLUMN]
+        outputs = {}
+        for name, chain in self.chains.items():
+            values = decoded[name].astype(np.float64)
+            values[errors & CommunMessages.incoming_err_mask_dic[name] != 0] = \
+                np.nan
+            outputs[name] = chain.apply(values)
+        return outputs
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def new_telemetry_filters() -> Channel_filters:
+    """ Returns the filters of the telemetry panel: distances (sentinel,
+    median, EMA) and wheel speeds (sentinel, EMA) """
+    def distance():
+        return Filter_chain([Sentinel_filter((CommunMessages.UINT16_MAX,)),
+            Median_filter(MEDIAN_WINDOW_DIST), Ema_filter(EMA_ALPHA_DIST)])
+    def speed():
+        return Filter_chain([Sentinel_filter((CommunMessages.INT16_MIN,)),
+            Ema_filter(EMA_ALPHA_SPEED)])
+    return Channel_filters({"ldist_mm": distance(), "rdist_mm": distance(),
+        "lspeed_rpm": speed(), "rspeed_rpm": speed()})
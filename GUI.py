@@ -13,8 +13,16 @@
 import PySimpleGUI as sg
 from GUI_constants import *
 import CommunMessages
+import Filters
+import Latency
+import LinkMonitor
+import operator
+import Server
+from SharedSlot import Latest_value_slot
+import TelemetryBuffer
+import threading
 import time
-from multiprocessing import Queue
+from multiprocessing import Event
 from typing import Tuple
 
 #==============================================================================
@@ -24,13 +32,200 @@ from typing import Tuple
 DEBUG = False
 TIMEOUT_GUI_MS = 100
 TIMEOUT_SERVER_MS = 2*TIMEOUT_GUI_MS    # Time above server lag is considered
+STATS_REFRESH_MS = 1000     # Period of refresh of the latency figures shown
+RENDER_MAX_FPS = 30         # Max repaints per second, whatever the telemetry
+                            # rate
+CTRL_INPUT_KEYS = (CTRL_MAN_OX_IN_KEY, CTRL_MAN_OY_IN_KEY, 
+    CTRL_AUT_OX_IN_KEY, CTRL_AUT_OY_IN_KEY)
+# Automatic mode speeds accepted: what both wire formats can carry (5 ASCII 
+# chars, int16)
+AUT_SPEED_MIN = max(CommunMessages.OUT_VALUE_MIN, -32767)
+AUT_SPEED_MAX = min(CommunMessages.OUT_VALUE_MAX, 32767)
+READER_POLL_SEC = 0.001     # Telemetry_reader: time between checks of the slot
+TLMT_FRAME_EVENT = "TLMT_FRAME"     # Event sent by Telemetry_reader
+PLOT_REFRESH_MS = 200       # Period of redraw of the plots (when visible)
+PLOT_MAX_POINTS = 2*PLOT_SIZE[0]    # Points per line (min and max of each 
+                                    # pixel column)
+PLOT_MARGIN_PX = 12         # Space above and below the lines
+# Channels of the telemetry history (attributes of Message_struct_in)
+RING_CHANNELS = ("linspeed_mms", "lspeed_rpm", "rspeed_rpm", "ldist_mm",
+    "rdist_mm")
+# Telemetry fields shown as received: (widget key, attribute of 
+# Message_struct_in). The wheel speeds and distances may be filtered
+TLMT_FIELDS = ((TLMT_MAN_OY_OUT_KEY, "manctrly_perc"),
+    (TLMT_MAN_OX_OUT_KEY, "manctrlx_perc"),
+    (TLMT_AUT_OY_OUT_KEY, "autctrl_speedy_mms"),
+    (TLMT_AUT_OX_OUT_KEY, "autctrl_speedx_mms"),
+    (TLMT_LINSP_OUT_KEY, "linspeed_mms"))
+TLMT_FILTERED_FIELDS = ((TLMT_WHESP_L_OUT_KEY, "lspeed_rpm"),
+    (TLMT_WHESP_R_OUT_KEY, "rspeed_rpm"),
+    (TLMT_DIST_L_OUT_KEY, "ldist_mm"),
+    (TLMT_DIST_R_OUT_KEY, "rdist_mm"))
+# Plots: (Graph key, title, channels drawn)
+PLOTS = ((PLOT_SPEED_KEY, PLOT_SPEED_TEXT, ("linspeed_mms",)),
+    (PLOT_WHEELS_KEY, PLOT_WHEELS_TEXT, ("lspeed_rpm", "rspeed_rpm")),
+    (PLOT_DIST_KEY, PLOT_DIST_TEXT, ("ldist_mm", "rdist_mm")))
+
+_ring_getter = operator.attrgetter(*RING_CHANNELS)
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Widget_renderer():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Widget_renderer class stands between gui_main and the widgets: set() only
+    stores the state wanted for a widget and flush() pushes to Tk the 
+    properties that differ from the ones displayed, at most max_fps times per
+    second. A widget set several times between two flushes is updated once.
+    Only for widgets the user can not modify (displayed values are cached).
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - max_fps: float. Max flushes per second
+    - updates_pushed: int. Widget updates pushed to Tk
+    - updates_skipped: int. set() calls not pushed (same state as the one 
+    displayed or replaced by a newer one before the flush)
+    """
+    def __init__(self, window:sg.Window, max_fps:float=RENDER_MAX_FPS):
+        self._window = window
+        self.max_fps = max_fps
+        self._period_ns = int(1e9 / max_fps)
+        self._time_last_flush_ns = 0
+        self._shown = {}    # key: {property: value} displayed
+        self._pending = {}  # key: {property: value} to display
+        self.updates_pushed = 0
+        self.updates_skipped = 0
+
+    def set(self, key:str, **properties):
+        """ Sets the state wanted for widget key (properties of update()) """
+        pending = self._pending.get(key)
+        if pending is None:
+            shown = self._shown.get(key)
+            if shown is not None and all(name in shown and 
+                    shown[name] == value for name, value in properties.items()):
+                self.updates_skipped += 1   # Already displayed
+                return
+            self._pending[key] = properties
+        else:
+            pending.update(properties)
+            self.updates_skipped += 1
+
+    def ms_to_next_flush(self) -> int:
+        """ Returns the time (ms) until the pending updates can be pushed, 
+        None if there is nothing pending """
+        if not self._pending:
+            return None
+        remaining_ns = self._period_ns - \
+            (time.monotonic_ns() - self._time_last_flush_ns)
+        return max(0, -(-remaining_ns // 1000000))
+
+    def flush(self) -> bool:
+        """
+        Pushes the pending changes if 1/max_fps elapsed since the last flush
+
+        :return: True if the pending updates were handled
+        :rtype: (bool)
+        """
+        if not self._pending:
+            return False
+        now = time.monotonic_ns()
+        if now - self._time_last_flush_ns < self._period_ns:
+            return False
+        self._time_last_flush_ns = now
+        for key, properties in self._pending.items():
+            shown = self._shown.setdefault(key, {})
+            changed = {name: value for name, value in properties.items()
+                if name not in shown or shown[name] != value}
+            if changed:
+                self._window[key].update(**changed)
+                shown.update(changed)
+                self.updates_pushed += 1
+            else:
+                self.updates_skipped += 1
+        self._pending.clear()
+        return True
+
+class Telemetry_reader(threading.Thread):
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Telemetry_reader class is a background thread of the GUI process which 
+    watches the slot of the selected car and wakes the event loop of the 
+    window (write_event_value with TLMT_FRAME_EVENT) as soon as a frame 
+    arrives. Frames arriving before the event loop takes the previous one 
+    are merged: only the newest is kept and a single event is pending.
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - car_id: int. Car whose slot is watched (can be changed at any time)
+    - frames_read: int. Frames taken from the slot
+    - frames_merged: int. Frames replaced by a newer one before being taken
+    """
+    def __init__(self, window:sg.Window, slot_from_car:Latest_value_slot, 
+                    car_id:int=1):
+        super().__init__(daemon=True)
+        self._window = window
+        self._slot_from_car = slot_from_car
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._latest = None     # (car_id, frame, stamps, time_dequeue_ns)
+        self._event_pending = False
+        self.car_id = car_id
+        self.frames_read = 0
+        self.frames_merged = 0
+
+    def run(self):
+        slot_from_car = self._slot_from_car
+        while not self._stop_event.is_set():
+            car_id = self.car_id
+            frame = slot_from_car.read_new(car_id)
+            if frame is None:
+                self._stop_event.wait(READER_POLL_SEC)
+                continue
+            latest = (car_id, frame, slot_from_car.last_stamps[car_id], 
+                time.monotonic_ns())
+            with self._lock:
+                if self._latest is not None:
+                    self.frames_merged += 1
+                self._latest = latest
+                self.frames_read += 1
+                wake_up = not self._event_pending
+                self._event_pending = True
+            if wake_up:
+                self._window.write_event_value(TLMT_FRAME_EVENT, None)
+
+    def take(self) -> tuple:
+        """
+        Returns the newest frame not taken yet, if any
+
+        :return: (car ID, frame, stamps of the slot, time.monotonic_ns() when
+        it was read from the slot) or None
+        :rtype: (tuple)
+        """
+        with self._lock:
+            latest = self._latest
+            self._latest = None
+            self._event_pending = False
+        return latest
+
+    def stop(self):
+        """ Stops the thread and waits for it """
+        self._stop_event.set()
+        self.join()
 
 #==============================================================================
 # Function definitions
 #==============================================================================
 
 def _time_now_ms() -> int:
-    return int(0.000001*time.time_ns())
+    return int(0.000001*time.monotonic_ns())
 
 def _gui_init_layout_windows() -> Tuple[list, sg.Window]:
     """
@@ -43,7 +238,13 @@ def _gui_init_layout_windows() -> Tuple[list, sg.Window]:
     layout = [
         # Connection
         [ sg.Text(CONNECTION_TEXT, size=SIZE3, pad=PAD_HDR1, justification='c', background_color=HDR_COL, font=FONT2) ],
+        [ sg.Text(CONNECTION_CAR_TEXT, size=SIZE1, pad=PAD2, justification='r'),
+          sg.Combo(list(range(1, Server.MAX_CARS+1)), default_value=1, size=SIZE2, pad=PAD2, key=CONNECTION_CAR_KEY, font=FONT, readonly=True),
+          sg.Button(button_text=CONNECTION_STATS_BUT_TEXT, pad=PAD2, key=CONNECTION_STATS_BUT_KEY, font=FONT)
+        ],
         [ sg.Text(CONNECTION_ST_TEXT, pad=PAD4, size=SIZE5, justification='c', key=CONNECTION_ST_KEY) ],
+        [ sg.Text(CONNECTION_LINK_TEXT, pad=PAD4, size=SIZE6, justification='c', key=CONNECTION_LINK_KEY) ],
+        [ sg.pin(sg.Text("", pad=PAD4, font=FONT3, key=CONNECTION_STATS_OUT_KEY, visible=False)) ],
         
         # Control
         [ sg.Text(CTRL_TEXT, size=SIZE3,pad=PAD_HDR2, justification='c', background_color=HDR_COL, font=FONT2) ],
@@ -64,10 +265,13 @@ def _gui_init_layout_windows() -> Tuple[list, sg.Window]:
           sg.Text(CTRL_AUT_OY_TEXT, pad=PAD5, justification='l', font=FONT),   
           sg.Input(size=SIZE2, pad=PAD2, justification='l', key=CTRL_AUT_OY_IN_KEY, font=FONT, disabled_readonly_background_color='grey')
         ],
-        [ sg.Button(button_text=CTRL_SEND_BUT_TEXT, size=SIZE4, pad=PAD3, key=CTRL_SEND_BUT_KEY, font=FONT) ],
+        [ sg.Button(button_text=CTRL_SEND_BUT_TEXT, size=SIZE4, pad=PAD3, key=CTRL_SEND_BUT_KEY, font=FONT),
+          sg.Checkbox(CTRL_STREAM_TEXT, pad=PAD6, key=CTRL_STREAM_KEY, font=FONT)
+        ],
         
         # Telemetry
         [ sg.Text(TLMT_TEXT, size=SIZE3,pad=PAD_HDR2, justification='c', background_color=HDR_COL, font=FONT2) ],
+        [ sg.Checkbox(TLMT_FILTER_TEXT, pad=PAD2, key=TLMT_FILTER_KEY, font=FONT) ],
         [ sg.Text(TLMT_WORKM_TEXT, size=SIZE1,pad=PAD2, justification='r'),
           sg.Text(TLMT_WORKM_OUT_TEXT, size=SIZE1, pad=PAD2, justification='l', key=TLMT_WORKM_OUT_KEY)
         ],
@@ -98,13 +302,21 @@ def _gui_init_layout_windows() -> Tuple[list, sg.Window]:
           sg.Text(TLMT_DIST_R_TEXT, pad=PAD5, justification='l', font=FONT),
           sg.Text(size=SIZE2, pad=PAD2, justification='l', key=TLMT_DIST_R_OUT_KEY, font=FONT)
         ],
-        [   
+
+        # Trends
+        [ sg.Text(PLOT_TEXT, size=SIZE3,pad=PAD_HDR2, justification='c', background_color=HDR_COL, font=FONT2) ],
+        [ sg.Checkbox(PLOT_SHOW_TEXT, pad=PAD2, key=PLOT_SHOW_KEY, font=FONT, enable_events=True),
+          sg.Text(PLOT_SPAN_TEXT, pad=PAD5, justification='l', font=FONT),
+          sg.Combo(PLOT_SPANS_SEC, default_value=PLOT_SPANS_SEC[0], size=SIZE2, pad=PAD5, key=PLOT_SPAN_KEY, font=FONT, readonly=True)
         ],
+        [ sg.pin(sg.Column([
+            [ sg.Graph(PLOT_SIZE, (0, 0), PLOT_SIZE, pad=PAD4, background_color=PLOT_BG_COL, key=key) ]
+            for key, _, _ in PLOTS], key=PLOT_COLUMN_KEY, visible=False)) ],
     ]
     # sg.theme("DarkBlue")
     sg.set_options(font=('Courier New', 12))
     window = sg.Window(WINDOW_TEXT, layout, margins=WINDOW_MARGIN)
-    window.finalize = True
+    window.finalize()   # Ready for write_event_value before the reader starts
     return layout, window
 
 def _control_update(window: sg.Window, manual_enabled:bool, auto_enabled:bool):
@@ -126,7 +338,8 @@ def _control_update(window: sg.Window, manual_enabled:bool, auto_enabled:bool):
         window[CTRL_AUT_OX_IN_KEY].update(disabled=True, value='')
         window[CTRL_AUT_OY_IN_KEY].update(disabled=True, value='')
 
-def _send_message(window:sg.Window, queue_2_car:Queue(1)):
+def _send_message(window:sg.Window, slot_2_car:Latest_value_slot, 
+        car_id:int):
     # Create message with current parameters to send
     workmode_str = ""
     manctrly_perc = 0
@@ -145,17 +358,118 @@ def _send_message(window:sg.Window, queue_2_car:Queue(1)):
         autctrl_speedy_mms = int(window[CTRL_AUT_OY_IN_KEY].get())
         autctrl_speedx_mms = int(window[CTRL_AUT_OX_IN_KEY].get())
     workmode_id = CommunMessages.get_workmode_id(workmode_str)
-    out_raw = CommunMessages.Message_struct_out(workmode_id,
-        manctrly_perc, manctrlx_perc,
-        autctrl_speedy_mms, autctrl_speedx_mms)
-    # Get message formatted
-    out_formatted = out_raw.get_output_format()
-    # Empty queue if full and push new message
-    if (queue_2_car.full() == True):
-        queue_2_car.empty()  # Only most recent data is valid
-    queue_2_car.put(out_formatted)
+    # Get message formatted (bytes, only formatted the first time a command
+    # is seen). A value out of the field range is not sent at all
+    try:
+        out_formatted = CommunMessages.encode_out_message(workmode_id,
+            manctrly_perc, manctrlx_perc,
+            autctrl_speedy_mms, autctrl_speedx_mms)
+    except ValueError:
+        if (DEBUG): print("GUI: message out of range not sent")
+        return
+    # Overwrite any message not sent yet (only most recent data is valid).
+    # Copied into the shared memory, the server sends it as it is
+    slot_2_car.write(out_formatted, car_id)
     if (DEBUG): print("GUI: message sent")
 
+def _record_latency(latency_stats:Latency.Latency_stats, stamps:tuple,
+        time_dequeue_ns:int, time_decode_ns:int, time_update_ns:int):
+    """ Records the latency of every stage of a frame. stamps are the recv 
+    and enqueue times written by the server with the frame """
+    time_rx_ns, time_enqueue_ns = stamps
+    if time_rx_ns == 0:
+        return      # Not stamped (replay)
+    latency_stats.record(Latency.STAGE_ENQUEUE_DEQUEUE, 
+        time_dequeue_ns - time_enqueue_ns)
+    latency_stats.record(Latency.STAGE_DEQUEUE_DECODE, 
+        time_decode_ns - time_dequeue_ns)
+    latency_stats.record(Latency.STAGE_DECODE_UPDATE, 
+        time_update_ns - time_decode_ns)
+    latency_stats.record(Latency.STAGE_RECV_UPDATE, 
+        time_update_ns - time_rx_ns)
+
+def _stats_str(latency_stats:Latency.Latency_stats, 
+        renderer:Widget_renderer) -> str:
+    """ Returns the text of the stats view: latency of each stage and 
+    widget updates """
+    stats_str = "" if latency_stats is None else \
+        latency_stats.format_table() + "\n"
+    return stats_str + "widget updates: {} pushed, {} skipped".format(
+        renderer.updates_pushed, renderer.updates_skipped)
+
+def _connected_str(latency_stats:Latency.Latency_stats) -> str:
+    """ Returns the connection status with the measured socket to screen 
+    latency """
+    if latency_stats is None:
+        return "Connected"
+    p50, p99 = latency_stats.percentiles(Latency.STAGE_RECV_UPDATE)
+    if p50 is None:
+        return "Connected"
+    return "Connected. Latency p50 {:.1f} ms, p99 {:.1f} ms".format(
+        p50/1e6, p99/1e6)
+
+def _ring_values(message:CommunMessages.Message_struct_in) -> tuple:
+    """ Returns the values of RING_CHANNELS in message (None if error) """
+    err = message.err
+    if not err:
+        return _ring_getter(message)
+    return tuple(None if err & CommunMessages.incoming_err_mask_dic[name]
+        else getattr(message, name) for name in RING_CHANNELS)
+
+def _show_fields(renderer:Widget_renderer, 
+        message:CommunMessages.Message_struct_in, fields:tuple):
+    """ Shows the value of the fields of message, "Error" for those whose bit
+    is set in message.err (a single test if the message is valid) """
+    err = message.err
+    for key, name in fields:
+        if err and err & CommunMessages.incoming_err_mask_dic[name]:
+            renderer.set(key, value="Error")
+        else:
+            renderer.set(key, value=getattr(message, name))
+
+def _filtered_str(value:float):
+    """ Returns a filter output as shown in the telemetry panel """
+    return "Error" if value is None else round(value)
+
+def _draw_plot(graph:sg.Graph, title:str, ring:TelemetryBuffer.Telemetry_ring,
+        names:tuple, time_to_ns:int, span_sec:float):
+    """
+    Draws the last span_sec of the channels names of ring, each one reduced 
+    to PLOT_MAX_POINTS points (min/max decimation), so the cost does not 
+    depend on the number of samples in the window
+
+    :param time_to_ns: time at the right edge of the plot
+    """
+    width, height = PLOT_SIZE
+    span_ns = int(span_sec*1e9)
+    time_from_ns = time_to_ns - span_ns
+    lines = []
+    for name in names:
+        times_ns, values = ring.get(name, time_from_ns)
+        valid = values == values    # Not NaN
+        lines.append(TelemetryBuffer.downsample_minmax(times_ns[valid], 
+            values[valid], PLOT_MAX_POINTS))
+    graph.erase()
+    graph.draw_text(title, (width//2, height-PLOT_MARGIN_PX//2), 
+        color=PLOT_TEXT_COL, font=FONT)
+    values_all = [values for _, values in lines if values.size]
+    if not values_all:
+        return
+    value_min = min(float(values.min()) for values in values_all)
+    value_max = max(float(values.max()) for values in values_all)
+    scale = (height - 2*PLOT_MARGIN_PX) / max(value_max - value_min, 1)
+    for (times_ns, values), color in zip(lines, PLOT_COLS):
+        if values.size < 2:
+            continue
+        points_x = (times_ns - time_from_ns) * (width / span_ns)
+        points_y = PLOT_MARGIN_PX + (values - value_min)*scale
+        graph.draw_lines(list(zip(points_x.tolist(), points_y.tolist())), 
+            color=color)
+    graph.draw_text("{:g}".format(value_max), (2, height-PLOT_MARGIN_PX), 
+        color=PLOT_TEXT_COL, font=FONT, text_location=sg.TEXT_LOCATION_LEFT)
+    graph.draw_text("{:g}".format(value_min), (2, PLOT_MARGIN_PX), 
+        color=PLOT_TEXT_COL, font=FONT, text_location=sg.TEXT_LOCATION_LEFT)
+
 def _str_is_number(str:str) -> bool:
     """ Returns True if str represents number or False otherwise """
     try:
@@ -184,8 +498,8 @@ def _check_input(window:sg.Window) -> bool:
         if (_str_is_number(ox_str) and _str_is_number(oy_str)):
             ox_nb = int(ox_str)
             oy_nb = int(oy_str)
-            if (ox_nb >= -32767 and ox_nb <= 32767 and 
-                    oy_nb >= -32767 and oy_nb <= 32767):
+            if (ox_nb >= AUT_SPEED_MIN and ox_nb <= AUT_SPEED_MAX and 
+                    oy_nb >= AUT_SPEED_MIN and oy_nb <= AUT_SPEED_MAX):
                 status_is_ok = True        
     return status_is_ok
 
@@ -193,69 +507,183 @@ def _check_input(window:sg.Window) -> bool:
 # Main flow
 #----------------------------------------------------------------------
 
-def gui_main( queue_2_car:Queue(1), queue_from_car:Queue(1), 
-              queue_exit:Queue(1) ):
+def gui_main( slot_2_car:Latest_value_slot, slot_from_car:Latest_value_slot, 
+              event_exit:Event, 
+              latency_stats:Latency.Latency_stats=None,
+              slot_link_stats:Latest_value_slot=None ):
     """ Handles all the GUI behaviour, updates data from the car and sends
-    to the car control data introduced by the user """
+    to the car control data introduced by the user. If latency_stats is 
+    given, the latency of every frame displayed is recorded there (stages 
+    enqueue->dequeue to recv->update) and shown in the Last connection 
+    section. If slot_link_stats is given (see Server.run_server), the link 
+    statistics of the selected car are shown there too. The telemetry of the
+    selected car is kept in a Telemetry_ring and plotted (Trends section) 
+    every PLOT_REFRESH_MS while the plots are shown. The wheel speeds and 
+    distances go through Filters.new_telemetry_filters, whose outputs are 
+    shown instead of the raw values if the filter checkbox is ticked. 
+    Widgets are updated through a Widget_renderer, so only changes are 
+    pushed to Tk and at most RENDER_MAX_FPS times per second """
     layout, window = _gui_init_layout_windows()
+    renderer = Widget_renderer(window)
+    reader = Telemetry_reader(window, slot_from_car)
+    reader.start()
     time_ms_from_last_update = 0
     time_ms_last_update = _time_now_ms()
+    rx_message = None   # Reused for every incoming message once allocated
+    rx_stamps = None    # Stamps of the frame waiting to be displayed
+    connected_str = _connected_str(latency_stats)
+    stats_visible = False
+    time_ms_last_stats = _time_now_ms()
+    ring = TelemetryBuffer.Telemetry_ring(RING_CHANNELS)
+    plots_drawn = None  # (samples, span) plotted last time
+    time_ms_last_plot = 0
+    telemetry_filters = Filters.new_telemetry_filters()
+    car_id_last = None
+    workmode_last = None
+    control_last = None
+    input_is_valid = False
     while True:
-        # Update user events
-        event, values = window.read(timeout=TIMEOUT_SERVER_MS)
+        # Wait for user events or telemetry (Telemetry_reader), waking up in 
+        # time for the next repaint and for the connection timeouts
+        timeout_ms = TIMEOUT_SERVER_MS
+        for timeout_conn_ms in (TIMEOUT_GUI_MS, TIMEOUT_SERVER_MS):
+            remaining_ms = time_ms_last_update + timeout_conn_ms - \
+                _time_now_ms()
+            if remaining_ms > 0:
+                timeout_ms = min(timeout_ms, remaining_ms)
+        flush_ms = renderer.ms_to_next_flush()
+        if flush_ms is not None:
+            timeout_ms = min(timeout_ms, flush_ms)
+        event, values = window.read(timeout=timeout_ms)
         # If user closes the window, send message to all processes
         if event == sg.WINDOW_CLOSED:
-            if (queue_exit.full() == False):  
-                queue_exit.put("UNUSED_DATA")
-        # If message in exit queue, close process
-        if queue_exit.full() == True:
+            event_exit.set()
+        # If exit event set (by any process), close process
+        if event_exit.is_set():
             if DEBUG: print("Exiting from GUI...")
             break
         
+        # Car selected (its ID is the index of its slots)
+        car_id = int(values[CONNECTION_CAR_KEY])
+        reader.car_id = car_id
+        car_changed = car_id != car_id_last
+        car_id_last = car_id
+        if car_changed:
+            ring.clear()
+            telemetry_filters.reset()
+
         # Process info to send to car (Control section)
-        # Check radio button choice
-        if values[CTRL_WORKM_STOP_IN_KEY]:
-            _control_update(window, False, False)
-        elif values[CTRL_WORKM_MAN_IN_KEY]:
-            _control_update(window, True, False)
-        elif values[CTRL_WORKM_AUT_IN_KEY]:
-            _control_update(window, False, True)
-        # Update button status and check input
-        input_is_valid = _check_input(window)
+        # Check radio button choice (inputs only touched when it changes)
+        workmode = (values[CTRL_WORKM_STOP_IN_KEY], 
+            values[CTRL_WORKM_MAN_IN_KEY], values[CTRL_WORKM_AUT_IN_KEY])
+        if workmode != workmode_last:
+            workmode_last = workmode
+            if values[CTRL_WORKM_STOP_IN_KEY]:
+                _control_update(window, False, False)
+            elif values[CTRL_WORKM_MAN_IN_KEY]:
+                _control_update(window, True, False)
+            elif values[CTRL_WORKM_AUT_IN_KEY]:
+                _control_update(window, False, True)
+        # Check input again only if anything in the Control section changed
+        control = workmode + tuple(values[key] for key in CTRL_INPUT_KEYS) \
+            + (values[CTRL_STREAM_KEY],)
+        control_changed = control != control_last
+        if control_changed:
+            control_last = control
+            input_is_valid = _check_input(window)
+        # Send if button pressed, or on any valid change if "Send on change" 
+        # is ticked (the server streams the latest command to the car)
         server_is_ok = True if time_ms_from_last_update < TIMEOUT_SERVER_MS else False
-        if input_is_valid and server_is_ok:
-            window[CTRL_SEND_BUT_KEY].update(disabled=False)
-        else:
-            window[CTRL_SEND_BUT_KEY].update(disabled=True)
-        # Send if button pressed
-        if event == CTRL_SEND_BUT_KEY:
-            _send_message(window, queue_2_car)
+        if event == CTRL_SEND_BUT_KEY or (values[CTRL_STREAM_KEY] and 
+                control_changed and input_is_valid and server_is_ok):
+            _send_message(window, slot_2_car, car_id)
+        # Show / hide the latency of each stage
+        if event == CONNECTION_STATS_BUT_KEY:
+            stats_visible = not stats_visible
+            renderer.set(CONNECTION_STATS_OUT_KEY, 
+                value=_stats_str(latency_stats, renderer), 
+                visible=stats_visible)
         
         # Update info coming from car (Telemetry section) and Last connection
-        if (queue_from_car.empty() == False):
-            message = CommunMessages.decode_in_message(queue_from_car.get())
+        latest = reader.take()
+        if latest is not None and latest[0] == car_id:
+            _, frame, stamps, time_dequeue_ns = latest
+            message = CommunMessages.decode_frame(frame, rx_message)
+            time_decode_ns = time.monotonic_ns()
             if message != None:
-                window[TLMT_WORKM_OUT_KEY].Update(message.get_workmode_str() if message.workmode_err==False else "Error")
-                window[TLMT_MAN_OY_OUT_KEY].Update(message.manctrly_perc if message.manctrly_err==False else "Error")
-                window[TLMT_MAN_OX_OUT_KEY].Update(message.manctrlx_perc if message.manctrlx_err==False else "Error")
-                window[TLMT_AUT_OY_OUT_KEY].Update(message.autctrl_speedy_mms if message.autctrl_speedy_err==False else "Error")
-                window[TLMT_AUT_OX_OUT_KEY].Update(message.autctrl_speedx_mms if message.autctrl_speedx_err==False else "Error")
-                window[TLMT_LINSP_OUT_KEY].Update(message.linspeed_mms if message.linspeed_err==False else "Error")
-                window[TLMT_WHESP_L_OUT_KEY].Update(message.lspeed_rpm if message.lspeed_err==False else "Error")
-                window[TLMT_WHESP_R_OUT_KEY].Update(message.rspeed_rpm if message.rspeed_err==False else "Error")
-                window[TLMT_DIST_L_OUT_KEY].Update(message.ldist_mm if message.ldist_err==False else "Error")
-                window[TLMT_DIST_R_OUT_KEY].Update(message.rdist_mm if message.rdist_err==False else "Error")
-            window[CONNECTION_ST_KEY].Update(
-                value = "Connected < " + str(TIMEOUT_GUI_MS) + "ms",
+                rx_message = message
+                renderer.set(TLMT_WORKM_OUT_KEY, value=message.get_workmode_str() if message.workmode_err==False else "Error")
+                _show_fields(renderer, message, TLMT_FIELDS)
+                filtered = telemetry_filters.update(message)
+                if values[TLMT_FILTER_KEY]:
+                    renderer.set(TLMT_WHESP_L_OUT_KEY, value=_filtered_str(filtered["lspeed_rpm"]))
+                    renderer.set(TLMT_WHESP_R_OUT_KEY, value=_filtered_str(filtered["rspeed_rpm"]))
+                    renderer.set(TLMT_DIST_L_OUT_KEY, value=_filtered_str(filtered["ldist_mm"]))
+                    renderer.set(TLMT_DIST_R_OUT_KEY, value=_filtered_str(filtered["rdist_mm"]))
+                else:
+                    _show_fields(renderer, message, TLMT_FILTERED_FIELDS)
+                rx_stamps = (stamps, time_dequeue_ns, time_decode_ns)
+                ring.append(stamps[0] or time_dequeue_ns, 
+                    _ring_values(message))
+            time_ms_last_update = time_dequeue_ns // 1000000
+        time_ms_from_last_update = _time_now_ms() - time_ms_last_update
+        if slot_link_stats is not None:
+            # Link statistics of the car (all of them again if it changed)
+            if car_changed:
+                link_stats = slot_link_stats.read(car_id)
+            else:
+                link_stats = slot_link_stats.read_new(car_id)
+            if link_stats is not None:
+                renderer.set(CONNECTION_LINK_KEY, value=LinkMonitor.format_stats(
+                    LinkMonitor.unpack_stats(link_stats)))
+            elif car_changed:
+                renderer.set(CONNECTION_LINK_KEY, value=CONNECTION_LINK_TEXT)
+        if time_ms_from_last_update < TIMEOUT_GUI_MS:
+            renderer.set(CONNECTION_ST_KEY, 
+                value = connected_str,
                 text_color = "white")
-            time_ms_from_last_update = 0
-            time_ms_last_update = _time_now_ms()
         else:
-            time_ms_from_last_update = _time_now_ms() - time_ms_last_update
             my_str = "Disconnected. " + str(time_ms_from_last_update) + " ms ago"
-            window[CONNECTION_ST_KEY].Update(
+            renderer.set(CONNECTION_ST_KEY, 
                 value = my_str,
                 text_color = "red")
+        # Update button status
+        server_is_ok = True if time_ms_from_last_update < TIMEOUT_SERVER_MS else False
+        renderer.set(CTRL_SEND_BUT_KEY, 
+            disabled=not (input_is_valid and server_is_ok))
+
+        # Refresh the latency figures
+        if _time_now_ms() - time_ms_last_stats >= STATS_REFRESH_MS:
+            time_ms_last_stats = _time_now_ms()
+            connected_str = _connected_str(latency_stats)
+            if stats_visible:
+                renderer.set(CONNECTION_STATS_OUT_KEY, 
+                    value=_stats_str(latency_stats, renderer))
+
+        # Plots (drawn directly, only if visible and anything changed)
+        if event == PLOT_SHOW_KEY:
+            renderer.set(PLOT_COLUMN_KEY, visible=values[PLOT_SHOW_KEY])
+        plots = (ring.samples_appended, values[PLOT_SPAN_KEY])
+        if values[PLOT_SHOW_KEY] and plots != plots_drawn and \
+                _time_now_ms() - time_ms_last_plot >= PLOT_REFRESH_MS:
+            time_ms_last_plot = _time_now_ms()
+            plots_drawn = plots
+            time_to_ns = ring.latest_time_ns() or time.monotonic_ns()
+            for key, title, names in PLOTS:
+                _draw_plot(window[key], title, ring, names, time_to_ns, 
+                    float(values[PLOT_SPAN_KEY]))
+
+        # Repaint (if due)
+        if renderer.flush() and rx_stamps is not None:
+            if latency_stats is not None:
+                _record_latency(latency_stats, *rx_stamps, 
+                    time.monotonic_ns())
+            rx_stamps = None
 
     # If infinite loop is broken, close window and finalise
-    window.close()
\ No newline at end of file
+    reader.stop()
+    if DEBUG: print("GUI: {} widget updates pushed, {} skipped".format(
+        renderer.updates_pushed, renderer.updates_skipped))
+    if DEBUG: print("GUI: {} frames read, {} merged".format(
+        reader.frames_read, reader.frames_merged))
+    window.close()
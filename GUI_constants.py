@@ -22,6 +22,13 @@ WINDOW_TEXT = "Robocar control"
 CONNECTION_TEXT = "Last connection"
 CONNECTION_ST_TEXT = "-"
 CONNECTION_ST_KEY = "CONN_STATUS"
+CONNECTION_CAR_TEXT = "Car ID:"
+CONNECTION_CAR_KEY = "CONN_CAR"
+CONNECTION_STATS_BUT_TEXT = "Latency stats"
+CONNECTION_STATS_BUT_KEY = "CONN_STATS_BUT"
+CONNECTION_STATS_OUT_KEY = "CONN_STATS"
+CONNECTION_LINK_TEXT = "-"
+CONNECTION_LINK_KEY = "CONN_LINK"
 
 CTRL_TEXT = "Control"
 CTRL_WORKM_TEXT = "Workmode:"
@@ -44,8 +51,12 @@ CTRL_AUT_OY_TEXT = "OY:"
 CTRL_AUT_OY_IN_KEY = "CTRL_AUT_INPUT_Y"
 CTRL_SEND_BUT_TEXT = "Send data"
 CTRL_SEND_BUT_KEY = "CTRL_SEND_BUT"
+CTRL_STREAM_TEXT = "Send on change"
+CTRL_STREAM_KEY = "CTRL_STREAM"
 
 TLMT_TEXT = "Telemetry"
+TLMT_FILTER_TEXT = "Filter wheel speeds and distances"
+TLMT_FILTER_KEY = "TLMT_FILTER"
 TLMT_WORKM_TEXT = "Workmode:"
 TLMT_WORKM_OUT_TEXT = "-"
 TLMT_WORKM_OUT_KEY = "TLMT_WORKM_STATUS"
@@ -73,21 +84,42 @@ TLMT_DIST_L_OUT_KEY = "TLMT_DIST_STATUS_L"
 TLMT_DIST_R_TEXT = "right:"
 TLMT_DIST_R_OUT_KEY = "TLMT_DIST_STATUS_R"
 
+PLOT_TEXT = "Trends"
+PLOT_SHOW_TEXT = "Show plots"
+PLOT_SHOW_KEY = "PLOT_SHOW"
+PLOT_SPAN_TEXT = "Last (s):"
+PLOT_SPAN_KEY = "PLOT_SPAN"
+PLOT_SPANS_SEC = (10, 60, 300)
+PLOT_COLUMN_KEY = "PLOT_COLUMN"
+PLOT_SPEED_TEXT = "Linear speed (mm/s)"
+PLOT_SPEED_KEY = "PLOT_SPEED"
+PLOT_WHEELS_TEXT = "Wheel speed (rpm): left, right"
+PLOT_WHEELS_KEY = "PLOT_WHEELS"
+PLOT_DIST_TEXT = "Distance (mm): left, right"
+PLOT_DIST_KEY = "PLOT_DIST"
+
 # General sizes, paddings, colours
 SIZE1 = (18,1)
 SIZE2 = (12,1)
 SIZE3 = (52,1)
 SIZE4 = (25,1)
 SIZE5 = (60,1)
+SIZE6 = (60,2)
+PLOT_SIZE = (520,110)
 PAD1 = ((10,20),(25,0))
 PAD2 = ((10,20),(7,0))
 PAD3 = ((145,0),(20,0))
 PAD4 = ((0,0),(7,0))
 PAD5 = ((10,0),(7,0))
+PAD6 = ((10,0),(20,0))
 PAD_HDR1 = ((0,0),(0,10))
 PAD_HDR2 = ((0,0),(25,10))
 FONT = ("Arial", 10)
 FONT2 = ("Arial", 13)
+FONT3 = ("Courier New", 10)
 WINDOW_MARGIN = (30,60)
 HDR_COL = "Black"
+PLOT_BG_COL = "white"
+PLOT_TEXT_COL = "grey30"
+PLOT_COLS = ("blue", "red")
 
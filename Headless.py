@@ -0,0 +1,97 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: Headless.py
+# Description: telemetry output without GUI (main.py --headless): prints a
+# summary of every car periodically and can log every frame to a CSV file.
+# It must not import GUI nor NumPy
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import csv
+import time
+
+import CommunMessages
+import Server
+from SharedSlot import Latest_value_slot
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+POLL_SEC = 0.005            # Time between checks of the slots
+PRINT_PERIOD_SEC = 1.0      # Time between summaries printed
+
+# Columns of the CSV log (values in incoming_pos_dic order)
+LOG_VALUE_NAMES = [CommunMessages.incoming_name_dic[key] for key in
+    sorted(CommunMessages.incoming_pos_dic,
+        key=CommunMessages.incoming_pos_dic.get)]
+LOG_HEADER = ["time_ns", "car_id"] + LOG_VALUE_NAMES + ["errors"]
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _summary_str(car_id:int, message:CommunMessages.Message_struct_in,
+        nb_frames:int) -> str:
+    """ Returns one line describing the last message of a car """
+    return ("car {}: {}, speed {} mm/s, wheels {}/{} rpm, distance {}/{} mm "
+        "({} frames)").format(car_id, message.get_workmode_str(),
+        message.linspeed_mms, message.lspeed_rpm, message.rspeed_rpm,
+        message.ldist_mm, message.rdist_mm, nb_frames)
+
+def run_telemetry_log(slot_from_car:Latest_value_slot, event_exit,
+        print_period_sec:float=PRINT_PERIOD_SEC, log_path:str=None):
+    """
+    Process entry point replacing GUI.gui_main in headless mode: takes the
+    frames of every car from slot_from_car until event_exit is set
+
+    :param slot_from_car: see Server.run_server
+    :param event_exit: the function finishes when the event is set
+    :type event_exit: (Event) from multiprocessing
+    :param print_period_sec: a summary of the cars which sent frames is
+    printed with this period (0 disables it)
+    :param log_path: if given, every frame taken is appended to this CSV
+    file (see LOG_HEADER, time_ns is the time.monotonic_ns() of reception)
+    """
+    log_file = None
+    log_writer = None
+    if log_path:
+        log_file = open(log_path, "a", newline="")
+        log_writer = csv.writer(log_file)
+        if log_file.tell() == 0:
+            log_writer.writerow(LOG_HEADER)
+    messages = {}       # car_id: last Message_struct_in
+    nb_frames = {}      # car_id: frames taken since the last summary
+    time_print = time.monotonic() + print_period_sec
+    try:
+        while not event_exit.wait(POLL_SEC):
+            for car_id in range(1, Server.MAX_CARS+1):
+                frame = slot_from_car.read_new(car_id)
+                if frame is None:
+                    continue
+                message = CommunMessages.decode_frame(frame,
+                    messages.get(car_id))
+                if message is None:
+                    continue
+                messages[car_id] = message
+                nb_frames[car_id] = nb_frames.get(car_id, 0) + 1
+                if log_writer is not None:
+                    log_writer.writerow([slot_from_car.last_stamps[car_id][0]
+                        or time.monotonic_ns(), car_id] +
+                        [getattr(message, name) for name in LOG_VALUE_NAMES] +
+                        [int(message.err != 0)])
+            if print_period_sec and time.monotonic() >= time_print:
+                time_print += print_period_sec
+                for car_id in sorted(nb_frames):
+                    print(_summary_str(car_id, messages[car_id],
+                        nb_frames[car_id]))
+                nb_frames.clear()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if log_file is not None:
+            log_file.close()
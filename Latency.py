@@ -0,0 +1,242 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: Latency.py
+# Description: per-stage latency histograms shared between processes, to find
+# where the time goes from the socket to the screen
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import json
+from multiprocessing import shared_memory
+import time
+
+from SharedSlot import attach_shared_memory
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+"""
+/* Stages of an incoming frame. Every frame is stamped (time.monotonic_ns) at:
+ *		recv: data returned by socket.recv (Server)
+ *		enqueue: newest frame written to slot_from_car (Server)
+ *		dequeue: frame read from slot_from_car (GUI, Telemetry_reader)
+ *		decode: frame decoded (GUI)
+ *		update: telemetry widgets updated (GUI)
+ * The recv and enqueue stamps travel with the frame in the slot (see
+ * SharedSlot.NB_STAMPS). Each stage is written by one process only.
+ */
+"""
+STAGE_RECV_ENQUEUE = 0      # Reassembly, recording (Server)
+STAGE_ENQUEUE_DEQUEUE = 1   # Slot and wait for the GUI loop
+STAGE_DEQUEUE_DECODE = 2    # Wake-up of the GUI loop, decode_frame (GUI)
+STAGE_DECODE_UPDATE = 3     # PySimpleGUI updates (GUI)
+STAGE_RECV_UPDATE = 4       # Socket to screen
+STAGE_NAMES = ("recv->enqueue", "enqueue->dequeue", "dequeue->decode",
+    "decode->update", "recv->update")
+NB_STAGES = len(STAGE_NAMES)
+
+"""
+/* Histogram (log-linear buckets, relative error below 1/SUB_BUCKETS):
+ *		Bucket 0: values below 2**MIN_OCTAVE ns
+ *		Then SUB_BUCKETS buckets per power of two up to 2**MAX_OCTAVE ns, the
+ *		last bucket also takes bigger values
+ *
+ * Shared memory layout: one block of HIST_WORDS uint64 per stage:
+ *		Word 0: count. Word 1: sum (ns). Word 2: max (ns)
+ *		Words 3-...: buckets
+ *
+ * Lock-free: each stage has a single writer, which updates the bucket, sum,
+ * max and finally the count. Readers never wait and may see a frame counted
+ * in a bucket but not yet in count, which is harmless for statistics.
+ */
+"""
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MIN_OCTAVE = 10             # ~1 us
+MAX_OCTAVE = 36             # ~69 s
+NB_BUCKETS = 1 + (MAX_OCTAVE - MIN_OCTAVE)*SUB_BUCKETS
+_COUNT = 0
+_SUM = 1
+_MAX = 2
+_BUCKETS = 3
+HIST_WORDS = _BUCKETS + NB_BUCKETS
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Latency_stats():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Latency_stats class holds one latency histogram per stage (STAGE_*) in a
+    shared memory block. Recording a value is a few integer operations and
+    never blocks. The object can be passed to other processes (it is attached
+    again by name), so the Server and the GUI write to the same histograms.
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - name: str. Name of the shared memory block
+    """
+    def __init__(self, name:str=None):
+        """
+        :param name: if given, an existing block with this name is attached
+        instead of creating a new one
+        """
+        size = 8*HIST_WORDS*NB_STAGES
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._shm.buf[:size] = bytes(size)
+            self._owner = True
+        else:
+            self._shm = attach_shared_memory(name)
+            self._owner = False
+        self.name = self._shm.name
+        self._words = self._shm.buf[:size].cast('Q')
+
+    def __getstate__(self):
+        return self.name
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def record(self, stage:int, value_ns:int):
+        """
+        Adds a latency to the histogram of stage (to be called only from the
+        process owning the stage)
+
+        :param stage: STAGE_*
+        :param value_ns: latency in ns (negative values count as 0)
+        """
+        if value_ns < 0:
+            value_ns = 0
+        words = self._words
+        base = stage*HIST_WORDS
+        words[base + _BUCKETS + _bucket(value_ns)] += 1
+        words[base + _SUM] += value_ns
+        if value_ns > words[base + _MAX]:
+            words[base + _MAX] = value_ns
+        words[base + _COUNT] += 1
+
+    def count(self, stage:int) -> int:
+        return self._words[stage*HIST_WORDS + _COUNT]
+
+    def max(self, stage:int) -> int:
+        """ Returns the biggest latency recorded (ns) """
+        return self._words[stage*HIST_WORDS + _MAX]
+
+    def percentiles(self, stage:int, percents:tuple=(50, 99)) -> tuple:
+        """
+        Returns the latencies (ns) below which the given percentages of the
+        values recorded fall (upper bound of the bucket, limited to the max).
+        None if nothing was recorded
+
+        :rtype: (tuple of int)
+        """
+        base = stage*HIST_WORDS + _BUCKETS
+        buckets = self._words[base:base+NB_BUCKETS].tolist()
+        total = sum(buckets)
+        if total == 0:
+            return tuple(None for percent in percents)
+        maximum = self.max(stage)
+        results = []
+        for percent in percents:
+            target = max(1, -(-total*percent // 100))
+            accumulated = 0
+            for index, nb_values in enumerate(buckets):
+                accumulated += nb_values
+                if accumulated >= target:
+                    break
+            results.append(min(_bucket_upper(index), maximum))
+        return tuple(results)
+
+    def summary(self) -> dict:
+        """ Returns {stage name: {count, mean_ms, p50_ms, p99_ms, max_ms}} """
+        summary = {}
+        for stage, stage_name in enumerate(STAGE_NAMES):
+            count = self.count(stage)
+            p50, p99 = self.percentiles(stage)
+            summary[stage_name] = {
+                "count": count,
+                "mean_ms": self._words[stage*HIST_WORDS + _SUM] / count / 1e6
+                    if count else None,
+                "p50_ms": p50 / 1e6 if p50 is not None else None,
+                "p99_ms": p99 / 1e6 if p99 is not None else None,
+                "max_ms": self.max(stage) / 1e6 if count else None,
+            }
+        return summary
+
+    def format_table(self) -> str:
+        """ Returns the summary as a text table (one line per stage) """
+        lines = ["{:<17}{:>8}{:>8}{:>8}{:>8}".format("stage (ms)", "count",
+            "p50", "p99", "max")]
+        for stage_name, stats in self.summary().items():
+            if stats["count"]:
+                lines.append("{:<17}{:>8}{:>8.2f}{:>8.2f}{:>8.2f}".format(
+                    stage_name, stats["count"], stats["p50_ms"],
+                    stats["p99_ms"], stats["max_ms"]))
+            else:
+                lines.append("{:<17}{:>8}{:>8}{:>8}{:>8}".format(stage_name,
+                    0, "-", "-", "-"))
+        return "\n".join(lines)
+
+    def dump(self, path:str):
+        """ Writes the summary and the non-empty buckets of every stage to
+        path (JSON) """
+        buckets = {}
+        for stage, stage_name in enumerate(STAGE_NAMES):
+            base = stage*HIST_WORDS + _BUCKETS
+            buckets[stage_name] = {str(_bucket_upper(index)): nb_values
+                for index, nb_values in
+                enumerate(self._words[base:base+NB_BUCKETS].tolist())
+                if nb_values}
+        with open(path, "w") as file:
+            json.dump({
+                "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "summary": self.summary(),
+                "buckets_upper_ns": buckets,
+            }, file, indent=4)
+
+    def __del__(self):
+        # The view must be released before the block can be closed
+        self._words.release()
+
+    def close(self):
+        """ Detaches this object from the shared memory block """
+        self._words.release()
+        self._shm.close()
+
+    def unlink(self):
+        """ Destroys the shared memory block (to be called once, by the
+        process which created it, when no process uses it anymore) """
+        if self._owner:
+            self._shm.unlink()
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _bucket(value_ns:int) -> int:
+    """ Returns the index of the bucket of value_ns """
+    octave = value_ns.bit_length() - 1
+    if octave < MIN_OCTAVE:
+        return 0
+    if octave >= MAX_OCTAVE:
+        return NB_BUCKETS - 1
+    return 1 + (octave - MIN_OCTAVE)*SUB_BUCKETS + \
+        ((value_ns >> (octave - SUB_BUCKET_BITS)) & (SUB_BUCKETS - 1))
+
+def _bucket_upper(index:int) -> int:
+    """ Returns the smallest value (ns) above the bucket index """
+    if index == 0:
+        return 1 << MIN_OCTAVE
+    octave, sub_bucket = divmod(index - 1, SUB_BUCKETS)
+    octave += MIN_OCTAVE
+    return (SUB_BUCKETS + sub_bucket + 1) << (octave - SUB_BUCKET_BITS)
@@ -0,0 +1,199 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: LinkMonitor.py
+# Description: quality of the link with a car: matches every command sent
+# with the first frame echoing it (fields 0-4 of the incoming frames) and
+# tracks command-to-apply latency, inter-arrival time, jitter and gaps
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+from collections import deque
+import math
+import struct
+
+import CommunMessages
+from Stats import percentile
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+LINK_WINDOW = 100           # Samples kept for the rolling statistics
+GAP_FACTOR = 3              # Inter-arrival above GAP_FACTOR times the mean...
+GAP_MIN_MS = 20             # ... and above GAP_MIN_MS is counted as a gap
+JITTER_GAIN = 1/16          # Smoothing of the jitter (as in RFC 3550)
+
+# Echoed command: fields 0-4 are encoded in the same way in the outgoing and
+# in the incoming frames of each wire format, so they are compared as bytes
+_ECHO_ASCII = slice(0, CommunMessages.MESSAGE_OUT_SIZE)
+_ECHO_BIN = slice(len(CommunMessages.BIN_SYNC_MARKER) + 2,
+    CommunMessages.MESSAGE_OUT_BIN_SIZE)
+
+"""
+/* Statistics as packed by Link_monitor.pack (little-endian), to be shared
+ * through a SharedSlot.Latest_value_slot of capacity LINK_STATS_SIZE:
+ *		frames, commands_matched, commands_unmatched, gaps, frames_lost
+ *		(uint64), latency_mean_ms, latency_p50_ms, latency_p99_ms,
+ *		interarrival_ms, jitter_ms (double, NaN if unknown)
+ */
+"""
+LINK_STATS_NAMES = ("frames", "commands_matched", "commands_unmatched",
+    "gaps", "frames_lost", "latency_mean_ms", "latency_p50_ms",
+    "latency_p99_ms", "interarrival_ms", "jitter_ms")
+_STATS_STRUCT = struct.Struct('<5Q5d')
+LINK_STATS_SIZE = _STATS_STRUCT.size
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Link_monitor():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Link_monitor class follows the link with one car. on_command_sent is
+    called for every command sent and on_frame for every frame received: the
+    first frame whose fields 0-4 equal the last command gives its
+    command-to-apply latency. A command sent again unchanged (streaming)
+    keeps the time of its first send; a different command sent before the
+    echo of the previous one counts the previous one as unmatched.
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - frames: int. Frames received
+    - commands_matched / commands_unmatched: int. Commands echoed / replaced
+    before being echoed
+    - gaps: int. Inter-arrival times above GAP_FACTOR times the mean (and
+    GAP_MIN_MS)
+    - frames_lost: int. Frames missing in the sequence numbers (binary wire
+    format only)
+    - jitter_ms: float. Smoothed variation between consecutive inter-arrival
+    times
+    """
+    def __init__(self, window:int=LINK_WINDOW):
+        self._latencies_ms = deque(maxlen=window)
+        self._interarrivals_ms = deque(maxlen=window)
+        self._interarrival_sum_ms = 0.0
+        self._pending_echo = None
+        self._pending_time_ns = None
+        self._last_echo = None      # Command sent last (matched or not)
+        self._time_last_frame_ns = None
+        self._last_interarrival_ms = None
+        self._last_sequence = None
+        self.frames = 0
+        self.commands_matched = 0
+        self.commands_unmatched = 0
+        self.gaps = 0
+        self.frames_lost = 0
+        self.jitter_ms = math.nan
+
+    def on_command_sent(self, data:bytes, time_ns:int):
+        """
+        :param data: command as sent on the wire (any wire format)
+        :param time_ns: time.monotonic_ns() of the send
+        """
+        echo = echo_key(data)
+        if echo == self._last_echo:
+            return      # Same command streamed again
+        if self._pending_echo is not None:
+            self.commands_unmatched += 1
+        self._last_echo = echo
+        self._pending_echo = echo
+        self._pending_time_ns = time_ns
+
+    def on_frame(self, frame:bytes, time_ns:int):
+        """
+        :param frame: frame received, as extracted by Frame_reassembler
+        :param time_ns: time.monotonic_ns() of its reception
+        """
+        self.frames += 1
+        # Command echoed
+        if self._pending_echo is not None and \
+                echo_key(frame) == self._pending_echo:
+            self._latencies_ms.append((time_ns - self._pending_time_ns) / 1e6)
+            self.commands_matched += 1
+            self._pending_echo = None
+        # Inter-arrival time, jitter and gaps
+        if self._time_last_frame_ns is not None:
+            interarrival_ms = (time_ns - self._time_last_frame_ns) / 1e6
+            interarrivals = self._interarrivals_ms
+            if interarrivals:
+                mean_ms = self._interarrival_sum_ms / len(interarrivals)
+                if interarrival_ms > max(GAP_FACTOR*mean_ms, GAP_MIN_MS):
+                    self.gaps += 1
+            if len(interarrivals) == interarrivals.maxlen:
+                self._interarrival_sum_ms -= interarrivals[0]
+            interarrivals.append(interarrival_ms)
+            self._interarrival_sum_ms += interarrival_ms
+            if self._last_interarrival_ms is not None:
+                variation = abs(interarrival_ms - self._last_interarrival_ms)
+                if math.isnan(self.jitter_ms):
+                    self.jitter_ms = variation
+                else:
+                    self.jitter_ms += (variation - self.jitter_ms)*JITTER_GAIN
+            self._last_interarrival_ms = interarrival_ms
+        self._time_last_frame_ns = time_ns
+        # Frames lost (sequence numbers of the binary wire format)
+        if frame[:len(CommunMessages.BIN_SYNC_MARKER)] == \
+                CommunMessages.BIN_SYNC_MARKER:
+            sequence = CommunMessages.get_sequence_bin(frame)
+            if self._last_sequence is not None:
+                self.frames_lost += (sequence - self._last_sequence - 1) \
+                    & 0xFFFF
+            self._last_sequence = sequence
+
+    def stats(self) -> dict:
+        """ Returns the statistics (see LINK_STATS_NAMES), rolling ones over
+        the last LINK_WINDOW samples """
+        latencies = sorted(self._latencies_ms)
+        interarrivals = self._interarrivals_ms
+        return {
+            "frames": self.frames,
+            "commands_matched": self.commands_matched,
+            "commands_unmatched": self.commands_unmatched,
+            "gaps": self.gaps,
+            "frames_lost": self.frames_lost,
+            "latency_mean_ms": sum(latencies) / len(latencies)
+                if latencies else math.nan,
+            "latency_p50_ms": percentile(latencies, 50),
+            "latency_p99_ms": percentile(latencies, 99),
+            "interarrival_ms": self._interarrival_sum_ms / len(interarrivals)
+                if interarrivals else math.nan,
+            "jitter_ms": self.jitter_ms,
+        }
+
+    def pack(self) -> bytes:
+        """ Returns the statistics packed (see unpack_stats) """
+        stats = self.stats()
+        return _STATS_STRUCT.pack(*(stats[name] for name in LINK_STATS_NAMES))
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def echo_key(data:bytes) -> bytes:
+    """ Returns the bytes of fields 0-4 of a frame (incoming or outgoing, any
+    wire format) """
+    if data[:len(CommunMessages.BIN_SYNC_MARKER)] == \
+            CommunMessages.BIN_SYNC_MARKER:
+        return bytes(data[_ECHO_BIN])
+    return bytes(data[_ECHO_ASCII])
+
+def unpack_stats(data:bytes) -> dict:
+    """ Returns the statistics packed by Link_monitor.pack """
+    return dict(zip(LINK_STATS_NAMES, _STATS_STRUCT.unpack(data)))
+
+def format_stats(stats:dict) -> str:
+    """ Returns the statistics as two lines of text for the GUI """
+    def ms(value):
+        return "-" if math.isnan(value) else "{:.1f}".format(value)
+    return ("Command->apply {} ms (p99 {} ms)\n"
+        "Frames every {} ms, jitter {} ms, gaps {}, lost {}").format(ms(stats["latency_p50_ms"]),
+        ms(stats["latency_p99_ms"]), ms(stats["interarrival_ms"]),
+        ms(stats["jitter_ms"]), stats["gaps"], stats["frames_lost"])
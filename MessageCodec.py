@@ -0,0 +1,256 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: MessageCodec.py
+# Description: compiles a message schema (see CommunMessages.MESSAGE_IN_SCHEMA)
+# into the functions filling / encoding the message objects. The code of each
+# function is generated once, at import time, with one statement per field:
+# no loop, no lookup of positions or rules while decoding
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import re
+import struct
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+# Struct code of the fields in the binary wire format: {bits: signed code}
+_STRUCT_CODES = {8: 'b', 16: 'h', 32: 'i'}
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Compiled_codec():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Compiled_codec class holds the functions compiled from a schema: a tuple
+    of fields in wire order, each one a tuple
+    (name, err_name, bits, signed, low, high, sentinel):
+    - name: attribute holding the value
+    - err_name: flag telling if the value is wrong, read from the err
+      bitmask (bit N set if field N is wrong, see add_error_flags). None:
+      the value is not checked, a field which is not a number raises
+      ValueError
+    - bits: size in the binary wire format (8, 16 or 32)
+    - signed: True for a signed field
+    - low, high: valid range (None: range of the binary type)
+    - sentinel: error value sent by the car, never valid (None if none)
+    In the ASCII wire format every field takes nb_chars zero-padded decimal
+    chars (see ascii_field_pattern): a field with any other text (spaces,
+    '+', '_'...) is not a number, even if int() would accept it. The
+    functions taking self are meant to be used as methods of the message
+    class.
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - schema: tuple. See above
+    - names: tuple of str. Attribute of each field, in wire order
+    - slots: tuple of str. Every attribute (value of each field, err if any
+      field is checked), to be used as __slots__ of the message class
+    - err_masks: dict. {err_name: bit of the field in err}
+    - ranges: tuple of (low, high). Valid values of each field, the
+      sentinel excluded when it is one of the bounds
+    - sentinels: tuple of int. Error value of each field (None if none)
+    - ascii_size: int. Size of an ASCII frame
+    - ascii_format: str. %-format of an ASCII frame, one value per field
+    - ascii_frame_re: re.Pattern (bytes). Matches the fields of an ASCII
+      frame (frame_re of CommunMessages.Frame_reassembler)
+    - bin_struct: struct.Struct. Binary frame (header, then the fields)
+    - set_fields: function(self, *values). Converts the values to int (to
+      None if not a number, when checked), sets the attributes and err.
+      Values given as str or bytes must be ASCII fields
+    - decode_ascii: function(self, frame). set_fields from the fields of an
+      ASCII frame (str or bytes, at least ascii_size long)
+    - decode_bin: function(self, frame). Same for a binary frame
+      (exception struct.error if not sized as bin_struct)
+    - encode_ascii: function(self) -> str
+    - encode_bin: function(self, sequence:int) -> bytes (exception
+      struct.error if a value does not fit its field)
+    - source: str. Generated code
+    """
+    def __init__(self, schema:tuple, nb_chars:int, header_format:str,
+                    sync_marker:bytes):
+        """
+        :param schema: see class info
+        :param nb_chars: chars per field in the ASCII wire format
+        :param header_format: struct format of the binary header (two
+        values: sync marker and sequence number), byte order included
+        :param sync_marker: first field of the binary header
+        :exception ValueError if a field name or size is not valid
+        """
+        self.schema = tuple(schema)
+        self.names = tuple(field[0] for field in self.schema)
+        self.err_masks = {field[1]: 1 << pos
+            for pos, field in enumerate(self.schema) if field[1] is not None}
+        self.slots = self.names + (("err",) if self.err_masks else ())
+        for name in self.slots + tuple(self.err_masks):
+            if not name.isidentifier():
+                raise ValueError("Wrong field name: " + repr(name))
+        self.ranges = tuple(_valid_range(*field[2:]) for field in self.schema)
+        self.sentinels = tuple(field[6] for field in self.schema)
+        self.ascii_size = nb_chars*len(self.schema)
+        self.ascii_format = ("%0" + str(nb_chars) + "d")*len(self.schema)
+        frame_pattern = "(?:{}){{{}}}".format(ascii_field_pattern(nb_chars),
+            len(self.schema))
+        self.ascii_frame_re = re.compile(frame_pattern.encode())
+        self.bin_struct = struct.Struct(header_format + ''.join(
+            _struct_code(bits, signed) for _, _, bits, signed, *_ in schema))
+        self.source = _generate_source(self.schema, self.ranges, nb_chars)
+        namespace = {
+            "_ASCII_FORMAT": self.ascii_format,
+            "_SYNC_MARKER": sync_marker,
+            "_pack": self.bin_struct.pack,
+            "_unpack": self.bin_struct.unpack,
+            "_match_frame_str": re.compile(frame_pattern).match,
+            "_match_frame_bytes": self.ascii_frame_re.match,
+            "_to_int": _ascii_parser(nb_chars),
+        }
+        exec(compile(self.source, "<codec {}>".format(",".join(self.names)),
+            "exec"), namespace)
+        self.set_fields = namespace["set_fields"]
+        self.decode_ascii = namespace["decode_ascii"]
+        self.decode_bin = namespace["decode_bin"]
+        self.encode_ascii = namespace["encode_ascii"]
+        self.encode_bin = namespace["encode_bin"]
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _struct_code(bits:int, signed:bool) -> str:
+    if bits not in _STRUCT_CODES:
+        raise ValueError("Wrong field size: " + str(bits))
+    code = _STRUCT_CODES[bits]
+    return code if signed else code.upper()
+
+def _valid_range(bits:int, signed:bool, low:int, high:int,
+                    sentinel:int) -> tuple:
+    """ Returns the (low, high) valid values of a field: the given range or
+    the range of its binary type, without the sentinel if it is a bound """
+    if signed:
+        type_low, type_high = -(1 << (bits-1)), (1 << (bits-1)) - 1
+    else:
+        type_low, type_high = 0, (1 << bits) - 1
+    low = type_low if low is None else low
+    high = type_high if high is None else high
+    if sentinel == low:
+        low += 1
+    elif sentinel == high:
+        high -= 1
+    return low, high
+
+def ascii_field_pattern(nb_chars:int) -> str:
+    """ Returns the regular expression of a field of nb_chars chars in the
+    ASCII wire format: zero-padded decimal number, minus sign first if
+    negative """
+    return "(?:[0-9]{{{}}}|-[0-9]{{{}}})".format(nb_chars, nb_chars-1)
+
+def ascii_field_range(nb_chars:int) -> tuple:
+    """ Returns the (low, high) values a field of nb_chars chars can hold in
+    the ASCII wire format (see ascii_field_pattern) """
+    return -(10**(nb_chars-1) - 1), 10**nb_chars - 1
+
+def _ascii_parser(nb_chars:int):
+    """ Returns the function converting a value to int for set_fields and
+    decode_ascii: str and bytes must be ASCII fields of nb_chars chars (None
+    otherwise), any other value goes through int() """
+    pattern = "(?:{})".format(ascii_field_pattern(nb_chars))
+    match_str = re.compile(pattern).fullmatch
+    match_bytes = re.compile(pattern.encode()).fullmatch
+    def to_int(value):
+        if isinstance(value, str):
+            return int(value) if match_str(value) else None
+        if isinstance(value, (bytes, bytearray)):
+            return int(value) if match_bytes(value) else None
+        return int(value)
+    return to_int
+
+def _fill_lines(schema:tuple, ranges:tuple, sources:list,
+                    convert:str) -> list:
+    """ Returns the statements setting the attributes from sources (one
+    expression per field) and err (if any field is checked).
+    convert: None if the sources are int, "int" if they are known to be
+    ASCII fields, "parse" if they must be checked (_to_int) """
+    lines = []
+    checked = False
+    for pos, ((name, err_name, _, _, _, _, sentinel), (low, high),
+            source) in enumerate(zip(schema, ranges, sources)):
+        if convert == "int":
+            source = "int({})".format(source)
+        elif convert == "parse":
+            source = "_to_int({})".format(source)
+        if err_name is None:
+            lines.append("self.{} = {}".format(name, source))
+            if convert == "parse":
+                lines += [
+                    "if self.{} is None:".format(name),
+                    "    raise ValueError('Not a number: {}')".format(name)]
+            continue
+        checked = True
+        if convert == "parse":
+            lines += [
+                "try:",
+                "    value = {}".format(source),
+                "except (ValueError, TypeError):",
+                "    value = None",
+                "self.{} = value".format(name),
+                "if value is None or not {} <= value <= {}".format(low, high)]
+        else:
+            lines += [
+                "value = self.{} = {}".format(name, source),
+                "if not {} <= value <= {}".format(low, high)]
+        if sentinel is not None and low < sentinel < high:
+            lines[-1] += " or value == {}".format(sentinel)
+        lines[-1] += ":"
+        lines.append("    err |= {}".format(1 << pos))
+    if checked:
+        lines = ["err = 0"] + lines + ["self.err = err"]
+    return lines
+
+def _generate_source(schema:tuple, ranges:tuple, nb_chars:int) -> str:
+    """ Returns the code of the functions of Compiled_codec """
+    names = [field[0] for field in schema]
+    values = ["value_{}".format(index) for index in range(len(schema))]
+    fields = ["frame[{}:{}]".format(index*nb_chars, (index+1)*nb_chars)
+        for index in range(len(schema))]
+    attributes = ", ".join("self." + name for name in names)
+    def function(header:str, body:list) -> list:
+        return [header] + ["    " + line for line in body] + [""]
+    def indent(body:list) -> list:
+        return ["    " + line for line in body]
+    lines = function("def set_fields(self, {}):".format(", ".join(names)),
+        _fill_lines(schema, ranges, names, "parse"))
+    # ASCII frame: every field is converted at once if the frame is well
+    # formed, otherwise each field is checked
+    lines += function("def decode_ascii(self, frame):",
+        ["if (_match_frame_str if frame.__class__ is str else "
+            "_match_frame_bytes)(frame):"] +
+        indent(_fill_lines(schema, ranges, fields, "int")) +
+        ["else:"] +
+        indent(_fill_lines(schema, ranges, fields, "parse")))
+    lines += function("def decode_bin(self, frame):",
+        ["_, _, {}, = _unpack(frame)".format(", ".join(values))] +
+        _fill_lines(schema, ranges, values, None))
+    lines += function("def encode_ascii(self):",
+        ["return _ASCII_FORMAT % ({},)".format(attributes)])
+    lines += function("def encode_bin(self, sequence):",
+        ["return _pack(_SYNC_MARKER, sequence & 0xFFFF, {})".format(
+            attributes)])
+    return "\n".join(lines)
+
+def add_error_flags(cls:type, codec:Compiled_codec):
+    """ Adds to cls a read-only property per err_name of the schema of
+    codec, True if the bit of the field is set in err """
+    for err_name, mask in codec.err_masks.items():
+        setattr(cls, err_name, property(
+            lambda self, mask=mask: self.err & mask != 0,
+            doc="True if the bit {:#x} of err is set".format(mask)))
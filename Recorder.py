@@ -0,0 +1,399 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: Recorder.py
+# Description: always-on recorder of the frames exchanged with the cars
+# (memory-mapped files with fixed-size records and a sparse time index) and
+# replay of the recordings
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import glob
+import mmap
+import os
+import struct
+import time
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+"""
+/* Recording file layout (little-endian):
+ * 		Header (HEADER_SIZE bytes): magic, version, record size, capacity
+ *		(records), index stride, count (records written), offset of the index,
+ *		offset of the records
+ * 		Index: one uint64 per index stride: timestamp of records 0, stride,
+ *		2*stride... Used to seek by time in O(log n)
+ * 		Records (RECORD_SIZE bytes each):
+ *			Bytes 0-7: host timestamp (time.monotonic_ns). Unsigned
+ *			Byte 8: direction (RECORD_DIR_IN / RECORD_DIR_OUT)
+ *			Byte 9: car ID
+ *			Bytes 10-11: payload length. Unsigned
+ *			Bytes 12-...: payload (frame as received / sent on the wire)
+ *
+ * The file grows by GROW_RECORDS records at a time, up to capacity records,
+ * and is cut after the last record when it is closed. When it is full, the
+ * recorder goes on with a new file (next segment).
+ */
+"""
+RECORD_MAGIC = b'RCARREC1'
+RECORD_VERSION = 1
+RECORD_DIR_IN = 0       # Frame received from a car
+RECORD_DIR_OUT = 1      # Message sent to a car
+RECORD_SIZE = 64
+PAYLOAD_SIZE = RECORD_SIZE - 12
+HEADER_SIZE = 64
+DEFAULT_CAPACITY = 1 << 20      # Records per file (64 MiB)
+DEFAULT_INDEX_STRIDE = 1024
+GROW_RECORDS = 1 << 14          # Records added when a file grows (1 MiB)
+DEFAULT_MAX_FILES = 16          # Files kept per directory (1 GiB)
+RECORD_EXTENSION = ".rec"
+
+_HEADER_STRUCT = struct.Struct('<8sHHQIQQQ')
+_COUNT_OFFSET = 24
+_COUNT_STRUCT = struct.Struct('<Q')
+_RECORD_HEAD_STRUCT = struct.Struct('<QBBH')
+_TIMESTAMP_STRUCT = struct.Struct('<Q')
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Telemetry_recorder():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Telemetry_recorder class appends records (timestamp, direction, car ID,
+    frame) to memory-mapped files. Appending is a copy into the mapping, no
+    system call is needed but every GROW_RECORDS records, when the file is
+    extended (so a crash or a restart only leaves a small file). Files are
+    named
+    <directory>/<prefix>_<start time>_<process ID>_<segment>.rec and never 
+    overwrite an existing file. When a file is created, the oldest ones of 
+    the directory (same prefix) are deleted so that at most max_files are 
+    kept
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - path: str. File currently being written
+    - count: int. Records written in the current file
+    - records_written: int. Records written since the recorder was created
+    - records_truncated: int. Records whose payload exceeded PAYLOAD_SIZE
+    """
+    def __init__(self, directory:str, prefix:str="robocar",
+                    capacity:int=DEFAULT_CAPACITY,
+                    index_stride:int=DEFAULT_INDEX_STRIDE,
+                    max_files:int=DEFAULT_MAX_FILES):
+        """
+        :param directory: directory where the files are created
+        :param prefix: beginning of the file names
+        :param capacity: number of records per file
+        :param index_stride: one index entry is kept every index_stride
+        records
+        :param max_files: files kept in directory, this one included (None:
+        no limit)
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._prefix = prefix
+        self._max_files = max_files
+        self._base_path = os.path.join(directory, "{}_{}_{}".format(prefix,
+            time.strftime("%Y%m%d_%H%M%S"), os.getpid()))
+        self._capacity = capacity
+        self._index_stride = index_stride
+        self._segment = 0
+        self._file = None
+        self._mmap = None
+        self._nb_mapped = 0     # Records the current file has room for
+        self.path = None
+        self.count = 0
+        self.records_written = 0
+        self.records_truncated = 0
+        self._open_segment()
+
+    def _open_segment(self):
+        """ Creates and maps the next file (the next segment number whose
+        file does not exist yet) """
+        nb_index = -(-self._capacity // self._index_stride)
+        self._index_offset = HEADER_SIZE
+        self._records_offset = HEADER_SIZE + 8*nb_index
+        while True:
+            self.path = "{}_{:04d}{}".format(self._base_path, self._segment,
+                RECORD_EXTENSION)
+            self._segment += 1
+            try:
+                self._file = open(self.path, "x+b")
+                break
+            except FileExistsError:
+                continue
+        self._delete_oldest()
+        self._nb_mapped = 0
+        self._grow()
+        _HEADER_STRUCT.pack_into(self._mmap, 0, RECORD_MAGIC, RECORD_VERSION,
+            RECORD_SIZE, self._capacity, self._index_stride, 0,
+            self._index_offset, self._records_offset)
+        self.count = 0
+
+    def _grow(self):
+        """ Extends the current file by GROW_RECORDS records (capacity at 
+        most) and maps it again """
+        if self._mmap is not None:
+            self._mmap.close()
+        self._nb_mapped = min(self._nb_mapped + GROW_RECORDS, self._capacity)
+        size = self._records_offset + RECORD_SIZE*self._nb_mapped
+        fileno = self._file.fileno()
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fileno, 0, size)
+        else:
+            self._file.truncate(size)
+        self._mmap = mmap.mmap(fileno, size)
+
+    def _delete_oldest(self):
+        """ Deletes the oldest files of the directory beyond max_files """
+        if self._max_files is None:
+            return
+        paths = glob.glob(os.path.join(glob.escape(self._directory),
+            glob.escape(self._prefix) + "_*" + RECORD_EXTENSION))
+        paths.remove(self.path)
+        paths.sort()    # Start time, then segment, in the names
+        for path in paths[:max(0, len(paths) - (self._max_files - 1))]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def record(self, direction:int, car_id:int, payload:bytes,
+                timestamp_ns:int=None):
+        """
+        Appends a record
+
+        :param direction: RECORD_DIR_IN or RECORD_DIR_OUT
+        :param car_id: ID of the car
+        :param payload: frame, truncated to PAYLOAD_SIZE bytes if bigger
+        :type payload: (bytes)
+        :param timestamp_ns: host time.monotonic_ns(). Current time if None
+        """
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        if self.count == self._nb_mapped:
+            if self.count == self._capacity:
+                self._close_segment()
+                self._open_segment()
+            else:
+                self._grow()
+        size = len(payload)
+        if size > PAYLOAD_SIZE:
+            size = PAYLOAD_SIZE
+            self.records_truncated += 1
+        buf = self._mmap
+        offset = self._records_offset + RECORD_SIZE*self.count
+        _RECORD_HEAD_STRUCT.pack_into(buf, offset, timestamp_ns, direction,
+            car_id, size)
+        start = offset + _RECORD_HEAD_STRUCT.size
+        buf[start:start+size] = payload[:size]
+        if self.count % self._index_stride == 0:
+            _TIMESTAMP_STRUCT.pack_into(buf, self._index_offset +
+                8*(self.count // self._index_stride), timestamp_ns)
+        # Count updated last: a record is only visible once complete
+        self.count += 1
+        self.records_written += 1
+        _COUNT_STRUCT.pack_into(buf, _COUNT_OFFSET, self.count)
+
+    def _close_segment(self):
+        """ Unmaps the current file and cuts it after the last record """
+        self._mmap.flush()
+        self._mmap.close()
+        self._mmap = None
+        self._file.truncate(self._records_offset + RECORD_SIZE*self.count)
+        self._file.close()
+        self._file = None
+
+    def close(self):
+        """ Flushes and closes the current file """
+        if self._mmap is not None:
+            self._close_segment()
+
+class Recording():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Recording class gives read access to a file written by Telemetry_recorder
+    (it can be read while it is still being written)
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - path: str. File name
+    """
+    def __init__(self, path:str):
+        """
+        :param path: file name
+        :exception ValueError if the file is not a recording
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self._capacity, self._index_stride, _, \
+            self._index_offset, self._records_offset = \
+            _HEADER_STRUCT.unpack_from(self._mmap, 0)
+        if magic != RECORD_MAGIC or record_size != RECORD_SIZE:
+            self._mmap.close()
+            raise ValueError("Not a recording: " + path)
+
+    def __len__(self) -> int:
+        """ Records written, limited to the ones mapped when the file was 
+        opened (it may have grown since) """
+        return min(_COUNT_STRUCT.unpack_from(self._mmap, _COUNT_OFFSET)[0],
+            (len(self._mmap) - self._records_offset) // RECORD_SIZE)
+
+    def timestamp(self, index:int) -> int:
+        """ Returns the timestamp (ns) of record index """
+        return _TIMESTAMP_STRUCT.unpack_from(self._mmap,
+            self._records_offset + RECORD_SIZE*index)[0]
+
+    def get(self, index:int) -> tuple:
+        """
+        Returns record index
+
+        :return: (timestamp_ns, direction, car_id, payload)
+        :rtype: (int, int, int, bytes)
+        """
+        offset = self._records_offset + RECORD_SIZE*index
+        timestamp_ns, direction, car_id, size = \
+            _RECORD_HEAD_STRUCT.unpack_from(self._mmap, offset)
+        start = offset + _RECORD_HEAD_STRUCT.size
+        return timestamp_ns, direction, car_id, self._mmap[start:start+size]
+
+    def seek(self, timestamp_ns:int) -> int:
+        """
+        Returns the index of the first record with a timestamp greater or
+        equal to timestamp_ns (len(self) if there is none). Binary search on
+        the sparse index first, then inside the block of records found
+
+        :rtype: (int)
+        """
+        count = len(self)
+        index_get = lambda entry: _TIMESTAMP_STRUCT.unpack_from(self._mmap,
+            self._index_offset + 8*entry)[0]
+        nb_entries = -(-count // self._index_stride)
+        # Last index entry with timestamp < timestamp_ns
+        entry = _bisect_left(index_get, 0, nb_entries, timestamp_ns) - 1
+        low = max(entry, 0)*self._index_stride
+        high = min(low + self._index_stride, count)
+        if entry < 0:
+            high = low
+        return _bisect_left(self.timestamp, low, high, timestamp_ns)
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, index:int):
+        """ Yields the records (see get) from index to the end """
+        for current in range(index, len(self)):
+            yield self.get(current)
+
+    def close(self):
+        self._mmap.close()
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _bisect_left(get, low:int, high:int, value:int) -> int:
+    """ First position in [low, high) where get(position) >= value """
+    while low < high:
+        middle = (low + high) // 2
+        if get(middle) < value:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+def list_recordings(path:str) -> list:
+    """
+    Returns the recording files (sorted) to replay from path: a file, a
+    directory or the beginning of the file names (e.g.
+    recordings/robocar_20220514_101500 to get all its segments)
+    """
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*" + RECORD_EXTENSION)))
+    if os.path.isfile(path):
+        return [path]
+    return sorted(glob.glob(glob.escape(path) + "*" + RECORD_EXTENSION))
+
+def session_of(path:str) -> str:
+    """ Returns the recording session of a file written by 
+    Telemetry_recorder: its name without the segment number. The segments 
+    of a session share the clock of their timestamps """
+    return path[:-len(RECORD_EXTENSION)].rsplit("_", 1)[0]
+
+def replay(paths:list, slot_from_car, speed:float=1.0,
+            start_ns:int=None, event_exit=None) -> int:
+    """
+    Feeds the frames received in the recordings back to slot_from_car as
+    Server does (index = car ID), so they go through the same decode / display
+    path
+
+    :param paths: recording files, in chronological order. The timestamps 
+    of different server runs do not share a clock: the timing starts again 
+    from the first frame of each recording session (see session_of)
+    :param slot_from_car: destination of the frames
+    :type slot_from_car: (SharedSlot.Latest_value_slot)
+    :param speed: 1.0 replays in real time, 2.0 twice as fast... None or 0
+    replays as fast as possible
+    :param start_ns: if given, replay starts at the first record with a
+    timestamp greater or equal to this one
+    :param event_exit: if given, the replay stops as soon as it is set 
+    (also while waiting for the time of the next frame)
+    :type event_exit: (Event) from multiprocessing
+    :return: number of frames replayed
+    :rtype: (int)
+    """
+    nb_frames = 0
+    session = None
+    for path in paths:
+        if session_of(path) != session:
+            session = session_of(path)
+            first_ns = None
+        recording = Recording(path)
+        index = recording.seek(start_ns) if start_ns is not None else 0
+        for timestamp_ns, direction, car_id, payload in \
+                recording.iter_from(index):
+            if event_exit is not None and event_exit.is_set():
+                recording.close()
+                return nb_frames
+            if direction != RECORD_DIR_IN:
+                continue
+            if first_ns is None:
+                first_ns = timestamp_ns
+                replay_start = time.monotonic_ns()
+            if speed:
+                delay_ns = (timestamp_ns - first_ns)/speed - \
+                    (time.monotonic_ns() - replay_start)
+                if delay_ns > 0:
+                    if event_exit is None:
+                        time.sleep(delay_ns / 1e9)
+                    elif event_exit.wait(delay_ns / 1e9):
+                        recording.close()
+                        return nb_frames
+            slot_from_car.write(payload, car_id)
+            nb_frames += 1
+        recording.close()
+    return nb_frames
+
+def run_replay(path:str, slot_from_car, event_exit, speed:float=1.0):
+    """
+    Process entry point replacing Server.run_server: replays the recordings
+    found in path (see list_recordings) until they end or event_exit is set
+    """
+    paths = list_recordings(path)
+    print("Replay: {} file(s) from {}".format(len(paths), path))
+    nb_frames = replay(paths, slot_from_car, speed, event_exit=event_exit)
+    print("Replay: {} frames replayed".format(nb_frames))
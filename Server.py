@@ -3,27 +3,93 @@
 # Application: Remote_Control
 # File: Server.py
 # Description: This file takes charge of initialising a server, listen to the 
-# incoming messages and send them back via queues
+# incoming messages and send them back via shared slots
 #==============================================================================
 
 #==============================================================================
 # Import
 #==============================================================================
 
+import logging
+import selectors
 import socket
-from multiprocessing import Value, Queue
+import struct
+from multiprocessing import Value, Event
 import time
 
+import AsyncLog
+import CommunMessages
+import Latency
+from LinkMonitor import Link_monitor
+import Recorder
+from SharedSlot import Latest_value_slot
+import SpeedControl
+
 #==============================================================================
 # Global data
 #==============================================================================
 
-DEBUG_EN = True
+# Logging: records are written by a background thread (see AsyncLog.py). 
+# logging.DEBUG adds the frames received and the commands from the GUI, 
+# sampled: 1 out of LOG_FRAME_EVERY, at most LOG_FRAME_MAX_PER_SEC per second.
+# LOG_COMPACT shortens the records and writes frames in hexadecimal
+LOG_LEVEL = logging.INFO
+LOG_FRAME_EVERY = 1
+LOG_FRAME_MAX_PER_SEC = 20
+LOG_COMPACT = False
+_log = logging.getLogger("robocar.server")
 
 # Server parameters
 HOST_IP = '192.168.0.1'
 HOST_PORT = 60000
-TIMEOUT_SEC = 6
+TIMEOUT_SEC = 6         # Connection closed if nothing received meanwhile
+LOOP_TICK_SEC = 0.005   # Max time between checks of GUI messages / exit
+RECV_SIZE = 1024
+
+# Wire format used with the car: CommunMessages.WIRE_FORMAT_ASCII, 
+# CommunMessages.WIRE_FORMAT_BINARY or WIRE_FORMAT_AUTO (the format of the 
+# first frame received from the car is used)
+WIRE_FORMAT_AUTO = "auto"
+WIRE_FORMAT = WIRE_FORMAT_AUTO
+# In auto mode, ASCII is used if no frame is recognised within these bytes
+HANDSHAKE_MAX_BYTES = 4*CommunMessages.MESSAGE_IN_SIZE
+
+# Fleet: every car connected gets an ID in [1, MAX_CARS], used as the index of
+# its slot in the shared slots (slot_from_car / slot_2_car must be created with
+# nb_slots=NB_SLOTS). A message written to slot_2_car index CAR_ID_ALL is sent
+# to every car. Cars whose IP is in CAR_ID_BY_IP always get the same ID, the
+# rest get the lowest free one
+MAX_CARS = 32
+CAR_ID_ALL = 0
+NB_SLOTS = MAX_CARS + 1
+CAR_ID_BY_IP = {}
+
+# Command streaming: the latest command from the GUI is sent to each car 
+# STREAM_RATE_HZ times per second (one send per car and tick), commands 
+# received meanwhile are merged (only the latest is sent). Stop commands are 
+# sent at once. 0 sends every command once, as soon as it is received
+STREAM_RATE_HZ = 50
+WORKMODE_STOP = CommunMessages.get_workmode_id("Stop mode")
+
+# Speed control (SpeedControl.py): if enabled, Automatic mode commands are not 
+# sent to the cars. The server runs the speed loop of each car instead, 
+# SPEED_CONTROL_RATE_HZ times per second (50 to 200), sending Manual mode 
+# percentages computed from the setpoint (OY) and the speed received from the 
+# car. Any other command ends the loop. The timing of the loop is logged 
+# every SPEED_CONTROL_REPORT_SEC (0: never)
+SPEED_CONTROL_EN = False
+SPEED_CONTROL_RATE_HZ = 100
+SPEED_CONTROL_REPORT_SEC = 5
+WORKMODE_AUTOMATIC = CommunMessages.get_workmode_id("Automatic mode")
+
+# Recorder: every frame received and every message sent is appended to 
+# RECORD_DIR (see Recorder.py). None disables it. Only the newest 
+# RECORD_MAX_FILES files (64 MiB each) are kept there (None: all of them)
+RECORD_DIR = "recordings"
+RECORD_MAX_FILES = Recorder.DEFAULT_MAX_FILES
+
+# Link statistics of each car (LinkMonitor.py) published every period
+LINK_STATS_PERIOD_SEC = 0.25
 
 #==============================================================================
 # Classes
@@ -35,6 +101,446 @@ class State():
     CONN_OPEN = 2
     CONN_ERROR = 3
 
+class Car_session():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Car_session class holds the state of the connection with a car
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - car_id: int. ID of the car in [1, MAX_CARS]
+    - connection: socket.socket. Non-blocking connection with the car
+    - address: tuple. Address of the car
+    - wire_format: str. Wire format in use (None until the handshake ends)
+    - reassembler: CommunMessages.Frame_reassembler. None until handshake ends
+    - pending: bytes. Data received during the handshake
+    - sequence_2_car: int. Sequence number of the next message to the car
+    - tx_buffer: bytearray. Data waiting to be sent to the car
+    - frame_bin: CommunMessages.Out_frame_bin. Commands encoded in the 
+    binary wire format (used if the car uses it)
+    - command: bytes. Latest command from the GUI (ASCII outgoing format), 
+    None if none was received yet
+    - command_new: bool. True if command was not sent yet
+    - commands_merged: int. Commands replaced by a newer one before being sent
+    - speed_loop: SpeedControl.Speed_loop. None unless the speed of the car 
+    is controlled by the server (see SPEED_CONTROL_EN)
+    - speed_message: CommunMessages.Message_struct_in. Reused to decode the 
+    frames for speed_loop
+    - link: Link_monitor. Command-to-apply latency, jitter and gaps
+    - time_last_rx: float. time.monotonic() of the last data received
+    - bytes_received / bytes_sent: int. Traffic counters of the connection
+    """
+    def __init__(self, car_id:int, connection:socket.socket, address:tuple):
+        self.car_id = car_id
+        self.connection = connection
+        self.address = address
+        self.wire_format = None
+        self.reassembler = None
+        self.pending = b''
+        self.sequence_2_car = 0
+        self.tx_buffer = bytearray()
+        self.frame_bin = CommunMessages.Out_frame_bin()
+        self.command = None
+        self.command_new = False
+        self.commands_merged = 0
+        self.speed_loop = None
+        self.speed_message = None
+        self.link = Link_monitor()
+        self.time_last_rx = time.monotonic()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+class Server_engine():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Server_engine class attends the listening socket and the connections with
+    the cars from a single event loop (selectors): accepts, reads and writes 
+    are serviced as soon as the sockets are ready, independently from each 
+    other. The loop wakes up at least every LOOP_TICK_SEC to take the latest 
+    messages from the GUI and to check the exit event, so a message is sent 
+    within one tick whatever the cars are sending.
+    Each car has its own Car_session and its own slot index (its car ID) in 
+    the shared slots, so telemetry is tagged and commands are routed by ID.
+    Frames are written to the slot with their recv and enqueue timestamps.
+    Commands are streamed to the cars at STREAM_RATE_HZ (see _stream).
+    The link statistics of each car are written every LINK_STATS_PERIOD_SEC
+    to slot_link_stats, at its car ID.
+    If SPEED_CONTROL_EN, the speed loops run on the deadlines of 
+    speed_scheduler (SpeedControl.Deadline_scheduler), see _control.
+    """
+    def __init__(   self, server_state_out:Value, 
+                    slot_from_car:Latest_value_slot, 
+                    slot_2_car:Latest_value_slot, event_exit:Event,
+                    latency_stats:Latency.Latency_stats=None,
+                    slot_link_stats:Latest_value_slot=None):
+        """
+        :params all: see run_server
+        """
+        self._server_state_out = server_state_out
+        self._slot_from_car = slot_from_car
+        self._slot_2_car = slot_2_car
+        self._event_exit = event_exit
+        self._latency_stats = latency_stats
+        self._slot_link_stats = slot_link_stats
+        self._selector = selectors.DefaultSelector()
+        self._sessions = {}     # car_id: Car_session
+        self._recorder = None
+        self._time_next_stream = time.monotonic()
+        self._time_next_link_stats = time.monotonic()
+        self._time_next_speed_report = time.monotonic() + \
+            SPEED_CONTROL_REPORT_SEC
+        self.speed_scheduler = None
+        if SPEED_CONTROL_EN:
+            self.speed_scheduler = SpeedControl.Deadline_scheduler(
+                SPEED_CONTROL_RATE_HZ)
+        self._frame_sampler = AsyncLog.Log_sampler(LOG_FRAME_EVERY, 
+            LOG_FRAME_MAX_PER_SEC)
+        self._command_sampler = AsyncLog.Log_sampler(LOG_FRAME_EVERY, 
+            LOG_FRAME_MAX_PER_SEC)
+
+    def run(self):
+        """ Runs the event loop until the exit event is set """
+        log_writer = AsyncLog.start_logging(_log, LOG_LEVEL, LOG_COMPACT)
+        my_socket = None
+        try:
+            my_socket = _init_socket(self._server_state_out)
+            if RECORD_DIR is not None:
+                self._recorder = Recorder.Telemetry_recorder(RECORD_DIR,
+                    max_files=RECORD_MAX_FILES)
+                _log.info('recording to %s', self._recorder.path)
+            self._selector.register(my_socket, selectors.EVENT_READ, None)
+            _log.info('waiting for connections')
+            while not self._event_exit.is_set():
+                timeout = LOOP_TICK_SEC
+                if STREAM_RATE_HZ:
+                    timeout = min(timeout, 
+                        max(0, self._time_next_stream - time.monotonic()))
+                if self.speed_scheduler is not None:
+                    timeout = min(timeout, self.speed_scheduler.time_to_next(
+                        time.monotonic_ns()))
+                for key, mask in self._selector.select(timeout):
+                    if key.data is None:
+                        try:
+                            self._accept(key.fileobj)
+                        except Exception:
+                            _log.exception('connection not accepted')
+                        continue
+                    session = key.data
+                    if mask & selectors.EVENT_READ:
+                        self._guard(session, self._read)
+                    if mask & selectors.EVENT_WRITE:
+                        self._guard(session, self._write)
+                self._control()
+                self._send_from_gui()
+                self._stream()
+                self._publish_link_stats()
+                self._check_timeout()
+            _log.info("exiting")
+        finally:
+            for session in list(self._sessions.values()):
+                self._close(session)
+            self._selector.close()
+            if my_socket is not None:
+                my_socket.close()
+            if self._recorder is not None:
+                self._recorder.close()
+            with self._server_state_out.get_lock():
+                self._server_state_out.value = State.SOCK_CLOSED
+            AsyncLog.stop_logging(_log, log_writer)
+
+    def _get_car_id(self, address:tuple) -> int:
+        """ Returns the ID for a car connecting from address (None if the 
+        fleet is full) """
+        car_id = CAR_ID_BY_IP.get(address[0])
+        if car_id is not None:
+            return car_id
+        for car_id in range(1, MAX_CARS+1):
+            if car_id not in self._sessions and \
+                    car_id not in CAR_ID_BY_IP.values():
+                return car_id
+        return None
+
+    def _accept(self, my_socket:socket.socket):
+        """ Accepts a new connection and gives it a car ID. If a car with 
+        the same ID was connected, its previous connection is closed """
+        try:
+            connection, address = my_socket.accept()
+        except BlockingIOError:
+            return
+        car_id = self._get_car_id(address)
+        if car_id is None:
+            _log.warning('fleet full, rejected %s', address)
+            connection.close()
+            return
+        _log.info('car %d connected from %s', car_id, address)
+        if car_id in self._sessions:
+            self._close(self._sessions[car_id])
+        connection.setblocking(False)
+        session = Car_session(car_id, connection, address)
+        self._sessions[car_id] = session
+        self._selector.register(connection, selectors.EVENT_READ, session)
+        with self._server_state_out.get_lock():
+            self._server_state_out.value = State.CONN_OPEN
+
+    def _guard(self, session:Car_session, method, *args):
+        """ Calls method(session, *args). An unexpected error only ends the 
+        connection of session: it is logged and the session is closed, the 
+        other cars and the server go on """
+        try:
+            method(session, *args)
+        except Exception:
+            _log.exception('car %d: unexpected error, connection closed', 
+                session.car_id)
+            if self._sessions.get(session.car_id) is session:
+                self._close(session)
+
+    def _close(self, session:Car_session):
+        """ Closes the connection of session """
+        self._selector.unregister(session.connection)
+        session.connection.close()
+        if self._sessions.get(session.car_id) is session:
+            del self._sessions[session.car_id]
+            _log.info('car %d disconnected', session.car_id)
+            if not self._sessions:
+                with self._server_state_out.get_lock():
+                    self._server_state_out.value = State.CONN_ERROR
+
+    def _read(self, session:Car_session):
+        """ Receives the available data and forwards the newest frame """
+        try:
+            data = session.connection.recv(RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._close(session)
+            return
+        if not data:
+            # Connection closed by the car
+            self._close(session)
+            return
+        time_rx_ns = time.monotonic_ns()
+        session.time_last_rx = time_rx_ns / 1e9
+        session.bytes_received += len(data)
+        # Choose the wire format from the first frames received
+        if session.wire_format is None:
+            session.pending += data
+            session.wire_format = _handshake(session.pending)
+            if session.wire_format is None:
+                return
+            _log.info("car %d uses wire format %s", session.car_id, 
+                session.wire_format)
+            session.reassembler = CommunMessages.new_reassembler(
+                session.wire_format)
+            data = session.pending
+            session.pending = b''
+        # Rebuild the frames from the stream, all of them are recorded and
+        # only the newest is sent
+        reassembler = session.reassembler
+        frames = reassembler.feed(data)
+        for frame in frames:
+            session.link.on_frame(frame, time_rx_ns)
+        if self._recorder is not None:
+            for frame in frames:
+                self._recorder.record(Recorder.RECORD_DIR_IN, session.car_id,
+                    frame, time_rx_ns)
+        frame = reassembler.take_latest(frames)
+        if frame and session.speed_loop is not None:
+            message = CommunMessages.decode_frame(frame, session.speed_message)
+            if message is not None:
+                session.speed_message = message
+                session.speed_loop.on_frame(message, time_rx_ns)
+        if frame:
+            time_enqueue_ns = time.monotonic_ns()
+            self._slot_from_car.write(frame, session.car_id,
+                (time_rx_ns, time_enqueue_ns))
+            if self._latency_stats is not None:
+                self._latency_stats.record(Latency.STAGE_RECV_ENQUEUE,
+                    time_enqueue_ns - time_rx_ns)
+            if _log.isEnabledFor(logging.DEBUG):
+                skipped = self._frame_sampler.sample()
+                if skipped is not None:
+                    _log.debug('received from %d: %s (frames: %d, dropped: '
+                        '%d, resyncs: %d, %d not logged)', session.car_id,
+                        AsyncLog.Frame_str(frame, 
+                            CommunMessages.NB_CHAR_PER_MESS, LOG_COMPACT),
+                        reassembler.frames_received, 
+                        reassembler.frames_dropped, 
+                        reassembler.resync_events, skipped)
+
+    def _write(self, session:Car_session):
+        """ Sends as much pending data as the socket accepts without blocking 
+        and waits for the socket to be writable again if anything is left """
+        if self._sessions.get(session.car_id) is not session:
+            return      # Already closed
+        try:
+            sent = session.connection.send(session.tx_buffer)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._close(session)
+            return
+        del session.tx_buffer[:sent]
+        session.bytes_sent += sent
+        events = selectors.EVENT_READ
+        if session.tx_buffer:
+            events |= selectors.EVENT_WRITE
+        self._selector.modify(session.connection, events, session)
+
+    def _send_from_gui(self):
+        """ Takes the latest message from the GUI for each car, if any. A 
+        message for CAR_ID_ALL goes to every car """
+        slot_2_car = self._slot_2_car
+        message_2_all = slot_2_car.read_new(CAR_ID_ALL)
+        for car_id, session in list(self._sessions.items()):
+            message_2_car = slot_2_car.read_new(car_id)
+            if message_2_all is not None:
+                self._guard(session, self._set_command, message_2_all)
+            if message_2_car is not None:
+                self._guard(session, self._set_command, message_2_car)
+
+    def _set_command(self, session:Car_session, message_2_car:bytes):
+        """ Makes message_2_car the command streamed to session. Stop 
+        commands (and every command if STREAM_RATE_HZ is 0) are sent at 
+        once. With SPEED_CONTROL_EN, an Automatic mode command sets the 
+        setpoint of the speed loop of session instead. A command that can 
+        not be sent in the wire format of session is logged and dropped """
+        try:
+            CommunMessages.check_out_message(message_2_car, 
+                session.wire_format)
+        except (ValueError, struct.error) as error:
+            _log.warning("car %d: command %r dropped (%s)", session.car_id, 
+                message_2_car, error)
+            return
+        workmode = _get_workmode(message_2_car)
+        if SPEED_CONTROL_EN and workmode == WORKMODE_AUTOMATIC:
+            self._set_speed_setpoint(session, message_2_car)
+            return
+        if session.speed_loop is not None:
+            _log.info("car %d: speed control off", session.car_id)
+            session.speed_loop = None
+        if session.command_new:
+            session.commands_merged += 1
+        session.command = message_2_car
+        session.command_new = True
+        if _log.isEnabledFor(logging.DEBUG):
+            skipped = self._command_sampler.sample()
+            if skipped is not None:
+                _log.debug("command for %d: %s (%d not logged)", 
+                    session.car_id, AsyncLog.Frame_str(message_2_car, 
+                        CommunMessages.NB_CHAR_PER_MESS, LOG_COMPACT), 
+                    skipped)
+        if STREAM_RATE_HZ == 0 or workmode == WORKMODE_STOP:
+            self._send_now(session, message_2_car)
+
+    def _set_speed_setpoint(self, session:Car_session, message_2_car:bytes):
+        """ Starts (if needed) the speed loop of session, with the OY 
+        setpoint of message_2_car (Automatic mode command). The command 
+        streamed so far is dropped, the loop sends its own """
+        try:
+            setpoint_mms = CommunMessages.decode_out_message(
+                message_2_car.decode()).autctrl_speedy_mms
+        except ValueError:
+            _log.warning("car %d: wrong command %r", session.car_id, 
+                message_2_car)
+            return
+        if session.speed_loop is None:
+            _log.info("car %d: speed control on", session.car_id)
+            session.speed_loop = SpeedControl.Speed_loop()
+            session.command = None
+            session.command_new = False
+        session.speed_loop.set_setpoint(setpoint_mms)
+
+    def _control(self):
+        """ On every deadline of speed_scheduler, sends the command 
+        computed by the speed loop of each car under control, and logs the 
+        timing statistics every SPEED_CONTROL_REPORT_SEC """
+        scheduler = self.speed_scheduler
+        if scheduler is None:
+            return
+        now_ns = time.monotonic_ns()
+        if not scheduler.due(now_ns):
+            return
+        for session in list(self._sessions.values()):
+            if session.speed_loop is not None:
+                self._guard(session, self._send_speed_command, now_ns)
+        scheduler.done(time.monotonic_ns())
+        if SPEED_CONTROL_REPORT_SEC and \
+                time.monotonic() >= self._time_next_speed_report:
+            self._time_next_speed_report += SPEED_CONTROL_REPORT_SEC
+            _log.info("speed control: %s", 
+                SpeedControl.format_stats(scheduler.stats()))
+
+    def _send_speed_command(self, session:Car_session, now_ns:int):
+        """ Sends at once the command computed by the speed loop """
+        self._send(session, CommunMessages.encode_out_message(
+            *session.speed_loop.compute(now_ns)))
+        self._write(session)
+
+    def _stream(self):
+        """ Every 1/STREAM_RATE_HZ, sends the latest command to each car 
+        with a single send """
+        if STREAM_RATE_HZ == 0:
+            return
+        now = time.monotonic()
+        if now < self._time_next_stream:
+            return
+        self._time_next_stream += 1 / STREAM_RATE_HZ
+        if self._time_next_stream < now:
+            self._time_next_stream = now + 1 / STREAM_RATE_HZ  # No catch up
+        for session in list(self._sessions.values()):
+            if session.command is not None:
+                self._guard(session, self._send_now, session.command)
+
+    def _send_now(self, session:Car_session, message_2_car:bytes):
+        """ Queues message_2_car (see _send) and writes it at once """
+        self._send(session, message_2_car)
+        self._write(session)
+
+    def _send(self, session:Car_session, message_2_car:bytes):
+        """ Encodes message_2_car in the wire format of session and queues 
+        it in tx_buffer (see _write) """
+        if session.wire_format == CommunMessages.WIRE_FORMAT_BINARY:
+            # Reused frame, copied by the consumers below
+            data_2_send = session.frame_bin.encode(message_2_car, 
+                session.sequence_2_car)
+        else:
+            data_2_send = message_2_car     # As written by the GUI
+        session.tx_buffer += data_2_send
+        session.link.on_command_sent(data_2_send, time.monotonic_ns())
+        session.sequence_2_car += 1
+        session.command_new = False
+        if self._recorder is not None:
+            self._recorder.record(Recorder.RECORD_DIR_OUT, session.car_id, 
+                data_2_send)
+
+    def _publish_link_stats(self):
+        """ Every LINK_STATS_PERIOD_SEC, writes the link statistics of each 
+        car to slot_link_stats """
+        if self._slot_link_stats is None:
+            return
+        now = time.monotonic()
+        if now < self._time_next_link_stats:
+            return
+        self._time_next_link_stats = now + LINK_STATS_PERIOD_SEC
+        for car_id, session in list(self._sessions.items()):
+            self._guard(session, self._write_link_stats)
+
+    def _write_link_stats(self, session:Car_session):
+        self._slot_link_stats.write(session.link.pack(), session.car_id)
+
+    def _check_timeout(self):
+        """ Closes the connections where nothing was received for 
+        TIMEOUT_SEC """
+        now = time.monotonic()
+        for session in list(self._sessions.values()):
+            if now - session.time_last_rx > TIMEOUT_SEC:
+                _log.warning('car %d timeout', session.car_id)
+                self._close(session)
 
 #==============================================================================
 # Function definitions
@@ -42,7 +548,8 @@ class State():
 
 def _init_socket(server_state_out:Value) -> socket.socket:
     """
-    Initialises a TCP socket with globally-defined HOST_IP and HOST_PORT
+    Initialises a non-blocking TCP socket with globally-defined HOST_IP and 
+    HOST_PORT
 
     :param server_state_out: Status report. Check class State for more info
     :type server_state_out: (Value(int)) from multiprocessing
@@ -52,121 +559,79 @@ def _init_socket(server_state_out:Value) -> socket.socket:
 
     # Create a TCP/IP socket (AF_INET for IPv4, SOCK_STREAM for TCP)
     my_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM) 
+    my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     # Bind the socket to the port
     server_address = (HOST_IP, HOST_PORT)
-    if DEBUG_EN:
-        print('Server: starting up on {} port {}'.format(*server_address))
-    my_socket.bind(server_address)
-    # Listen for incoming connections
-    my_socket.listen()
+    _log.info('starting up on %s port %d', *server_address)
+    try:
+        my_socket.bind(server_address)
+        # Listen for incoming connections
+        my_socket.listen()
+        my_socket.setblocking(False)
+    except OSError:
+        my_socket.close()
+        raise
     with server_state_out.get_lock():
         server_state_out.value = State.SOCK_LISTENING
     # Return
     return my_socket
 
-def _new_connection(my_socket:socket.socket, server_state_out:Value) \
-        -> (socket.socket):
-    """
-    Waits for a connection to a client to be established and sets a TIMEOUT_SEC
-    on this connection
-
-    :param my_socket: socket previosly initialised
-    :type my_socket: (socket.socket)
-    :param server_state_out: Status report. Check class State for more info
-    :type server_state_out: (Value(int)) from multiprocessing
-    :return: connection already established
-    :rtype: (socket.socket)
-    """
-
-    if DEBUG_EN: print('Server: waiting for a connection')
-    connection, client_address = my_socket.accept()
-    if DEBUG_EN: print('Server: connection from', client_address)
-    connection.settimeout(TIMEOUT_SEC)
-    with server_state_out.get_lock():
-        server_state_out.value = State.CONN_OPEN
-    return connection
-
-def _close_connection(connection:socket.socket, server_state_out:Value):
+def _handshake(pending:bytes) -> str:
     """
-    Closes the connection
+    Chooses the wire format for the current connection according to 
+    WIRE_FORMAT and the data received so far
 
-    :param connection: connection to be closed
-    :type connection: (socket.socket)
-    :param server_state_out: Status report. Check class State for more info
-    :type server_state_out: (Value(int)) from multiprocessing
+    :param pending: bytes received since the connection was established
+    :type pending: (bytes)
+    :return: wire format or None if more data is needed to decide
+    :rtype: (str)
     """
+    if WIRE_FORMAT != WIRE_FORMAT_AUTO:
+        return WIRE_FORMAT
+    wire_format = CommunMessages.detect_wire_format(pending)
+    if wire_format is None and len(pending) >= HANDSHAKE_MAX_BYTES:
+        wire_format = CommunMessages.WIRE_FORMAT_ASCII    # Fallback
+    return wire_format
 
-    connection.close()
-    with server_state_out.get_lock():
-        server_state_out.value = State.CONN_ERROR
+def _get_workmode(message:bytes) -> int:
+    """ Returns the workmode of message (ASCII outgoing format), None if it 
+    is not a number """
+    workmode = message[:CommunMessages.NB_CHAR_PER_MESS]
+    return int(workmode) if workmode.isdigit() else None
 
-def run_server( server_state_out:Value, queue_from_car:Queue(1), 
-                queue_2_car:Queue(1), queue_exit:Queue(1)):
+def run_server( server_state_out:Value, slot_from_car:Latest_value_slot, 
+                slot_2_car:Latest_value_slot, event_exit:Event,
+                latency_stats:Latency.Latency_stats=None,
+                slot_link_stats:Latest_value_slot=None):
     """
-    Initialises TCP socket with global parameters, create and attend a 
-    connection from client. Reconnection is done if any error occurs.
+    Initialises TCP socket with global parameters, accepts and attends the
+    connections from the cars (see Server_engine). Reconnection is done if any 
+    error occurs.
     
     :param server_state_out: allows reporting the status of the server to other
     processes. Check class State for more information
     :type server_state_out: (Value(int)) from multiprocessing
-    :param queue_from_car: when an element is received from the car, it is 
-    stored here as str
-    :type queue_from_car: Queue(1) from multiprocessing
-    :param queue_2_car: when a str message comes via this queue, it is taken and 
-    sent to the car
-    :type queue_2_car: Queue(1) from multiprocessing
-    :param queue_exit: the function finishes if the queue stores ANY element
-    :type queue_exit: Queue(1) from multiprocessing
-    :exceptions: any exception raised during this function leads to a reset
-    in the connection
+    :param slot_from_car: when a complete frame is received from a car, it 
+    is written here as bytes (in the wire format in use, see 
+    CommunMessages.decode_frame), at the index given by the car ID. If several
+    frames arrive at once, only the newest is written
+    :type slot_from_car: (Latest_value_slot) with NB_SLOTS slots
+    :param slot_2_car: when a new message (ASCII outgoing format, bytes) is 
+    written here, it becomes the command streamed to the car whose ID is the
+    index of the slot (or to every car if the index is CAR_ID_ALL), see 
+    STREAM_RATE_HZ
+    :type slot_2_car: (Latest_value_slot) with NB_SLOTS slots
+    :param event_exit: the function finishes when the event is set
+    :type event_exit: (Event) from multiprocessing
+    :param latency_stats: if given, the recv->enqueue latency of the frames 
+    written to slot_from_car is recorded there
+    :type latency_stats: (Latency.Latency_stats)
+    :param slot_link_stats: if given, the link statistics of each car 
+    (LinkMonitor.Link_monitor.pack) are written here, at the index given by 
+    the car ID
+    :type slot_link_stats: (Latest_value_slot) with NB_SLOTS slots of 
+    capacity LinkMonitor.LINK_STATS_SIZE
     """
 
-    my_socket = _init_socket(server_state_out)
-    while True:
-        # If message in exit queue, close process
-        if queue_exit.full() == True:
-            break
-        # Create new connection
-        connection = _new_connection(my_socket, server_state_out)
-        # Attend the connection
-        try:    
-            while True:
-                # If message in exit queue, close process
-                if queue_exit.full() == True:
-                    if DEBUG_EN: print("Exiting from Server...")
-                    break
-                # Receive the data in chunks of 1024 bytes
-                data = connection.recv(1024)
-                if data:
-                    queue_elem = str(data.decode())
-                    if (queue_from_car.full() == True):
-                        queue_from_car.empty()  # Only most recent data is valid
-                    queue_from_car.put(queue_elem)
-                    if DEBUG_EN:
-                        received_str = ""
-                        # for i in range(0,len(queue_elem),5):
-                        for i in range(0,5*10,5):
-                            received_str += queue_elem[i:i+5] + ','
-                        print('Server / received: ' + received_str)
-                # Send data from queue or ack if empty
-                # if (queue_2_car.empty() == True):
-                    # # Send ack back
-                    # ack_msg = bytes("ack", 'utf-8')
-                    # connection.sendall(ack_msg)
-                # else:
-                while(queue_2_car.empty() == False):
-                    data_2_send = bytes(queue_2_car.get(), 'utf-8')
-                    connection.sendall(data_2_send)
-                    if DEBUG_EN:
-                        sent_str = ""
-                        for i in range(0,len(data_2_send.decode()),5):
-                            sent_str += data_2_send.decode()[i:i+5] + ','
-                        print("Server / sent: " + sent_str)
-                    
-        # Timeout. Wait for new conection
-        except Exception as e:
-            _close_connection(connection, server_state_out) 
-
-            
-
-
+    Server_engine(server_state_out, slot_from_car, slot_2_car, 
+        event_exit, latency_stats, slot_link_stats).run()
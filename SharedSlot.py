@@ -0,0 +1,213 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: SharedSlot.py
+# Description: latest-value channel between processes on shared memory. The
+# writer never blocks and the reader always gets the newest complete message
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+from multiprocessing import shared_memory
+import os
+import struct
+import sys
+import time
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+"""
+/* Shared memory layout (one or more slots, each one aligned to a cache line):
+ * 		Bytes 0-7: sequence number. Unsigned. Odd while the writer is copying
+ *		Bytes 8-11: length of the message stored. Unsigned
+ *		Bytes 12-15: unused
+ *		Bytes 16-31: NB_STAMPS timestamps given by the writer
+ *		(time.monotonic_ns, 0 if not given). Unsigned, 8 bytes each
+ *		Bytes 32-...: message (up to capacity bytes)
+ *
+ * Seqlock protocol (a single writer per slot):
+ *  - Writer: sequence += 1 (odd), copy length, stamps and message,
+ *    sequence += 1 (even). Never waits for the reader
+ *  - Reader: read sequence (retry if odd), copy length, stamps and message,
+ *    read sequence again and retry if it changed. A torn message is never
+ *    returned
+ *
+ * The sequence number is read and written with a single aligned 8-byte
+ * access. Store order is preserved on x86/x64 (total store order), which is
+ * what the seqlock relies on since CPython has no explicit memory barriers.
+ */
+"""
+_SEQ_STRUCT = struct.Struct('<Q')
+_LEN_STRUCT = struct.Struct('<I')
+_LEN_OFFSET = 8
+_STAMPS_OFFSET = 16
+_HEADER_SIZE = 32
+_ALIGNMENT = 64
+
+NB_STAMPS = 2
+_STAMPS_STRUCT = struct.Struct('<' + 'Q'*NB_STAMPS)
+_NO_STAMPS = (0,)*NB_STAMPS
+
+DEFAULT_CAPACITY = 64       # Bytes, enough for any frame in CommunMessages
+SPINS_BEFORE_YIELD = 100    # Retries of a read before yielding the CPU
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Latest_value_slot():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Latest_value_slot class holds nb_slots independent slots in a shared memory
+    block. Each slot stores only the most recent message written (bytes):
+    writing overwrites the previous message whether it was read or not. The
+    object can be passed to other processes (it is attached again by name).
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - name: str. Name of the shared memory block
+    - nb_slots: int. Number of independent slots
+    - capacity: int. Maximum size of a message in bytes
+    - last_stamps: list. Stamps of the last message read from each slot
+    """
+    def __init__(self, nb_slots:int=1, capacity:int=DEFAULT_CAPACITY,
+                    name:str=None):
+        """
+        :param nb_slots: number of independent slots
+        :param capacity: maximum size of a message in bytes
+        :param name: if given, an existing block with this name is attached
+        instead of creating a new one
+        """
+        self.nb_slots = nb_slots
+        self.capacity = capacity
+        self._stride = -(-(_HEADER_SIZE + capacity) // _ALIGNMENT) * _ALIGNMENT
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True,
+                size=self._stride*nb_slots)
+            self._shm.buf[:self._stride*nb_slots] = \
+                bytes(self._stride*nb_slots)
+            self._owner = True
+        else:
+            self._shm = attach_shared_memory(name)
+            self._owner = False
+        self.name = self._shm.name
+        self._buf = self._shm.buf
+        self._last_seq = [0]*nb_slots
+        self.last_stamps = [_NO_STAMPS]*nb_slots
+
+    def __getstate__(self):
+        return (self.name, self.nb_slots, self.capacity)
+
+    def __setstate__(self, state):
+        name, nb_slots, capacity = state
+        self.__init__(nb_slots, capacity, name)
+
+    def write(self, data:bytes, index:int=0, stamps:tuple=_NO_STAMPS):
+        """
+        Stores data as the latest message of the slot. Never blocks
+
+        :param data: message
+        :type data: (bytes, bytearray or memoryview)
+        :param index: slot to write to
+        :param stamps: NB_STAMPS timestamps (ns) stored with the message, used
+        to measure the latency of each stage (see Latency.py)
+        :exception ValueError if data is bigger than capacity
+        """
+        size = len(data)
+        if size > self.capacity:
+            raise ValueError("Message too big for the slot: " + str(size))
+        buf = self._buf
+        offset = index*self._stride
+        seq = _SEQ_STRUCT.unpack_from(buf, offset)[0]
+        _SEQ_STRUCT.pack_into(buf, offset, seq + 1)
+        _LEN_STRUCT.pack_into(buf, offset + _LEN_OFFSET, size)
+        _STAMPS_STRUCT.pack_into(buf, offset + _STAMPS_OFFSET, *stamps)
+        buf[offset+_HEADER_SIZE:offset+_HEADER_SIZE+size] = data
+        _SEQ_STRUCT.pack_into(buf, offset, seq + 2)
+
+    def read_seq(self, index:int=0) -> tuple:
+        """
+        Returns the sequence number and a copy of the latest message of the
+        slot, retrying while the writer is updating it. Its stamps are kept
+        in last_stamps[index]
+
+        :param index: slot to read from
+        :return: (sequence number, message). Message is None if the slot was
+        never written (sequence number 0)
+        :rtype: (int, bytes)
+        """
+        buf = self._buf
+        offset = index*self._stride
+        start = offset + _HEADER_SIZE
+        spins = 0
+        while True:
+            seq = _SEQ_STRUCT.unpack_from(buf, offset)[0]
+            if not seq & 1:
+                size = min(_LEN_STRUCT.unpack_from(buf, offset+_LEN_OFFSET)[0],
+                    self.capacity)
+                data = bytes(buf[start:start+size])
+                stamps = _STAMPS_STRUCT.unpack_from(buf, offset+_STAMPS_OFFSET)
+                if _SEQ_STRUCT.unpack_from(buf, offset)[0] == seq:
+                    self.last_stamps[index] = stamps
+                    return seq, (data if seq else None)
+            spins += 1
+            if spins >= SPINS_BEFORE_YIELD:
+                spins = 0
+                time.sleep(0)
+
+    def read(self, index:int=0) -> bytes:
+        """ Returns the latest message of the slot (None if never written) """
+        seq, data = self.read_seq(index)
+        self._last_seq[index] = seq
+        return data
+
+    def read_new(self, index:int=0) -> bytes:
+        """ Returns the latest message of the slot if it was written since the
+        last read through this object, None otherwise """
+        if _SEQ_STRUCT.unpack_from(self._buf, index*self._stride)[0] == \
+                self._last_seq[index]:
+            return None
+        return self.read(index)
+
+    def recover(self):
+        """ Makes every slot readable again after the writer process died
+        while writing (odd sequence number). The message of such a slot may
+        be torn. To be called only when no writer is running """
+        for index in range(self.nb_slots):
+            offset = index*self._stride
+            seq = _SEQ_STRUCT.unpack_from(self._buf, offset)[0]
+            if seq & 1:
+                _SEQ_STRUCT.pack_into(self._buf, offset, seq + 1)
+
+    def close(self):
+        """ Detaches this object from the shared memory block """
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        """ Destroys the shared memory block (to be called once, by the
+        process which created it, when no process uses it anymore) """
+        if self._owner:
+            self._shm.unlink()
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def attach_shared_memory(name:str) -> shared_memory.SharedMemory:
+    """ Attaches an existing block without registering it in the resource
+    tracker of this process, which would destroy it when this process ends """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == "posix":
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
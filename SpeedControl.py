@@ -0,0 +1,256 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: SpeedControl.py
+# Description: host-side closed-loop speed control for Automatic mode: a PID
+# turns the linear speed setpoint and the speed measured by the car into
+# Manual mode percentages, computed at a fixed rate by a deadline scheduler
+# which does not drift and reports its timing
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+from collections import deque
+import math
+import time
+
+import CommunMessages
+from Stats import percentile
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+# Gains of the PID, in % of manual speed per mm/s of error (kp), per mm/s
+# integrated over 1 s (ki) and per mm/s^2 (kd). The feedforward gives the
+# percentage expected for the setpoint (1000 mm/s at 100% on the car)
+SPEED_KP = 0.2
+SPEED_KI = 1.0
+SPEED_KD = 0.0
+SPEED_FEEDFORWARD = 0.1
+OUTPUT_MIN_PERC = -100
+OUTPUT_MAX_PERC = 100
+
+# Measurement: linspeed_mms, or the mean wheel speed if it is wrong
+WHEEL_PERIMETER_MM = 204        # 65 mm wheels
+# Output 0 (and integral cleared) if no valid measurement meanwhile
+MEASUREMENT_TIMEOUT_SEC = 0.2
+
+# Manual mode command sent by the loop: (workmode, OY %, OX %, 0, 0)
+WORKMODE_MANUAL = CommunMessages.get_workmode_id("Manual mode")
+
+STATS_WINDOW = 1000             # Ticks kept for the rolling statistics
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Pid_controller():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Pid_controller class computes a bounded output from the error between a
+    setpoint and a measurement, plus a feedforward proportional to the
+    setpoint. The derivative acts on the measurement (no kick when the
+    setpoint changes) and the integral is frozen while the output is
+    saturated in the direction of the error (anti-windup)
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - kp, ki, kd, feedforward: float. Gains (see SPEED_KP...)
+    - output_min / output_max: float. Bounds of the output
+    - integral: float. Integral term, already multiplied by ki
+    """
+    def __init__(   self, kp:float=SPEED_KP, ki:float=SPEED_KI,
+                    kd:float=SPEED_KD, feedforward:float=SPEED_FEEDFORWARD,
+                    output_min:float=OUTPUT_MIN_PERC,
+                    output_max:float=OUTPUT_MAX_PERC):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.feedforward = feedforward
+        self.output_min = output_min
+        self.output_max = output_max
+        self.integral = 0.0
+        self._last_measurement = None
+
+    def reset(self):
+        """ Clears the integral and the derivative history """
+        self.integral = 0.0
+        self._last_measurement = None
+
+    def update(self, setpoint:float, measurement:float, dt:float) -> float:
+        """
+        :param dt: seconds since the previous update
+        :return: output, within [output_min, output_max]
+        """
+        error = setpoint - measurement
+        derivative = 0.0
+        if self._last_measurement is not None and dt > 0:
+            derivative = -(measurement - self._last_measurement) / dt
+        self._last_measurement = measurement
+        unbounded = self.feedforward*setpoint + self.kp*error + \
+            self.integral + self.kd*derivative
+        output = min(max(unbounded, self.output_min), self.output_max)
+        # Integrate unless it would push the output further into saturation
+        if output == unbounded or (unbounded > output) != (error > 0):
+            self.integral += self.ki*error*dt
+        return output
+
+class Deadline_scheduler():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Deadline_scheduler class runs a periodic task on absolute deadlines
+    start + n*period (monotonic clock, ns): a late tick does not delay the
+    next ones, so the rate does not drift. A tick later than one period
+    skips the deadlines it passed (counted as missed) instead of running
+    them back to back. For every tick it measures the lateness (start of the
+    tick - deadline), the period (start - start of the previous tick) and the
+    compute time (due -> done)
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - period_ns: int. Period of the task
+    - deadline_ns: int. Deadline of the next tick
+    - ticks: int. Ticks run
+    - missed_deadlines: int. Deadlines skipped because a tick was too late
+    """
+    def __init__(self, rate_hz:float, window:int=STATS_WINDOW):
+        self.period_ns = round(1e9 / rate_hz)
+        self.deadline_ns = time.monotonic_ns()
+        self.ticks = 0
+        self.missed_deadlines = 0
+        self._time_tick_ns = None
+        self._lateness_ns = deque(maxlen=window)
+        self._periods_ns = deque(maxlen=window)
+        self._compute_ns = deque(maxlen=window)
+
+    def time_to_next(self, now_ns:int) -> float:
+        """ Returns the seconds until the next deadline (0 if passed) """
+        return max(0, self.deadline_ns - now_ns) / 1e9
+
+    def due(self, now_ns:int) -> bool:
+        """ Returns True if a tick must run now (then call done when it
+        ends) and moves to the next deadline """
+        lateness_ns = now_ns - self.deadline_ns
+        if lateness_ns < 0:
+            return False
+        missed = lateness_ns // self.period_ns
+        self.missed_deadlines += missed
+        self.deadline_ns += (missed + 1)*self.period_ns
+        self._lateness_ns.append(lateness_ns - missed*self.period_ns)
+        if self._time_tick_ns is not None:
+            self._periods_ns.append(now_ns - self._time_tick_ns)
+        self._time_tick_ns = now_ns
+        self.ticks += 1
+        return True
+
+    def done(self, now_ns:int):
+        """ Ends the tick started by the last due returning True """
+        self._compute_ns.append(now_ns - self._time_tick_ns)
+
+    def stats(self) -> dict:
+        """ Returns the timing statistics over the last ticks (ms for the
+        lateness and the period jitter, us for the compute time) """
+        lateness = sorted(self._lateness_ns)
+        jitter = sorted(abs(period - self.period_ns)
+            for period in self._periods_ns)
+        compute = sorted(self._compute_ns)
+        return {
+            "ticks": self.ticks,
+            "missed_deadlines": self.missed_deadlines,
+            "period_ms": self.period_ns / 1e6,
+            "lateness_p50_ms": percentile(lateness, 50) / 1e6,
+            "lateness_p99_ms": percentile(lateness, 99) / 1e6,
+            "lateness_max_ms": percentile(lateness, 100) / 1e6,
+            "jitter_p99_ms": percentile(jitter, 99) / 1e6,
+            "compute_p50_us": percentile(compute, 50) / 1e3,
+            "compute_p99_us": percentile(compute, 99) / 1e3,
+            "compute_max_us": percentile(compute, 100) / 1e3,
+        }
+
+class Speed_loop():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Speed_loop class controls the linear speed of one car: on_frame takes
+    the speed measured from every frame received and compute gives the
+    Manual mode command for the current setpoint
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - pid: Pid_controller
+    - setpoint_mms: float. Linear speed wanted
+    - measurement_mms: float. Last speed measured (None if none yet)
+    - time_measurement_ns: int. time.monotonic_ns() of the last measurement
+    - output_perc: int. Last percentage computed
+    """
+    def __init__(self, pid:Pid_controller=None):
+        self.pid = Pid_controller() if pid is None else pid
+        self.setpoint_mms = 0.0
+        self.measurement_mms = None
+        self.time_measurement_ns = None
+        self.output_perc = 0
+        self._time_compute_ns = None
+
+    def set_setpoint(self, setpoint_mms:float):
+        self.setpoint_mms = setpoint_mms
+
+    def on_frame(self, message:CommunMessages.Message_struct_in,
+                    time_ns:int):
+        """ Takes the speed measured from a decoded frame, if valid """
+        speed_mms = measured_speed(message)
+        if speed_mms is not None:
+            self.measurement_mms = speed_mms
+            self.time_measurement_ns = time_ns
+
+    def compute(self, now_ns:int) -> tuple:
+        """
+        :return: values of the Manual mode command (outgoing_pos_dic
+        order). The output is 0 while the measurement is missing or older
+        than MEASUREMENT_TIMEOUT_SEC
+        :rtype: (tuple)
+        """
+        dt = 0.0
+        if self._time_compute_ns is not None:
+            dt = (now_ns - self._time_compute_ns) / 1e9
+        self._time_compute_ns = now_ns
+        if self.time_measurement_ns is None or now_ns - \
+                self.time_measurement_ns > MEASUREMENT_TIMEOUT_SEC*1e9:
+            self.pid.reset()
+            self.output_perc = 0
+        else:
+            self.output_perc = round(self.pid.update(self.setpoint_mms,
+                self.measurement_mms, dt))
+        return (WORKMODE_MANUAL, self.output_perc, 0, 0, 0)
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def measured_speed(message:CommunMessages.Message_struct_in) -> float:
+    """ Returns the linear speed (mm/s) of a decoded frame: linspeed_mms, or
+    the mean wheel speed if linspeed_mms is wrong (None if both are) """
+    if not message.linspeed_err:
+        return message.linspeed_mms
+    if not (message.lspeed_err or message.rspeed_err):
+        return (message.lspeed_rpm + message.rspeed_rpm) / 2 * \
+            WHEEL_PERIMETER_MM / 60
+    return None
+
+def format_stats(stats:dict) -> str:
+    """ Returns the timing statistics of a Deadline_scheduler as one line """
+    return ("ticks {ticks}, missed {missed_deadlines}, late p50/p99/max "
+        "{lateness_p50_ms:.2f}/{lateness_p99_ms:.2f}/{lateness_max_ms:.2f} "
+        "ms, jitter p99 {jitter_p99_ms:.2f} ms, compute p50/p99/max "
+        "{compute_p50_us:.0f}/{compute_p99_us:.0f}/{compute_max_us:.0f} "
+        "us").format(**stats)
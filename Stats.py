@@ -0,0 +1,23 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: Stats.py
+# Description: statistics helpers shared by the link monitor, the speed
+# control and the benchmarks
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import math
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def percentile(values:list, percent:float) -> float:
+    """ Returns the percentile of sorted values (NaN if empty) """
+    if not values:
+        return math.nan
+    return values[min(int(percent/100*len(values)), len(values)-1)]
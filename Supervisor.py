@@ -0,0 +1,228 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: Supervisor.py
+# Description: starts the processes of the application and watches them:
+# shutdown as soon as the exit event is set or an essential process ends,
+# restart of crashed processes, startup and shutdown times
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+from multiprocessing import Process, Value
+from multiprocessing.connection import wait
+import time
+
+from Server import State
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+SUPERVISOR_TICK_SEC = 0.5   # Max time between checks of the exit event
+STARTUP_POLL_SEC = 0.001    # Check of the server state while it starts
+RESTART_DELAY_SEC = 1.0     # Wait before restarting a crashed process
+SHUTDOWN_TIMEOUT_SEC = 2.0  # Time given to the processes to end by themselves
+KILL_TIMEOUT_SEC = 1.0      # Time given to the processes after terminate()
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Child_process():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Child_process class holds a process watched by Process_supervisor and
+    what to do when it ends
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - name: str. Name used in the reports
+    - target, args: function run by the process and its arguments
+    - essential: bool. The application exits when this process ends
+    - restart: bool. The process is started again if it crashes (exit code
+    other than 0)
+    - server_state: Value(int). If given, the time from the start of the
+    process to State.SOCK_LISTENING is reported
+    - process: Process. Current process (None before start)
+    - time_start: float. time.monotonic() of the last start
+    - time_restart: float. When the process must be started again (None if
+    no restart is pending)
+    - restarts: int. Number of restarts
+    """
+    def __init__(self, name:str, target, args:tuple, essential:bool=False,
+                    restart:bool=False, server_state:Value=None):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.essential = essential
+        self.restart = restart
+        self.server_state = server_state
+        self.process = None
+        self.time_start = None
+        self.time_restart = None
+        self.restarts = 0
+
+class Process_supervisor():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Process_supervisor class starts the processes added and waits on their
+    sentinels (and on the exit event, checked every SUPERVISOR_TICK_SEC), so
+    it wakes up as soon as any of them ends. The application is closed when
+    the exit event is set or an essential process ends: the exit event is set
+    so every process finishes its loop, and the ones still alive after
+    SHUTDOWN_TIMEOUT_SEC are terminated, then killed. A process added with
+    restart=True is started again, after RESTART_DELAY_SEC, if it crashes.
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - report: dict. Startup times (startup_to_listening_sec, one per start
+    of each process with server_state), restarts, close_to_exit_sec
+    """
+    def __init__(self, event_exit, before_restart=None, verbose:bool=True):
+        """
+        :param event_exit: set by any process to close the application
+        :type event_exit: (Event) from multiprocessing
+        :param before_restart: called with the Child_process before starting
+        it again (e.g. to recover the shared slots it was writing to)
+        :param verbose: print the events and times measured
+        """
+        self._event_exit = event_exit
+        self._before_restart = before_restart
+        self._verbose = verbose
+        self._children = []
+        self.report = {"startup_to_listening_sec": {}, "restarts": {},
+            "close_to_exit_sec": None}
+
+    def add(self, name:str, target, args:tuple=(), essential:bool=False,
+                restart:bool=False, server_state:Value=None):
+        """ Adds a process to start and watch (see Child_process) """
+        self._children.append(Child_process(name, target, args, essential,
+            restart, server_state))
+
+    def _print(self, text:str):
+        if self._verbose: print("Supervisor: " + text)
+
+    def _start(self, child:Child_process):
+        child.process = Process(target=child.target, args=child.args,
+            name=child.name)
+        child.time_start = time.monotonic()
+        child.time_restart = None
+        child.process.start()
+
+    def _check_listening(self) -> bool:
+        """ Reports the processes which started listening. Returns True if
+        any is still starting """
+        starting = False
+        for child in self._children:
+            if child.server_state is None or child.time_start is None:
+                continue
+            if child.server_state.value == State.SOCK_LISTENING:
+                startup_sec = time.monotonic() - child.time_start
+                self.report["startup_to_listening_sec"].setdefault(
+                    child.name, []).append(startup_sec)
+                self._print("{} listening {:.1f} ms after start".format(
+                    child.name, 1000*startup_sec))
+                child.time_start = None
+            elif child.process.is_alive():
+                starting = True
+        return starting
+
+    def _handle_end(self, child:Child_process) -> bool:
+        """ Handles the end of the process of child. Returns True if the
+        application must be closed """
+        child.process.join()
+        exitcode = child.process.exitcode
+        child.time_start = None
+        if child.essential:
+            self._print("{} ended (exit code {})".format(child.name,
+                exitcode))
+            return True
+        if exitcode != 0 and child.restart:
+            self._print("{} crashed (exit code {}), restart in {} s".format(
+                child.name, exitcode, RESTART_DELAY_SEC))
+            child.time_restart = time.monotonic() + RESTART_DELAY_SEC
+        else:
+            self._print("{} ended (exit code {})".format(child.name,
+                exitcode))
+        child.process = None
+        return False
+
+    def run(self) -> dict:
+        """
+        Starts the processes and supervises them until the application is
+        closed. Returns when every process has ended
+
+        :return: report (see attributes)
+        :rtype: (dict)
+        """
+        for child in self._children:
+            self._start(child)
+        starting = True
+        try:
+            while not self._event_exit.is_set():
+                # Wait for any process to end
+                timeout = STARTUP_POLL_SEC if starting else \
+                    SUPERVISOR_TICK_SEC
+                for child in self._children:
+                    if child.time_restart is not None:
+                        timeout = min(timeout,
+                            max(0, child.time_restart - time.monotonic()))
+                sentinels = {child.process.sentinel: child
+                    for child in self._children if child.process is not None}
+                ended = wait(list(sentinels), timeout)
+                if any(self._handle_end(sentinels[sentinel])
+                        for sentinel in ended):
+                    break
+                # Restart the crashed processes
+                for child in self._children:
+                    if child.time_restart is not None and \
+                            time.monotonic() >= child.time_restart:
+                        if self._before_restart is not None:
+                            self._before_restart(child)
+                        if child.server_state is not None:
+                            child.server_state.value = State.SOCK_CLOSED
+                        child.restarts += 1
+                        self.report["restarts"][child.name] = child.restarts
+                        self._start(child)
+                        starting = True
+                if starting:
+                    starting = self._check_listening()
+        except KeyboardInterrupt:
+            pass
+        self._shutdown()
+        return self.report
+
+    def _shutdown(self):
+        """ Closes every process within SHUTDOWN_TIMEOUT_SEC +
+        KILL_TIMEOUT_SEC """
+        time_close = time.monotonic()
+        self._event_exit.set()
+        processes = [child.process for child in self._children
+            if child.process is not None]
+        deadline = time_close + SHUTDOWN_TIMEOUT_SEC
+        for signal_name in ("terminate", "kill"):
+            while processes and time.monotonic() < deadline:
+                for sentinel in wait([process.sentinel for process in
+                        processes], deadline - time.monotonic()):
+                    processes = [process for process in processes
+                        if process.sentinel != sentinel]
+            for process in processes:
+                self._print("{} still running, {}".format(process.name,
+                    signal_name))
+                getattr(process, signal_name)()
+            deadline = time.monotonic() + KILL_TIMEOUT_SEC
+        for child in self._children:
+            if child.process is not None:
+                child.process.join()
+        self.report["close_to_exit_sec"] = time.monotonic() - time_close
+        self._print("all processes ended {:.1f} ms after close".format(
+            1000*self.report["close_to_exit_sec"]))
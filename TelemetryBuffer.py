@@ -0,0 +1,152 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: TelemetryBuffer.py
+# Description: history of the decoded telemetry in the GUI process (fixed
+# capacity ring buffer backed by NumPy arrays) and downsampling of a time
+# window to a bounded number of points, so plotting costs the same whatever
+# the number of samples in the window
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import numpy as np
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+RING_CAPACITY = 1 << 17     # Samples kept (~22 min at 100 Hz), 4 bytes per
+                            # channel and 8 bytes (time) per sample
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Telemetry_ring():
+    """
+    ===========================================================================
+    Description
+    ===========================================================================
+    Telemetry_ring class keeps the last capacity samples of a few channels.
+    Memory is allocated once: appending writes one row in place and the
+    oldest sample is overwritten when the buffer is full. Values are stored
+    as float32 (exact for 16-bit fields), NaN meaning "no valid value".
+
+    ===========================================================================
+    Attributes
+    ===========================================================================
+    - names: tuple of str. Name of each channel (column)
+    - capacity: int. Max number of samples kept
+    - samples_appended: int. Samples appended since the last clear()
+    """
+    def __init__(self, names:tuple, capacity:int=RING_CAPACITY):
+        self.names = tuple(names)
+        self.capacity = capacity
+        self._columns = {name: index for index, name in enumerate(names)}
+        self._times_ns = np.zeros(capacity, dtype=np.int64)
+        self._values = np.full((capacity, len(names)), np.nan,
+            dtype=np.float32)
+        self._next = 0          # Row written by the next append
+        self.samples_appended = 0
+
+    def __len__(self) -> int:
+        return min(self.samples_appended, self.capacity)
+
+    def append(self, time_ns:int, values:tuple):
+        """
+        :param time_ns: time.monotonic_ns() of the sample (not decreasing)
+        :param values: one value per channel (None or NaN if not valid)
+        """
+        row = self._next
+        self._times_ns[row] = time_ns
+        self._values[row] = [np.nan if value is None else value
+            for value in values]
+        self._next = row + 1 if row + 1 < self.capacity else 0
+        self.samples_appended += 1
+
+    def clear(self):
+        """ Forgets every sample (no reallocation) """
+        self._next = 0
+        self.samples_appended = 0
+
+    def latest_time_ns(self) -> int:
+        """ Returns the time of the newest sample (None if empty) """
+        if not self.samples_appended:
+            return None
+        return int(self._times_ns[self._next - 1])
+
+    def get(self, name:str, time_from_ns:int=None) -> tuple:
+        """
+        Returns the samples of a channel in chronological order. Views of the
+        buffer are returned when the samples are contiguous, copies when
+        they wrap around (valid until the next append either way)
+
+        :param name: channel
+        :param time_from_ns: only the samples at or after this time
+        :return: times (ns, int64) and values (float32)
+        :rtype: (tuple of np.ndarray)
+        """
+        column = self._columns[name]
+        if self.samples_appended < self.capacity:
+            segments = [slice(0, self._next)]
+        else:
+            segments = [slice(self._next, self.capacity),
+                slice(0, self._next)]
+        if time_from_ns is not None:
+            # Times are sorted within each segment
+            for index, segment in enumerate(segments):
+                times = self._times_ns[segment]
+                if times.size and times[-1] >= time_from_ns:
+                    start = segment.start + int(np.searchsorted(times,
+                        time_from_ns))
+                    segments = [slice(start, segment.stop)] + \
+                        segments[index+1:]
+                    break
+            else:
+                segments = []
+        if not segments:
+            return (np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.float32))
+        if len(segments) == 1:
+            return (self._times_ns[segments[0]],
+                self._values[segments[0], column])
+        return (np.concatenate([self._times_ns[segment]
+                for segment in segments]),
+            np.concatenate([self._values[segment, column]
+                for segment in segments]))
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def downsample_minmax(x:np.ndarray, y:np.ndarray, nb_points:int) -> tuple:
+    """
+    Min/max decimation: splits the samples in nb_points/2 buckets of
+    consecutive samples and keeps the lowest and the highest of each one (in
+    their original order), so peaks are never lost. Vectorised, O(len(x))
+
+    :param x, y: samples (same length, NaN values of y must be removed)
+    :param nb_points: max number of points returned (at least 2)
+    :return: x and y of the points kept
+    :rtype: (tuple of np.ndarray)
+    """
+    nb_samples = len(y)
+    if nb_samples <= nb_points:
+        return x, y
+    nb_buckets = nb_points // 2
+    bucket_size = -(-nb_samples // nb_buckets)
+    # Pad the last bucket by repeating the last sample
+    padded = np.empty(nb_buckets*bucket_size, dtype=y.dtype)
+    padded[:nb_samples] = y
+    padded[nb_samples:] = y[-1]
+    buckets = padded.reshape(nb_buckets, bucket_size)
+    starts = np.arange(nb_buckets) * bucket_size
+    index_min = np.minimum(starts + buckets.argmin(axis=1), nb_samples-1)
+    index_max = np.minimum(starts + buckets.argmax(axis=1), nb_samples-1)
+    indexes = np.empty(2*nb_buckets, dtype=np.intp)
+    indexes[0::2] = np.minimum(index_min, index_max)
+    indexes[1::2] = np.maximum(index_min, index_max)
+    return x[indexes], y[indexes]
@@ -0,0 +1,195 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: benchmarks/bench_codec.py
+# Description: throughput comparison between the encode / decode functions
+# compiled from the message schemas (MessageCodec) and the previous
+# hand-written ones (per-field conditionals, slicing loop, zfill)
+# Usage: python benchmarks/bench_codec.py
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CommunMessages
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+NB_REPEATS = 5
+VALUES_IN = [1, 50, -20, 300, 0, 250, 120, 118, 1500, 1600]
+VALUES_OUT = [1, 50, -20, 0, 0]
+FRAME_IN = CommunMessages.encode_in_message(VALUES_IN).decode()
+FRAME_IN_BIN = CommunMessages.encode_in_message(VALUES_IN,
+    CommunMessages.WIRE_FORMAT_BINARY)
+
+_legacy_bin_in_struct = struct.Struct('<2sHHhhhhhhhHH')
+_legacy_bin_out_struct = struct.Struct('<2sHHhhhh')
+
+INT16_MIN = CommunMessages.INT16_MIN
+UINT16_MAX = CommunMessages.UINT16_MAX
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Legacy_message_struct_in():
+    """ Previous Message_struct_in: one hand-written conditional per field """
+    __slots__ = (
+        "workmode", "workmode_err",
+        "manctrly_perc", "manctrly_err",
+        "manctrlx_perc", "manctrlx_err",
+        "autctrl_speedy_mms", "autctrl_speedy_err",
+        "autctrl_speedx_mms", "autctrl_speedx_err",
+        "linspeed_mms", "linspeed_err",
+        "lspeed_rpm", "lspeed_err",
+        "rspeed_rpm", "rspeed_err",
+        "ldist_mm", "ldist_err",
+        "rdist_mm", "rdist_err",
+    )
+
+    def set_fields(self, workmode, manctrly_perc, manctrlx_perc,
+                    autctrl_speedy_mms, autctrl_speedx_mms, linspeed_mms,
+                    lspeed_rpm, rspeed_rpm, ldist_mm, rdist_mm):
+        self.workmode = _to_int(workmode)
+        self.workmode_err = not (self.workmode==0 or self.workmode==1 or
+            self.workmode==2)
+        self.manctrly_perc = _to_int(manctrly_perc)
+        self.manctrly_err = False if (self.manctrly_perc >= -100 or
+            self.manctrly_perc <= 100) else True
+        self.manctrlx_perc = _to_int(manctrlx_perc)
+        self.manctrlx_err = False if (self.manctrlx_perc >= -100 or
+            self.manctrlx_perc <= 100) else True
+        self.autctrl_speedy_mms = _to_int(autctrl_speedy_mms)
+        self.autctrl_speedy_err = (self.autctrl_speedy_mms == INT16_MIN or
+            self.autctrl_speedy_mms == None)
+        self.autctrl_speedx_mms = _to_int(autctrl_speedx_mms)
+        self.autctrl_speedx_err = (self.autctrl_speedx_mms == INT16_MIN or
+            self.autctrl_speedx_mms == None)
+        self.linspeed_mms = _to_int(linspeed_mms)
+        self.linspeed_err = (self.linspeed_mms == INT16_MIN or
+            self.linspeed_mms == None)
+        self.lspeed_rpm = _to_int(lspeed_rpm)
+        self.lspeed_err = (self.lspeed_rpm == INT16_MIN or
+            self.lspeed_rpm == None)
+        self.rspeed_rpm = _to_int(rspeed_rpm)
+        self.rspeed_err = (self.rspeed_rpm == INT16_MIN or
+            self.rspeed_rpm == None)
+        self.ldist_mm = _to_int(ldist_mm)
+        self.ldist_err = (self.ldist_mm == UINT16_MAX or
+            self.ldist_mm == None)
+        self.rdist_mm = _to_int(rdist_mm)
+        self.rdist_err = (self.rdist_mm == UINT16_MAX or
+            self.rdist_mm == None)
+
+class Legacy_message_struct_out():
+    """ Previous Message_struct_out: zfill per field """
+    def __init__(self, workmode, manctrly_perc, manctrlx_perc,
+                    autctrl_speedy_mms, autctrl_speedx_mms):
+        self.workmode = int(workmode)
+        self.manctrly_perc = int(manctrly_perc)
+        self.manctrlx_perc = int(manctrlx_perc)
+        self.autctrl_speedy_mms = int(autctrl_speedy_mms)
+        self.autctrl_speedx_mms = int(autctrl_speedx_mms)
+
+    def get_output_format(self):
+        size = CommunMessages.NB_CHAR_PER_MESS
+        out_formatted = ""
+        out_formatted += str(self.workmode).zfill(size)
+        out_formatted += str(self.manctrly_perc).zfill(size)
+        out_formatted += str(self.manctrlx_perc).zfill(size)
+        out_formatted += str(self.autctrl_speedy_mms).zfill(size)
+        out_formatted += str(self.autctrl_speedx_mms).zfill(size)
+        return out_formatted
+
+    def get_output_format_bin(self, sequence):
+        return _legacy_bin_out_struct.pack(CommunMessages.BIN_SYNC_MARKER,
+            sequence & 0xFFFF, self.workmode, self.manctrly_perc,
+            self.manctrlx_perc, self.autctrl_speedy_mms,
+            self.autctrl_speedx_mms)
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _to_int(value) -> int:
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+def _legacy_decode_in_message(message_in:str, reuse):
+    """ Previous decode_in_message: slicing loop, then set_fields by name """
+    size = CommunMessages.NB_CHAR_PER_MESS
+    list_params = []
+    for param_index in range(1, len(CommunMessages.incoming_pos_dic)+1):
+        pos_message = (param_index-1)*size
+        list_params.append(message_in[pos_message:pos_message+size])
+    reuse.set_fields(
+        workmode=list_params[0], manctrly_perc=list_params[1],
+        manctrlx_perc=list_params[2], autctrl_speedy_mms=list_params[3],
+        autctrl_speedx_mms=list_params[4], linspeed_mms=list_params[5],
+        lspeed_rpm=list_params[6], rspeed_rpm=list_params[7],
+        ldist_mm=list_params[8], rdist_mm=list_params[9])
+    return reuse
+
+def _legacy_decode_in_message_bin(message_in:bytes, reuse):
+    reuse.set_fields(*_legacy_bin_in_struct.unpack(message_in)[2:])
+    return reuse
+
+def _legacy_decode_out_message(message_out:str):
+    size = CommunMessages.NB_CHAR_PER_MESS
+    return Legacy_message_struct_out(*(message_out[pos:pos+size]
+        for pos in range(0, len(message_out), size)))
+
+def _ns_per_call(function) -> float:
+    """ Best of NB_REPEATS """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return 1e9*min(timer.repeat(NB_REPEATS, number)) / number
+
+def main():
+    legacy_in = Legacy_message_struct_in()
+    compiled_in = CommunMessages.decode_in_message(FRAME_IN)
+    legacy_out = Legacy_message_struct_out(*VALUES_OUT)
+    compiled_out = CommunMessages.Message_struct_out(*VALUES_OUT)
+    frame_out = compiled_out.get_output_format()
+    cases = {
+        "decode_in_message (ASCII)": (
+            lambda: _legacy_decode_in_message(FRAME_IN, legacy_in),
+            lambda: CommunMessages.decode_in_message(FRAME_IN, compiled_in)),
+        "decode_in_message_bin": (
+            lambda: _legacy_decode_in_message_bin(FRAME_IN_BIN, legacy_in),
+            lambda: CommunMessages.decode_in_message_bin(FRAME_IN_BIN,
+                compiled_in)),
+        "get_output_format": (legacy_out.get_output_format,
+            compiled_out.get_output_format),
+        "get_output_format_bin": (
+            lambda: legacy_out.get_output_format_bin(1),
+            lambda: compiled_out.get_output_format_bin(1)),
+        "decode_out_message": (
+            lambda: _legacy_decode_out_message(frame_out),
+            lambda: CommunMessages.decode_out_message(frame_out)),
+    }
+    print("{:<28}{:>14}{:>14}{:>10}".format(
+        "function", "hand-written", "compiled", "speedup"))
+    for name, (legacy, compiled) in cases.items():
+        legacy_ns = _ns_per_call(legacy)
+        compiled_ns = _ns_per_call(compiled)
+        print("{:<28}{:>11.0f} ns{:>11.0f} ns{:>9.2f}x".format(
+            name, legacy_ns, compiled_ns, legacy_ns / compiled_ns))
+
+#==============================================================================
+# Main flow
+#==============================================================================
+
+if __name__ == '__main__':
+    main()
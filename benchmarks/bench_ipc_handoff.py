@@ -0,0 +1,131 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: benchmarks/bench_ipc_handoff.py
+# Description: handoff latency and CPU cost between two processes, comparing
+# the previous multiprocessing.Queue(1) path with SharedSlot.Latest_value_slot
+# Usage: python benchmarks/bench_ipc_handoff.py [nb_messages] [rate_hz]
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import argparse
+from multiprocessing import Process, Queue
+import os
+import statistics
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import SharedSlot
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+NB_MESSAGES = 5000
+RATE_HZ = 1000
+POLL_SLEEP_SEC = 0.0001     # Slot reader: sleep between polls (as a GUI would)
+
+# Message: send timestamp (ns) + index, padded to the size of a frame
+_MESSAGE_STRUCT = struct.Struct('<QQ34x')
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _produce(put, nb_messages:int, rate_hz:int) -> float:
+    """ Sends nb_messages at rate_hz and returns the CPU time used (s) """
+    period_ns = int(1e9 / rate_hz)
+    cpu_start = time.process_time()
+    deadline = time.perf_counter_ns()
+    for index in range(nb_messages):
+        deadline += period_ns
+        remaining_ns = deadline - time.perf_counter_ns()
+        if remaining_ns > 0:
+            time.sleep(remaining_ns / 1e9)
+        put(_MESSAGE_STRUCT.pack(time.perf_counter_ns(), index))
+    put(_MESSAGE_STRUCT.pack(0, nb_messages))     # End marker
+    return time.process_time() - cpu_start
+
+def _consume_queue(queue:Queue, results:Queue):
+    latencies = []
+    cpu_start = time.process_time()
+    while True:
+        stamp, index = _MESSAGE_STRUCT.unpack(queue.get())
+        if stamp == 0:
+            break
+        latencies.append(time.perf_counter_ns() - stamp)
+    results.put((latencies, time.process_time() - cpu_start))
+
+def _consume_slot(slot:SharedSlot.Latest_value_slot, results:Queue):
+    latencies = []
+    cpu_start = time.process_time()
+    while True:
+        data = slot.read_new()
+        if data is None:
+            time.sleep(POLL_SLEEP_SEC)
+            continue
+        stamp, index = _MESSAGE_STRUCT.unpack(data)
+        if stamp == 0:
+            break
+        latencies.append(time.perf_counter_ns() - stamp)
+    results.put((latencies, time.process_time() - cpu_start))
+
+def _queue_put(queue:Queue):
+    def put(data):
+        # Same pattern as the previous Server / GUI code
+        if queue.full():
+            queue.empty()
+        queue.put(data)
+    return put
+
+def _report(name:str, nb_messages:int, latencies:list, cpu_reader:float,
+        cpu_writer:float):
+    latencies.sort()
+    print("{:<10}{:>10}{:>12.1f}{:>12.1f}{:>12.1f}{:>14.2f}{:>14.2f}".format(
+        name, len(latencies),
+        statistics.median(latencies) / 1000,
+        latencies[int(0.99*(len(latencies)-1))] / 1000,
+        latencies[-1] / 1000,
+        1e6*cpu_writer/nb_messages, 1e6*cpu_reader/nb_messages))
+
+def main(nb_messages:int, rate_hz:int):
+    print("{:<10}{:>10}{:>12}{:>12}{:>12}{:>14}{:>14}".format("channel",
+        "received", "p50 (us)", "p99 (us)", "max (us)", "writer us/msg",
+        "reader us/msg"))
+    results = Queue()
+    # multiprocessing.Queue(1)
+    queue = Queue(1)
+    reader = Process(target=_consume_queue, args=(queue, results))
+    reader.start()
+    cpu_writer = _produce(_queue_put(queue), nb_messages, rate_hz)
+    latencies, cpu_reader = results.get()
+    reader.join()
+    _report("Queue(1)", nb_messages, latencies, cpu_reader, cpu_writer)
+    # Latest_value_slot
+    slot = SharedSlot.Latest_value_slot()
+    reader = Process(target=_consume_slot, args=(slot, results))
+    reader.start()
+    cpu_writer = _produce(slot.write, nb_messages, rate_hz)
+    latencies, cpu_reader = results.get()
+    reader.join()
+    _report("slot", nb_messages, latencies, cpu_reader, cpu_writer)
+    slot.unlink()
+
+#==============================================================================
+# Main flow
+#==============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Robocar IPC handoff "
+        "benchmark")
+    parser.add_argument("nb_messages", type=int, nargs="?",
+        default=NB_MESSAGES)
+    parser.add_argument("rate_hz", type=int, nargs="?", default=RATE_HZ,
+        help="messages sent per second")
+    args = parser.parse_args()
+    main(args.nb_messages, args.rate_hz)
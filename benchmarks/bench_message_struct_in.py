@@ -0,0 +1,116 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: benchmarks/bench_message_struct_in.py
+# Description: memory / throughput comparison between the compact
+# Message_struct_in (slots, plain ints, reusable) and the previous
+# implementation (per-instance __dict__, one np.int16 scalar per value)
+# Usage: python benchmarks/bench_message_struct_in.py
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CommunMessages
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+NB_OBJECTS = 10000
+NB_DECODES = 100000
+
+FRAME = "".join(str(value).zfill(CommunMessages.NB_CHAR_PER_MESS)
+    for value in (1, 50, -20, 300, 0, 250, 120, 118, 1500, 1600))
+
+#==============================================================================
+# Classes
+#==============================================================================
+
+class Legacy_message_struct_in():
+    """ Previous Message_struct_in: __dict__ based, np.int16 values,
+    _str_is_number check before every conversion """
+    def __init__(self, *fields):
+        self.workmode = None
+        if _str_is_number(fields[0]):
+            self.workmode = int(fields[0])
+        self.workmode_err = not (self.workmode in (0, 1, 2))
+        for name, value in zip(("manctrly_perc", "manctrlx_perc",
+                "autctrl_speedy_mms", "autctrl_speedx_mms", "linspeed_mms",
+                "lspeed_rpm", "rspeed_rpm", "ldist_mm", "rdist_mm"),
+                fields[1:]):
+            setattr(self, name, None)
+            if _str_is_number(value):
+                setattr(self, name, np.int16(value))
+            setattr(self, name[:name.rindex("_")] + "_err",
+                getattr(self, name) == None)
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _str_is_number(str:str) -> bool:
+    """ Previous check of the fields: True if int() accepts str """
+    try:
+        int(str)
+        return True
+    except ValueError:
+        return False
+
+def _split(frame:str) -> list:
+    size = CommunMessages.NB_CHAR_PER_MESS
+    return [frame[i:i+size] for i in range(0, len(frame), size)]
+
+def _bytes_per_object(factory) -> float:
+    """ Average traced memory held by one object built by factory """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [factory() for _ in range(NB_OBJECTS)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "lineno"))
+    del objects
+    # Remove the list holding the objects
+    return (total - sys.getsizeof([None]*NB_OBJECTS)) / NB_OBJECTS
+
+def _ns_per_call(function) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(NB_DECODES):
+        function()
+    return (time.perf_counter_ns() - start) / NB_DECODES
+
+def main():
+    fields = _split(FRAME)
+    reused = CommunMessages.Message_struct_in(*fields)
+    results = {
+        "legacy (dict, np.int16)": (
+            _bytes_per_object(lambda: Legacy_message_struct_in(*fields)),
+            _ns_per_call(lambda: Legacy_message_struct_in(*_split(FRAME)))),
+        "compact (slots, new object)": (
+            _bytes_per_object(lambda: CommunMessages.Message_struct_in(*fields)),
+            _ns_per_call(lambda: 
+                CommunMessages.Message_struct_in(*_split(FRAME)))),
+        "compact (slots, reused object)": (0.0,
+            _ns_per_call(lambda: reused.set_fields(*_split(FRAME)))),
+    }
+    print("{:<32}{:>14}{:>14}{:>16}".format(
+        "implementation", "bytes/object", "ns/decode", "decodes/s"))
+    for name, (nb_bytes, ns) in results.items():
+        print("{:<32}{:>14.0f}{:>14.0f}{:>16.0f}".format(
+            name, nb_bytes, ns, 1e9/ns))
+
+#==============================================================================
+# Main flow
+#==============================================================================
+
+if __name__ == '__main__':
+    main()
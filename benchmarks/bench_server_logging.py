@@ -0,0 +1,105 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: benchmarks/bench_server_logging.py
+# Description: cost of the receive path of the server (Server_engine._read:
+# recv, reassembly, slot write, link monitor) per frame with logging off, with
+# the sampled per-frame records, with every frame logged through the writer
+# thread and with every frame written synchronously (as the former prints)
+# Usage: python benchmarks/bench_server_logging.py [nb_frames]
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import argparse
+import logging
+from multiprocessing import Event, Value
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import AsyncLog
+import CommunMessages
+import Server
+import SharedSlot
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+NB_FRAMES = 20000
+FRAME = CommunMessages.encode_in_message([1, 50, -20, 300, 0, 250, 120, 118,
+    1500, 1600])
+
+# Mode: (level, frames logged 1 out of N, max per second, writer thread)
+MODES = {
+    "off (INFO)": (logging.INFO, 1, 0, True),
+    "DEBUG sampled": (logging.DEBUG, Server.LOG_FRAME_EVERY,
+        Server.LOG_FRAME_MAX_PER_SEC, True),
+    "DEBUG every frame": (logging.DEBUG, 1, 0, True),
+    "DEBUG every frame, sync": (logging.DEBUG, 1, 0, False),
+}
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def measure(level:int, every_n:int, max_per_sec:float, writer_thread:bool,
+        nb_frames:int) -> float:
+    """ Returns the mean ns per frame spent in Server_engine._read """
+    Server.LOG_FRAME_EVERY = every_n
+    Server.LOG_FRAME_MAX_PER_SEC = max_per_sec
+    Server.RECORD_DIR = None
+    slot_from_car = SharedSlot.Latest_value_slot(Server.NB_SLOTS)
+    slot_2_car = SharedSlot.Latest_value_slot(Server.NB_SLOTS)
+    engine = Server.Server_engine(Value("i", 0), slot_from_car, slot_2_car,
+        Event())
+    car_end, server_end = socket.socketpair()
+    server_end.setblocking(False)
+    session = Server.Car_session(1, server_end, ("local", 0))
+    engine._sessions[1] = session
+    devnull = open(os.devnull, "w")
+    logger = Server._log
+    if writer_thread:
+        listener = AsyncLog.start_logging(logger, level, stream=devnull)
+    else:
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(logging.Formatter(AsyncLog.LOG_FORMAT))
+        logger.handlers = [handler]
+        logger.setLevel(level)
+        logger.propagate = False
+    spent_ns = 0
+    for _ in range(nb_frames):
+        car_end.send(FRAME)
+        start = time.perf_counter_ns()
+        engine._read(session)
+        spent_ns += time.perf_counter_ns() - start
+    if writer_thread:
+        AsyncLog.stop_logging(logger, listener)
+    logger.handlers = []
+    car_end.close()
+    server_end.close()
+    devnull.close()
+    slot_from_car.unlink()
+    slot_2_car.unlink()
+    return spent_ns / nb_frames
+
+def main(nb_frames:int):
+    print("{:<26}{:>12}".format("logging", "ns/frame"))
+    for mode, settings in MODES.items():
+        print("{:<26}{:>12.0f}".format(mode, measure(*settings, nb_frames)))
+
+#==============================================================================
+# Main flow
+#==============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Robocar server logging "
+        "benchmark")
+    parser.add_argument("nb_frames", type=int, nargs="?", default=NB_FRAMES,
+        help="frames received per logging mode")
+    main(parser.parse_args().nb_frames)
@@ -0,0 +1,163 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: benchmarks/bench_speed_control.py
+# Description: closed-loop test of the host-side speed control on loopback:
+# starts the server with SPEED_CONTROL_EN and N simulated cars
+# (CarSimulator.py), sends a sequence of Automatic mode setpoints through the
+# same slot as the GUI and reports the speed tracking error and the timing of
+# the control loop (period jitter, missed deadlines, compute time per tick)
+# Usage: python benchmarks/bench_speed_control.py --cars 4 --rate-hz 100
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import argparse
+from multiprocessing import Event, Process, Queue, Value
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CarSimulator
+import CommunMessages
+import Server
+import SharedSlot
+from Stats import percentile
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+SETPOINTS_MMS = (300, 700, -400, 0)
+SETTLE_SEC = 1.0            # Error not measured after a setpoint change
+POLL_SLEEP_SEC = 0.001
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _run_server(port:int, rate_hz:float, server_state:Value, slot_from_car,
+        slot_2_car, event_exit:Event, stats_out:Queue):
+    """ Server process with the speed control enabled, reporting the timing
+    statistics of the loop on exit """
+    Server.HOST_IP = "127.0.0.1"
+    Server.HOST_PORT = port
+    Server.LOG_LEVEL = logging.WARNING
+    Server.RECORD_DIR = None
+    Server.SPEED_CONTROL_EN = True
+    Server.SPEED_CONTROL_RATE_HZ = rate_hz
+    engine = Server.Server_engine(server_state, slot_from_car, slot_2_car,
+        event_exit)
+    engine.run()
+    stats_out.put(engine.speed_scheduler.stats())
+
+def _run_car(port:int, rate_hz:float, wire_format:str, seed:int, stop):
+    """ Car process """
+    car = CarSimulator.Simulated_car("127.0.0.1", port, rate_hz, wire_format,
+        seed=seed)
+    car.run(stop=stop.is_set)
+
+def _track(slot_from_car, slot_2_car, car_ids:list, step_sec:float) -> list:
+    """
+    Sends every setpoint of SETPOINTS_MMS to all the cars for step_sec and
+    collects the error of the speed received (after SETTLE_SEC)
+
+    :return: absolute errors in mm/s
+    """
+    errors = []
+    reuse = None
+    for setpoint in SETPOINTS_MMS:
+        slot_2_car.write(CommunMessages.encode_out_message(2, 0, 0, setpoint,
+            0), Server.CAR_ID_ALL)
+        time_settled = time.monotonic() + SETTLE_SEC
+        end = time.monotonic() + step_sec
+        while time.monotonic() < end:
+            for car_id in car_ids:
+                frame = slot_from_car.read_new(car_id)
+                if frame is None or time.monotonic() < time_settled:
+                    continue
+                reuse = CommunMessages.decode_frame(frame, reuse)
+                if reuse is not None and not reuse.linspeed_err:
+                    errors.append(abs(reuse.linspeed_mms - setpoint))
+            time.sleep(POLL_SLEEP_SEC)
+    return errors
+
+def main(args):
+    port = args.port or random.randint(40000, 50000)
+    wire_format = CommunMessages.WIRE_FORMAT_BINARY if args.binary \
+        else CommunMessages.WIRE_FORMAT_ASCII
+    slot_from_car = SharedSlot.Latest_value_slot(Server.NB_SLOTS)
+    slot_2_car = SharedSlot.Latest_value_slot(Server.NB_SLOTS)
+    event_exit = Event()
+    server_state = Value("i", Server.State.SOCK_CLOSED)
+    stats_out = Queue()
+    stop = Event()
+    server = Process(target=_run_server, args=(port, args.rate_hz,
+        server_state, slot_from_car, slot_2_car, event_exit, stats_out))
+    server.start()
+    while server_state.value != Server.State.SOCK_LISTENING:
+        time.sleep(0.01)
+    cars = [Process(target=_run_car, args=(port, args.car_rate, wire_format,
+        index, stop)) for index in range(args.cars)]
+    for car in cars:
+        car.start()
+    # Wait for every car to be connected and streaming
+    car_ids = list(range(1, args.cars+1))
+    while any(slot_from_car.read_seq(car_id)[0] == 0 for car_id in car_ids):
+        time.sleep(0.01)
+    errors = _track(slot_from_car, slot_2_car, car_ids, args.step)
+    # Stop everything
+    stop.set()
+    for car in cars:
+        car.join()
+    event_exit.set()
+    loop_stats = stats_out.get()
+    server.join()
+    slot_from_car.unlink()
+    slot_2_car.unlink()
+    # Report
+    errors.sort()
+    report = {
+        "cars": args.cars,
+        "car_rate_hz": args.car_rate,
+        "control_rate_hz": args.rate_hz,
+        "wire_format": wire_format,
+        "setpoints_mms": SETPOINTS_MMS,
+        "tracking_error_mms": {
+            "mean": sum(errors) / len(errors) if errors else None,
+            "p99": percentile(errors, 99) if errors else None,
+            "max": errors[-1] if errors else None,
+        },
+        "control_loop": loop_stats,
+    }
+    print(json.dumps(report, indent=4))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=4)
+
+#==============================================================================
+# Main flow
+#==============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Robocar speed control test")
+    parser.add_argument("--cars", type=int, default=1)
+    parser.add_argument("--rate-hz", type=float,
+        default=Server.SPEED_CONTROL_RATE_HZ,
+        help="rate of the control loop (50 to 200)")
+    parser.add_argument("--car-rate", type=float, default=100,
+        help="frames per second sent by each car")
+    parser.add_argument("--step", type=float, default=3,
+        help="seconds of each setpoint")
+    parser.add_argument("--binary", action="store_true",
+        help="cars use the binary wire format")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--json", default=None,
+        help="also write the report to this file")
+    main(parser.parse_args())
@@ -0,0 +1,98 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: benchmarks/bench_startup.py
+# Description: cold-start time and memory of each mode of main.py (the modules
+# it imports), each one measured in a new interpreter
+# Usage: python benchmarks/bench_startup.py [nb_runs]
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+NB_RUNS = 5
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules imported by main.py in each mode
+_MODULES_HEADLESS = ["Latency", "Recorder", "Server", "SharedSlot",
+    "Supervisor", "Headless"]
+MODES = {
+    "python": [],
+    "headless": _MODULES_HEADLESS,
+    "headless+numpy": _MODULES_HEADLESS + ["numpy"],
+    "gui": _MODULES_HEADLESS[:-1] + ["GUI"],
+}
+
+# Run in the new interpreter: imports the modules and prints the import time,
+# the peak RSS and the heavy modules loaded
+_CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+import_sec = time.perf_counter() - start
+try:
+    import resource
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if sys.platform == "darwin":
+        rss_mb /= 1024
+except ImportError:
+    rss_mb = None
+print(json.dumps({{"import_sec": import_sec, "rss_mb": rss_mb,
+    "numpy": "numpy" in sys.modules,
+    "PySimpleGUI": "PySimpleGUI" in sys.modules}}))
+"""
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def measure(modules:list, nb_runs:int) -> dict:
+    """ Returns the best wall time (process start to end), the best import
+    time and the peak RSS of nb_runs interpreters importing modules """
+    best = None
+    for _ in range(nb_runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c",
+            _CHILD_CODE.format(modules=modules)], cwd=ROOT_DIR, check=True,
+            capture_output=True, text=True).stdout
+        wall_sec = time.perf_counter() - start
+        result = json.loads(output)
+        result["wall_sec"] = wall_sec
+        if best is None or wall_sec < best["wall_sec"]:
+            best = result
+    return best
+
+def main(nb_runs:int):
+    print("{:<16}{:>10}{:>12}{:>10}{:>8}{:>13}".format("mode", "wall ms",
+        "import ms", "RSS MB", "numpy", "PySimpleGUI"))
+    for mode, modules in MODES.items():
+        result = measure(modules, nb_runs)
+        print("{:<16}{:>10.1f}{:>12.1f}{:>10}{:>8}{:>13}".format(mode,
+            1000*result["wall_sec"], 1000*result["import_sec"],
+            "-" if result["rss_mb"] is None else
+                "{:.1f}".format(result["rss_mb"]),
+            str(result["numpy"]), str(result["PySimpleGUI"])))
+
+#==============================================================================
+# Main flow
+#==============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Robocar start-up "
+        "benchmark")
+    parser.add_argument("nb_runs", type=int, nargs="?", default=NB_RUNS,
+        help="new interpreters started per mode")
+    main(parser.parse_args().nb_runs)
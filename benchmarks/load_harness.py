@@ -0,0 +1,201 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: benchmarks/load_harness.py
+# Description: end-to-end load test on loopback: starts the server and N
+# simulated cars (CarSimulator.py), sends commands through the same slots as
+# the GUI and reports frames per second, command-to-echo latency percentiles
+# and server CPU usage
+# Usage: python benchmarks/load_harness.py --cars 20 --rate 100 --duration 10
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import argparse
+from multiprocessing import Event, Process, Queue, Value
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CarSimulator
+import CommunMessages
+import Server
+import SharedSlot
+from Stats import percentile
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+ECHO_TIMEOUT_SEC = 1.0      # Command considered lost after this time
+PROBE_GAP_SEC = 0.02        # Time between rounds of commands
+POLL_SLEEP_SEC = 0.0001
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _run_server(port:int, record:bool, stream_rate:float, cpu_out:Value,
+        server_state:Value, slot_from_car, slot_2_car, event_exit:Event):
+    """ Server process: run_server on loopback, reporting its CPU usage """
+    Server.HOST_IP = "127.0.0.1"
+    Server.HOST_PORT = port
+    Server.LOG_LEVEL = logging.WARNING
+    Server.STREAM_RATE_HZ = stream_rate
+    if not record:
+        Server.RECORD_DIR = None
+    wall_start = time.monotonic()
+    cpu_start = time.process_time()
+    Server.run_server(server_state, slot_from_car, slot_2_car, event_exit)
+    cpu_out.value = 100 * (time.process_time() - cpu_start) / \
+        (time.monotonic() - wall_start)
+
+def _run_car(port:int, rate_hz:float, wire_format:str, split:float,
+        merge:float, corrupt:float, seed:int, stop, results:Queue):
+    """ Car process """
+    car = CarSimulator.Simulated_car("127.0.0.1", port, rate_hz, wire_format,
+        split, merge, corrupt, seed)
+    car.run(stop=stop.is_set)
+    results.put((car.frames_sent, car.commands_received, car.frames_corrupted))
+
+def _measure(slot_from_car, slot_2_car, car_ids:list,
+        duration_sec:float) -> tuple:
+    """
+    Sends rounds of commands to every car (automatic mode with a unique
+    OY setpoint as tag) and waits for each car to echo it
+
+    :return: (latencies in ms, number of commands lost)
+    """
+    latencies = []
+    lost = 0
+    tag = 0
+    reuse = None
+    end = time.monotonic() + duration_sec
+    while time.monotonic() < end:
+        tag = tag % 32000 + 1
+        command = CommunMessages.encode_out_message(2, 0, 0, tag, 0)
+        sent = {}
+        for car_id in car_ids:
+            slot_2_car.write(command, car_id)
+            sent[car_id] = time.perf_counter()
+        while sent:
+            now = time.perf_counter()
+            for car_id in list(sent):
+                frame = slot_from_car.read_new(car_id)
+                if frame is not None:
+                    reuse = CommunMessages.decode_frame(frame, reuse)
+                    if reuse is not None and reuse.workmode == 2 and \
+                            tag in (reuse.autctrl_speedy_mms,
+                                    reuse.autctrl_speedx_mms):
+                        latencies.append(1000*(now - sent.pop(car_id)))
+                        continue
+                if now - sent[car_id] > ECHO_TIMEOUT_SEC:
+                    del sent[car_id]
+                    lost += 1
+            time.sleep(POLL_SLEEP_SEC)
+        time.sleep(PROBE_GAP_SEC)
+    return latencies, lost
+
+def main(args):
+    port = args.port or random.randint(40000, 50000)
+    wire_format = CommunMessages.WIRE_FORMAT_BINARY if args.binary \
+        else CommunMessages.WIRE_FORMAT_ASCII
+    slot_from_car = SharedSlot.Latest_value_slot(Server.NB_SLOTS)
+    slot_2_car = SharedSlot.Latest_value_slot(Server.NB_SLOTS)
+    event_exit = Event()
+    server_state = Value("i", Server.State.SOCK_CLOSED)
+    server_cpu = Value("d", 0.0)
+    stop = Event()
+    results = Queue()
+    server = Process(target=_run_server, args=(port, args.record,
+        args.stream_rate, server_cpu,
+        server_state, slot_from_car, slot_2_car, event_exit))
+    server.start()
+    while server_state.value != Server.State.SOCK_LISTENING:
+        time.sleep(0.01)
+    cars = [Process(target=_run_car, args=(port, args.rate, wire_format,
+        args.split, args.merge, args.corrupt, index, stop, results))
+        for index in range(args.cars)]
+    for car in cars:
+        car.start()
+    # Wait for every car to be connected and streaming
+    car_ids = list(range(1, args.cars+1))
+    while any(slot_from_car.read_seq(car_id)[0] == 0 for car_id in car_ids):
+        time.sleep(0.01)
+    seq_start = [slot_from_car.read_seq(car_id)[0] for car_id in car_ids]
+    time_start = time.monotonic()
+    latencies, lost = _measure(slot_from_car, slot_2_car, car_ids,
+        args.duration)
+    elapsed = time.monotonic() - time_start
+    seq_end = [slot_from_car.read_seq(car_id)[0] for car_id in car_ids]
+    # Stop everything
+    stop.set()
+    car_results = [results.get() for car in cars]
+    for car in cars:
+        car.join()
+    event_exit.set()
+    server.join()
+    slot_from_car.unlink()
+    slot_2_car.unlink()
+    # Report (the seqlock sequence number grows by 2 per frame forwarded)
+    fps = [(end - start) / 2 / elapsed for start, end in zip(seq_start,
+        seq_end)]
+    latencies.sort()
+    report = {
+        "cars": args.cars,
+        "rate_hz": args.rate,
+        "stream_rate_hz": args.stream_rate,
+        "wire_format": wire_format,
+        "duration_sec": elapsed,
+        "frames_sent": sum(result[0] for result in car_results),
+        "frames_corrupted": sum(result[2] for result in car_results),
+        "fps_total": sum(fps),
+        "fps_per_car_min": min(fps),
+        "fps_per_car_max": max(fps),
+        "commands_echoed": len(latencies),
+        "commands_lost": lost,
+        "echo_latency_ms": {
+            "p50": percentile(latencies, 50) if latencies else None,
+            "p90": percentile(latencies, 90) if latencies else None,
+            "p99": percentile(latencies, 99) if latencies else None,
+            "max": latencies[-1] if latencies else None,
+        },
+        "server_cpu_percent": server_cpu.value,
+    }
+    print(json.dumps(report, indent=4))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=4)
+
+#==============================================================================
+# Main flow
+#==============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Robocar load harness")
+    parser.add_argument("--cars", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=100,
+        help="frames per second sent by each car (10 to 10000)")
+    parser.add_argument("--duration", type=float, default=10,
+        help="seconds of measurement")
+    parser.add_argument("--binary", action="store_true",
+        help="cars use the binary wire format")
+    parser.add_argument("--split", type=float, default=0.0)
+    parser.add_argument("--merge", type=float, default=0.0)
+    parser.add_argument("--corrupt", type=float, default=0.0)
+    parser.add_argument("--record", action="store_true",
+        help="keep the server recorder enabled")
+    parser.add_argument("--stream-rate", type=float,
+        default=Server.STREAM_RATE_HZ,
+        help="commands streamed per second to each car (0: sent once, "
+             "at once)")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--json", default=None,
+        help="also write the report to this file")
+    main(parser.parse_args())
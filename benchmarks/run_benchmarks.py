@@ -0,0 +1,219 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: benchmarks/run_benchmarks.py
+# Description: reproducible benchmark suite of the protocol code
+# (CommunMessages) and of the handoff between processes. Results are written
+# as JSON and can be compared with a previous run to spot regressions
+# Usage: python benchmarks/run_benchmarks.py [--output FILE] [--compare FILE]
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import argparse
+import gc
+import json
+from multiprocessing import Queue
+import os
+import platform
+import re
+import sys
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CommunMessages
+import Filters
+import MessageCodec
+import SharedSlot
+import TelemetryBuffer
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+DEFAULT_OUTPUT = "bench_results.json"
+TARGET_RUN_SEC = 0.2        # Each repeat lasts about this long
+NB_REPEATS = 5              # Best of NB_REPEATS is kept
+NB_ALLOC_OPS = 1000         # Operations traced to count allocations
+REGRESSION_THRESHOLD = 0.2  # ns/op increase flagged by --compare
+
+IN_VALUES = [1, 50, -20, 300, 0, 250, 120, 118, 1500, 1600]
+FRAME_IN = CommunMessages.encode_in_message(IN_VALUES)
+FRAME_IN_STR = FRAME_IN.decode()
+FRAME_IN_BIN = CommunMessages.encode_in_message(IN_VALUES,
+    CommunMessages.WIRE_FORMAT_BINARY)
+FIELDS_IN = [FRAME_IN_STR[i:i+CommunMessages.NB_CHAR_PER_MESS]
+    for i in range(0, len(FRAME_IN_STR), CommunMessages.NB_CHAR_PER_MESS)]
+FIELD_RE = re.compile(MessageCodec.ascii_field_pattern(
+    CommunMessages.NB_CHAR_PER_MESS))
+FRAME_OUT = CommunMessages.encode_out_message(1, 50, -20, 0, 0)
+BATCH_SIZE = 1000
+BATCH_IN = FRAME_IN*BATCH_SIZE
+PLOT_SAMPLES = 1 << 17      # Full telemetry history (RING_CAPACITY)
+PLOT_POINTS = 1040          # GUI.PLOT_MAX_POINTS
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _cases() -> dict:
+    """ Returns {name: (function, operations per call)} """
+    message_out = CommunMessages.Message_struct_out(1, 50, -20, 0, 0)
+    reused = CommunMessages.decode_in_message(FRAME_IN_STR)
+    frame_bin = CommunMessages.Out_frame_bin()
+    reassembler = CommunMessages.new_reassembler(
+        CommunMessages.WIRE_FORMAT_ASCII)
+    queue = Queue(1)
+    slot = SharedSlot.Latest_value_slot()
+    def queue_handoff():
+        queue.put(FRAME_IN)
+        queue.get()
+    def slot_handoff():
+        slot.write(FRAME_IN)
+        slot.read_new()
+    telemetry_filters = Filters.new_telemetry_filters()
+    decoded_batch = CommunMessages.decode_in_messages(BATCH_IN)
+    ring = TelemetryBuffer.Telemetry_ring(("a", "b", "c", "d", "e"))
+    plot_x = np.arange(PLOT_SAMPLES, dtype=np.int64)
+    plot_y = np.sin(plot_x / 1000).astype(np.float32)
+    return {
+        "decode_in_message": (
+            lambda: CommunMessages.decode_in_message(FRAME_IN_STR), 1),
+        "decode_in_message_reuse": (
+            lambda: CommunMessages.decode_in_message(FRAME_IN_STR, reused), 1),
+        "decode_in_message_bin": (
+            lambda: CommunMessages.decode_in_message_bin(FRAME_IN_BIN), 1),
+        "decode_in_messages_batch": (
+            lambda: CommunMessages.decode_in_messages(BATCH_IN), BATCH_SIZE),
+        "Message_struct_in": (
+            lambda: CommunMessages.Message_struct_in(*FIELDS_IN), 1),
+        "get_output_format": (message_out.get_output_format, 1),
+        "get_output_format_bin": (
+            lambda: message_out.get_output_format_bin(1), 1),
+        "encode_out_message": (
+            lambda: CommunMessages.encode_out_message(1, 50, -20, 0, 0), 1),
+        "out_frame_bin_encode": (
+            lambda: frame_bin.encode(FRAME_OUT, 1), 1),
+        "ascii_field_match": (lambda: FIELD_RE.fullmatch(FIELDS_IN[2]), 1),
+        "reassembler_feed": (lambda: reassembler.feed(FRAME_IN), 1),
+        # Same process: cost of the calls only, not the latency between
+        # processes (see bench_ipc_handoff.py)
+        "queue_handoff": (queue_handoff, 1),
+        "slot_handoff": (slot_handoff, 1),
+        "filters_update": (lambda: telemetry_filters.update(reused), 1),
+        "filters_apply_batch": (
+            lambda: telemetry_filters.apply(decoded_batch), BATCH_SIZE),
+        "ring_append": (lambda: ring.append(1, IN_VALUES[5:]), 1),
+        "downsample_minmax": (lambda: TelemetryBuffer.downsample_minmax(
+            plot_x, plot_y, PLOT_POINTS), 1),
+    }, slot
+
+def _time_case(function, nb_ops:int) -> float:
+    """ Returns the best ns per operation """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(1, int(number * TARGET_RUN_SEC / 0.2))
+    best = min(timer.repeat(repeat=NB_REPEATS, number=number))
+    return 1e9 * best / (number * nb_ops)
+
+def _alloc_case(function, nb_ops:int) -> tuple:
+    """
+    Returns (memory blocks still allocated per operation when the results are
+    kept, peak traced bytes per operation)
+    """
+    results = [None]*NB_ALLOC_OPS
+    gc.collect()
+    tracemalloc.start()
+    blocks_start = sys.getallocatedblocks()
+    for index in range(NB_ALLOC_OPS):
+        results[index] = function()
+    blocks = sys.getallocatedblocks() - blocks_start
+    tracemalloc.stop()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return blocks / (NB_ALLOC_OPS*nb_ops), peak / nb_ops
+
+def run() -> dict:
+    cases, slot = _cases()
+    results = {}
+    for name, (function, nb_ops) in cases.items():
+        ns_per_op = _time_case(function, nb_ops)
+        blocks_per_op, peak_bytes_per_op = _alloc_case(function, nb_ops)
+        results[name] = {
+            "ns_per_op": ns_per_op,
+            "ops_per_sec": 1e9 / ns_per_op,
+            "alloc_blocks_per_op": blocks_per_op,
+            "peak_bytes_per_op": peak_bytes_per_op,
+        }
+    slot.unlink()
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "numpy": np.__version__,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": results,
+    }
+
+def compare(results:dict, baseline:dict) -> list:
+    """ Returns the names of the cases slower than in baseline by more than
+    REGRESSION_THRESHOLD """
+    regressions = []
+    for name, result in results["results"].items():
+        previous = baseline["results"].get(name)
+        if previous and result["ns_per_op"] > \
+                previous["ns_per_op"] * (1 + REGRESSION_THRESHOLD):
+            regressions.append(name)
+    return regressions
+
+def main(args) -> int:
+    results = run()
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print("{:<28}{:>12}{:>14}{:>14}{:>14}{:>10}".format("case", "ns/op",
+        "ops/s", "blocks/op", "peak B/op", "vs base"))
+    for name, result in results["results"].items():
+        delta = ""
+        if baseline and name in baseline["results"]:
+            delta = "{:+.0%}".format(result["ns_per_op"] /
+                baseline["results"][name]["ns_per_op"] - 1)
+        print("{:<28}{:>12.1f}{:>14.0f}{:>14.2f}{:>14.1f}{:>10}".format(name,
+            result["ns_per_op"], result["ops_per_sec"],
+            result["alloc_blocks_per_op"], result["peak_bytes_per_op"],
+            delta))
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=4)
+    print("Results written to " + args.output)
+    if baseline:
+        regressions = compare(results, baseline)
+        if regressions:
+            print("Regressions (> {:.0%}): {}".format(REGRESSION_THRESHOLD,
+                ", ".join(regressions)))
+            return 1
+    return 0
+
+#==============================================================================
+# Main flow
+#==============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Robocar benchmark suite")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT,
+        help="JSON file where results are written")
+    parser.add_argument("--compare", default=None,
+        help="JSON file of a previous run; exit code 1 on regressions")
+    sys.exit(main(parser.parse_args()))
@@ -3,68 +3,109 @@
 # Application: Remote_Control
 # File: main.py
 # Version: 1.0
-# Description: entry point for Remote_Control application: initializes queues 
-# and processes (server and gui)
+# Description: entry point for Remote_Control application: initializes shared
+# data and processes (server and gui) and supervises them
 #==============================================================================
 
 #==============================================================================
 # Import
 #==============================================================================
 
-from multiprocessing import Process, Queue, Value
-import time as time
+import argparse
+from multiprocessing import Event, Value
 
-import GUI as myGUI
+import Latency
+import LinkMonitor
+import Recorder
 import Server as myServer
+import SharedSlot
+import Supervisor
 
 #==============================================================================
 # Global data
 #==============================================================================
 
+LATENCY_DUMP_FILE = "latency_stats.json"
 
-
+# GUI (PySimpleGUI / Tk) is only imported when the window is used, see
+# --headless
 
 #==============================================================================
 # Main flow
 #==============================================================================
 
 if __name__ == '__main__':
+
+    # Command line
+    parser = argparse.ArgumentParser(description="Robocar control")
+    parser.add_argument("--replay", metavar="PATH",
+        help="replay a recording (file, directory or file name prefix) "
+             "instead of starting the server")
+    parser.add_argument("--speed", type=float, default=1.0,
+        help="replay speed (1.0: real time, 0: as fast as possible)")
+    parser.add_argument("--headless", action="store_true",
+        help="no window: print the telemetry of every car periodically "
+             "(GUI is not imported)")
+    parser.add_argument("--print-period", type=float, default=1.0,
+        help="headless: seconds between telemetry summaries (0: none)")
+    parser.add_argument("--log", metavar="FILE",
+        help="headless: append every frame received to this CSV file")
+    parser.add_argument("--latency-dump", metavar="FILE", 
+        default=LATENCY_DUMP_FILE,
+        help="file where the latency statistics are written on exit "
+             "(empty to disable)")
+    args = parser.parse_args()
     
     # Shared data
     # Shared data: Misc
     server_state = Value("i", myServer.State.SOCK_CLOSED)
-    # Shared data: Queues
-    queue_2_car = Queue(1)    # To be improved: Pipe more convenient than Queue
-    queue_from_car = Queue(1) # To be improved: Pipe more convenient than Queue
-    queue_exit = Queue(1)   # This queue must never be consumed,
-                            # only push data there and exit if full
+    # Shared data: latest-value slots (only most recent data is valid)
+    # (one slot per car, see Server.NB_SLOTS)
+    slot_2_car = SharedSlot.Latest_value_slot(myServer.NB_SLOTS)
+    slot_from_car = SharedSlot.Latest_value_slot(myServer.NB_SLOTS)
+    # Shared data: link statistics of each car (see LinkMonitor.py)
+    slot_link_stats = SharedSlot.Latest_value_slot(myServer.NB_SLOTS, 
+        capacity=LinkMonitor.LINK_STATS_SIZE)
+    # Shared data: latency of each stage from the socket to the screen
+    latency_stats = Latency.Latency_stats()
+    # Shared data: exit event, set by any process to close the application
+    event_exit = Event()
     
     # Init processes
-    proc_GUI = Process(target=myGUI.gui_main, 
-        args=(queue_2_car, queue_from_car, queue_exit))
-    proc_Server = Process(target=myServer.run_server, 
-        args=(server_state, queue_from_car, queue_2_car, queue_exit))
+    supervisor = Supervisor.Process_supervisor(event_exit,
+        before_restart=lambda child: (slot_from_car.recover(), 
+            slot_link_stats.recover()))
+    if args.headless:
+        import Headless
+        supervisor.add("Telemetry", Headless.run_telemetry_log, 
+            (slot_from_car, event_exit, args.print_period, args.log), 
+            essential=True)
+    else:
+        import GUI as myGUI
+        supervisor.add("GUI", myGUI.gui_main, 
+            (slot_2_car, slot_from_car, event_exit, latency_stats, 
+            slot_link_stats), essential=True)
+    if args.replay is None:
+        # Restarted if it crashes, the GUI goes on
+        supervisor.add("Server", myServer.run_server, 
+            (server_state, slot_from_car, slot_2_car, event_exit, 
+            latency_stats, slot_link_stats), restart=True, server_state=server_state)
+    else:
+        supervisor.add("Replay", Recorder.run_replay, 
+            (args.replay, slot_from_car, event_exit, args.speed))
+
+    # Start and monitor processes until the application is closed
+    supervisor.run()
+    print("Exiting from main...")
 
-    # Start processes
-    proc_GUI.start()
-    proc_Server.start()
+    # Write the latency statistics
+    if args.latency_dump:
+        latency_stats.dump(args.latency_dump)
+        print(latency_stats.format_table())
+        print("Latency statistics written to " + args.latency_dump)
 
-    # Monitor processes
-    while(1):
-        # If message in exit queue, close main process
-        if queue_exit.full() == True:
-            print("Exiting from main...")
-            break    # end app
-        # Print server status
-        # with server_state.get_lock():
-        #     print("Server status: " + str(server_state.value))
-        # Send debug (useless) information to car
-        # if (queue_2_car.full() == False):    
-        #     queue_2_car.put("0000010001200023000340004")
-        # Print outgoing data 
-        # if (queue_2_car.empty() == False):
-        #     print(queue_2_car.get())
-        # Print incoming data
-        # if (queue_from_car.full() == False):
-        #     print(queue_2_car.get())
-        time.sleep(0.1)
\ No newline at end of file
+    # Release shared memory
+    slot_2_car.unlink()
+    slot_from_car.unlink()
+    slot_link_stats.unlink()
+    latency_stats.unlink()
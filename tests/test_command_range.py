@@ -0,0 +1,132 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: tests/test_command_range.py
+# Description: commands at the limits of the outgoing fields reach an ASCII
+# car and a binary car unchanged, and commands out of the range of a wire
+# format never reach the wire (the server and the other car go on)
+# Usage: python -m pytest tests
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+from multiprocessing import Event, Value
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CarSimulator
+import CommunMessages
+import Server
+import SharedSlot
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+CAR_RATE_HZ = 100
+WAIT_SEC = 5.0
+SETTLE_SEC = 0.3        # Time given to a dropped command to (not) arrive
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def _wait(condition) -> bool:
+    end = time.monotonic() + WAIT_SEC
+    while time.monotonic() < end:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def _automatic(speed:int) -> list:
+    return [2, 0, 0, speed, 0]
+
+@pytest.fixture
+def fleet(monkeypatch):
+    """ Server (thread) with an ASCII car and a binary car connected """
+    monkeypatch.setattr(Server, "HOST_IP", "127.0.0.1")
+    monkeypatch.setattr(Server, "HOST_PORT", _free_port())
+    monkeypatch.setattr(Server, "RECORD_DIR", None)
+    slot_from_car = SharedSlot.Latest_value_slot(Server.NB_SLOTS)
+    slot_2_car = SharedSlot.Latest_value_slot(Server.NB_SLOTS)
+    server_state = Value("i", Server.State.SOCK_CLOSED)
+    event_exit = Event()
+    engine = Server.Server_engine(server_state, slot_from_car, slot_2_car,
+        event_exit)
+    server = threading.Thread(target=engine.run)
+    server.start()
+    assert _wait(lambda: server_state.value == Server.State.SOCK_LISTENING)
+    stop = threading.Event()
+    cars = {}
+    threads = []
+    for wire_format in (CommunMessages.WIRE_FORMAT_ASCII,
+            CommunMessages.WIRE_FORMAT_BINARY):
+        car = CarSimulator.Simulated_car("127.0.0.1", Server.HOST_PORT,
+            CAR_RATE_HZ, wire_format, seed=0)
+        threads.append(threading.Thread(target=car.run,
+            kwargs={"stop": stop.is_set}))
+        threads[-1].start()
+        cars[wire_format] = car
+    assert _wait(lambda: all(slot_from_car.read_seq(car_id)[0]
+        for car_id in (1, 2)))
+    yield slot_2_car, cars, threads
+    stop.set()
+    for thread in threads:
+        thread.join()
+    event_exit.set()
+    server.join()
+    slot_from_car.unlink()
+    slot_2_car.unlink()
+
+def test_limits_reach_both_cars(fleet):
+    slot_2_car, cars, _ = fleet
+    for speed in (9999, -9999, 32767):
+        slot_2_car.write(CommunMessages.encode_out_message(*_automatic(
+            speed)), Server.CAR_ID_ALL)
+        for wire_format, car in cars.items():
+            assert _wait(lambda: car.command == _automatic(speed)), \
+                (wire_format, speed, car.command)
+
+def test_out_of_range_never_sent(fleet):
+    slot_2_car, cars, threads = fleet
+    with pytest.raises(ValueError):
+        CommunMessages.encode_out_message(*_automatic(-10000))
+    with pytest.raises(ValueError):
+        CommunMessages.encode_out_message(*_automatic(100000))
+    slot_2_car.write(CommunMessages.encode_out_message(*_automatic(-9999)),
+        Server.CAR_ID_ALL)
+    assert _wait(lambda: all(car.command == _automatic(-9999)
+        for car in cars.values()))
+    # Written without encode_out_message: 26 bytes, dropped by the server
+    slot_2_car.write(b"%05d" * 5 % tuple(_automatic(-10000)),
+        Server.CAR_ID_ALL)
+    time.sleep(SETTLE_SEC)
+    for car in cars.values():
+        assert car.command == _automatic(-9999)
+    # ASCII field, too big for the int16 field of the binary car
+    slot_2_car.write(CommunMessages.encode_out_message(*_automatic(40000)),
+        Server.CAR_ID_ALL)
+    ascii_car = cars[CommunMessages.WIRE_FORMAT_ASCII]
+    assert _wait(lambda: ascii_car.command == _automatic(40000))
+    assert cars[CommunMessages.WIRE_FORMAT_BINARY].command == \
+        _automatic(-9999)
+    # Both cars still connected and following the commands
+    slot_2_car.write(CommunMessages.encode_out_message(*_automatic(500)),
+        Server.CAR_ID_ALL)
+    assert _wait(lambda: all(car.command == _automatic(500)
+        for car in cars.values()))
+    assert all(thread.is_alive() for thread in threads)
@@ -0,0 +1,96 @@
+#==============================================================================
+# Project: Robocar
+# Application: Remote_Control
+# File: tests/test_error_masks.py
+# Description: the single-message decoders (Message_struct_in.err) and the
+# batch decoder (decode_in_messages) must flag the same fields, malformed
+# ASCII fields included
+# Usage: python -m pytest tests
+#==============================================================================
+
+#==============================================================================
+# Import
+#==============================================================================
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CommunMessages
+
+#==============================================================================
+# Global data
+#==============================================================================
+
+NB_FRAMES = 3000
+# Replacement chars: digits, minus sign and chars int() would accept or skip
+MUTATION_CHARS = b"0123456789- _+.x\x00\xa5"
+MALFORMED_FIELDS = (b" 0160", b"0160 ", b"_5000", b"-002 ", b"+0001",
+    b"1_000", b"--001", b"00-01")
+
+#==============================================================================
+# Function definitions
+#==============================================================================
+
+def _random_frame(rand:random.Random) -> bytearray:
+    """ Incoming ASCII frame with values in and out of the valid ranges """
+    return bytearray(CommunMessages.encode_in_message([
+        rand.randint(-1, 3), rand.randint(-120, 120), rand.randint(-120, 120),
+        rand.randint(-9999, 9999), rand.randint(-9999, 9999),
+        rand.randint(-9999, 9999), rand.randint(-999, 999),
+        rand.randint(-999, 999), rand.randint(0, 99999),
+        rand.randint(0, 99999)]))
+
+def _mutated_frames() -> list:
+    rand = random.Random(2024)
+    size = CommunMessages.NB_CHAR_PER_MESS
+    nb_fields = CommunMessages.MESSAGE_IN_SIZE // size
+    frames = []
+    for _ in range(NB_FRAMES):
+        frame = _random_frame(rand)
+        for _ in range(rand.randint(0, 3)):
+            if rand.random() < 0.5:
+                frame[rand.randrange(len(frame))] = \
+                    rand.choice(MUTATION_CHARS)
+            else:
+                pos = rand.randrange(nb_fields)*size
+                frame[pos:pos+size] = rand.choice(MALFORMED_FIELDS)
+        frames.append(bytes(frame))
+    return frames
+
+def _assert_same_masks(frames:list):
+    batch = CommunMessages.decode_in_messages(b''.join(frames))
+    names = [CommunMessages.incoming_name_dic[key]
+        for key in sorted(CommunMessages.incoming_pos_dic,
+            key=CommunMessages.incoming_pos_dic.get)]
+    for index, frame in enumerate(frames):
+        from_bytes = CommunMessages.decode_frame(frame)
+        from_str = CommunMessages.decode_in_message(frame.decode("latin-1"))
+        expected = int(batch[CommunMessages.MESSAGE_IN_ERR_COLUMN][index])
+        assert from_bytes.err == expected, frame
+        assert from_str.err == expected, frame
+        for pos, name in enumerate(names):
+            if not expected >> pos & 1:
+                assert getattr(from_bytes, name) == batch[name][index], frame
+
+def test_malformed_fields_flagged():
+    valid = CommunMessages.encode_in_message([1, 0, 0, 0, 0, 0, 0, 0, 0, 0])
+    size = CommunMessages.NB_CHAR_PER_MESS
+    for field in MALFORMED_FIELDS:
+        frame = field + valid[size:]
+        message = CommunMessages.decode_frame(frame)
+        assert message.workmode_err and message.err == 1, field
+        assert CommunMessages.decode_in_messages(frame)[
+            CommunMessages.MESSAGE_IN_ERR_COLUMN][0] == 1, field
+
+def test_same_masks_single_and_batch():
+    _assert_same_masks(_mutated_frames())
+
+def test_same_masks_set_fields():
+    size = CommunMessages.NB_CHAR_PER_MESS
+    for frame in _mutated_frames()[:500]:
+        fields = [frame[pos:pos+size]
+            for pos in range(0, CommunMessages.MESSAGE_IN_SIZE, size)]
+        assert CommunMessages.Message_struct_in(*fields).err == \
+            CommunMessages.decode_frame(frame).err, frame